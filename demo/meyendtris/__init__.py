@@ -1,14 +1,39 @@
 import os
-import pathlib
-from direct.showbase.ShowBase import ShowBase
 
 
-__BASE__ = ShowBase()
 __PACKAGE_PATH__ = os.path.dirname(os.path.abspath(__file__))
 __ROOT_PATH__ = os.path.dirname(os.path.abspath(__PACKAGE_PATH__))
 __version__ = "0.2.0"
 
 
+def create_base():
+    """
+    The ShowBase of the application, created on first use (which opens the window and
+    initialises the graphics and audio engines). The launcher calls this once the engine
+    configuration is loaded; everything else gets it through meyendtris.__BASE__.
+    """
+    global __BASE__
+    try:
+        return __BASE__
+    except NameError:
+        pass
+    from direct.showbase import ShowBaseGlobal
+    if hasattr(ShowBaseGlobal, 'base'):
+        # created elsewhere (e.g. by a host application)
+        __BASE__ = ShowBaseGlobal.base
+    else:
+        from direct.showbase.ShowBase import ShowBase
+        __BASE__ = ShowBase()
+    return __BASE__
+
+
+def __getattr__(name):
+    # importing the package (or any submodule) must not open a window
+    if name == '__BASE__':
+        return create_base()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 def windows_path_check(path):
     if path.lstrip("C:"):
         path = path.replace("C:", "/c/").replace("\\", "/")
@@ -19,4 +44,4 @@ def path_join(path: str, parent=__ROOT_PATH__):
     full_path = os.path.abspath(os.path.join(parent, path.lstrip('/')))
     if os.path.exists(full_path):
         return windows_path_check(full_path)
-    raise FileNotFoundError("Check your enter path, or enter a parent to join (available: __PACKAGE_PATH__, __ROOT_PATH__(default))")
\ No newline at end of file
+    raise FileNotFoundError("Check your enter path, or enter a parent to join (available: __PACKAGE_PATH__, __ROOT_PATH__(default))")
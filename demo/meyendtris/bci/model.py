@@ -0,0 +1,111 @@
+# -*- coding:utf-8 -*-
+"""
+(Filter-bank) CSP + LDA model for passive BCI classification of two mental states.
+
+The signal processing follows the BCILAB approach used for Meyendtris so far:
+  1. causal FIR band-pass filter per frequency band (BCILAB 'FIRFilter' frequencies,
+     e.g. [6 8 14 16]: stop below 6 Hz, pass 8-14 Hz, stop above 16 Hz)
+  2. epoch of the last window seconds (BCILAB 'EpochExtraction' time window, e.g. [0 1])
+  3. log-variance of the epoch after spatial filtering with the CSP filters of each band
+  4. linear discriminant; the output is the probability of the second class
+
+CSPModel holds everything needed to apply a trained model and can be saved to and
+loaded from a single .npz file. It is trained by meyendtris.bci.train and applied
+online by meyendtris.bci.pipeline.
+"""
+import json
+
+import numpy as np
+import scipy.signal
+
+
+def design_bandpass(srate, frequencies, numtaps=None, phase='minimum'):
+    """
+    FIR band-pass filter with the given [stop, pass, pass, stop] edge frequencies in Hz.
+    A minimum-phase filter has far less delay than a linear-phase one (about a third
+    of its length rather than half), at the cost of some phase distortion.
+    """
+    nyquist = srate / 2.0
+    low_stop, low_pass, high_pass, high_stop = frequencies
+    if numtaps is None:
+        # Hamming window: transition width of about 3.3 / numtaps
+        transition = min(low_pass - low_stop, high_stop - high_pass)
+        numtaps = int(np.ceil(3.3 * srate / transition)) | 1
+    freqs = [0.0, low_stop, low_pass, high_pass, high_stop, nyquist]
+    if phase == 'minimum':
+        # the homomorphic method halves the magnitude response in dB, so the prototype gets the squared response
+        taps = scipy.signal.firwin2(2 * numtaps - 1, freqs, [0, 0, 1, 1, 0, 0], fs=srate)
+        return scipy.signal.minimum_phase(taps, method='homomorphic')
+    return scipy.signal.firwin2(numtaps, freqs, [0, 0, 1, 1, 0, 0], fs=srate)
+
+
+def log_variance(epochs, filters):
+    """
+    CSP features of a stack of epochs (n_epochs x samples x channels), for spatial
+    filters of shape (n_filters x channels); returns an (n_epochs x n_filters) array.
+    """
+    projected = epochs @ filters.T
+    return np.log(projected.var(axis=-2))
+
+
+class CSPModel(object):
+    """A trained (filter-bank) CSP + LDA classifier."""
+
+    def __init__(self,
+                 srate,                     # sampling rate of the EEG in Hz
+                 bands,                     # list of [stop, pass, pass, stop] frequencies, one per filter bank band
+                 window,                    # [start, end] of the epoch in seconds; online, end is now
+                 filters,                   # list of CSP filter matrices (n_filters x channels), one per band
+                 weights,                   # LDA weights, one per feature (n_filters per band, concatenated)
+                 bias,                      # LDA bias
+                 classes=('relax', 'chaos'),# the two classes; the model outputs the probability of the second
+                 channels=(),               # channel labels the filters refer to (informative)
+                 fir=None):                 # FIR coefficients per band; designed from bands if not given
+        self.srate = float(srate)
+        self.bands = [list(map(float, band)) for band in bands]
+        self.window = list(map(float, window))
+        self.filters = [np.asarray(f, dtype=float) for f in filters]
+        self.weights = np.asarray(weights, dtype=float)
+        self.bias = float(bias)
+        self.classes = list(classes)
+        self.channels = list(channels)
+        if fir is None:
+            fir = [design_bandpass(self.srate, band) for band in self.bands]
+        self.fir = [np.asarray(taps, dtype=float) for taps in fir]
+
+    @property
+    def epoch_samples(self):
+        """Number of samples per epoch."""
+        return int(round((self.window[1] - self.window[0]) * self.srate))
+
+    def features(self, epochs):
+        """
+        Features of band-pass filtered epochs, given as one (n_epochs x samples x channels)
+        array per band; returns an (n_epochs x n_features) array.
+        """
+        return np.concatenate([log_variance(e, f) for e, f in zip(epochs, self.filters)], axis=-1)
+
+    def probability(self, features):
+        """Probability of the second class for each row of features."""
+        return 1.0 / (1.0 + np.exp(-(features @ self.weights + self.bias)))
+
+    def save(self, path):
+        """Save the model to an .npz file."""
+        meta = dict(srate=self.srate, bands=self.bands, window=self.window, bias=self.bias,
+                    classes=self.classes, channels=self.channels)
+        arrays = {'weights': self.weights}
+        for k, (filters, taps) in enumerate(zip(self.filters, self.fir)):
+            arrays['filters%d' % k] = filters
+            arrays['fir%d' % k] = taps
+        np.savez(path, meta=json.dumps(meta), **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """Load a model saved with save()."""
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            bands = len(meta['bands'])
+            return cls(meta['srate'], meta['bands'], meta['window'],
+                       [data['filters%d' % k] for k in range(bands)],
+                       data['weights'], meta['bias'], meta['classes'], meta['channels'],
+                       [data['fir%d' % k] for k in range(bands)])
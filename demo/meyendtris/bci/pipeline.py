@@ -0,0 +1,143 @@
+# -*- coding:utf-8 -*-
+"""
+Online application of a CSPModel to a streaming EEG inlet.
+
+OnlinePipeline pulls EEG from an LSL inlet in chunks (into a preallocated
+buffer), filters them with the model's FIR filters, keeping the filter states
+between chunks, and writes the filtered samples into one ring buffer per band
+that holds exactly one epoch. At the configured update rate the features of
+the latest epoch are computed and the classifier output is written straight
+into the target, by default as target.bci = 1 + P(second class), i.e. in the
+range [1, 2] expected by Meyendtris. Since the variance does not depend on the
+order of the samples, the ring buffers are used in place without unrolling.
+
+The pipeline can be stepped manually through process() and classify(), or run
+in a background thread with start() / stop(); errors in the thread are reported
+and counted, and the thread keeps retrying until it is stopped.
+"""
+import threading
+import time
+import traceback
+
+import numpy as np
+import scipy.signal
+
+
+class OnlinePipeline(object):
+    """Streaming band-pass / epoch / CSP / LDA pipeline writing its output into a target object."""
+
+    def __init__(self,
+                 model,                 # the CSPModel to apply
+                 inlet=None,            # pylsl inlet of the EEG stream (only needed for update() / start())
+                 target=None,           # object to write the output to, e.g. the running game module
+                 attribute='bci',       # name of the attribute of target to write to
+                 update_rate=20.0,      # classifier outputs per second
+                 channels=None,         # indices of the inlet channels the model was trained on; all if None
+                 capacity=None):        # number of samples the inlet buffer can hold per pull; one second if None
+        self.model = model
+        self.inlet = inlet
+        self.target = target
+        self.attribute = attribute
+        self.update_rate = update_rate
+        self.channels = channels
+        self.value = None                   # last classifier output
+        self.updates = 0                    # number of classifier outputs so far
+        self.latency = 0.0                  # processing time of the last update() in seconds
+        self.errors = 0                     # number of failed updates in the background thread
+        self.error = None                   # exception of the last failed update (None once an update succeeds)
+
+        nchannels = model.filters[0].shape[1]
+        samples = model.epoch_samples
+        self._rings = [np.zeros((samples, nchannels)) for _ in model.fir]
+        self._states = [np.zeros((len(taps) - 1, nchannels)) for taps in model.fir]
+        self._pos = 0                       # write position in the ring buffers
+        self._filled = 0                    # number of samples in the ring buffers
+
+        if inlet is not None:
+            capacity = capacity or int(model.srate)
+            self._buffer = np.zeros((capacity, inlet.channel_count), dtype=np.dtype(inlet.value_type))
+        self._thread = None
+        self._running = False
+
+    @property
+    def ready(self):
+        """Whether a full epoch has been received."""
+        return self._filled == len(self._rings[0])
+
+    def process(self, chunk):
+        """Filter a chunk of samples (samples x channels) and add it to the epoch buffers."""
+        chunk = np.asarray(chunk, dtype=float)
+        if self.channels is not None:
+            chunk = chunk[:, self.channels]
+        n = len(chunk)
+        if not n:
+            return
+        length = len(self._rings[0])
+        for k, taps in enumerate(self.model.fir):
+            filtered, self._states[k] = scipy.signal.lfilter(taps, 1.0, chunk, axis=0, zi=self._states[k])
+            ring = self._rings[k]
+            if n >= length:
+                ring[:] = filtered[-length:]
+            else:
+                first = min(n, length - self._pos)
+                ring[self._pos:self._pos + first] = filtered[:first]
+                ring[:n - first] = filtered[first:]
+        self._pos = (self._pos + n) % length
+        self._filled = min(self._filled + n, length)
+
+    def classify(self):
+        """Classify the latest epoch, write the output to the target, and return it (None if not ready)."""
+        if not self.ready:
+            return None
+        features = self.model.features([ring[np.newaxis] for ring in self._rings])
+        self.value = 1.0 + float(self.model.probability(features)[0])
+        self.updates += 1
+        if self.target is not None:
+            setattr(self.target, self.attribute, self.value)
+        return self.value
+
+    def update(self):
+        """Pull all available samples from the inlet, process them, and classify the latest epoch."""
+        started = time.perf_counter()
+        while True:
+            _, timestamps = self.inlet.pull_chunk(timeout=0.0, max_samples=len(self._buffer), dest_obj=self._buffer)
+            self.process(self._buffer[:len(timestamps)])
+            if len(timestamps) < len(self._buffer):
+                break
+        value = self.classify()
+        self.latency = time.perf_counter() - started
+        return value
+
+    def start(self):
+        """Run update() at the update rate in a background thread."""
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="OnlinePipeline", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        interval = 1.0 / self.update_rate
+        due = time.perf_counter()
+        while self._running:
+            try:
+                self.update()
+                self.error = None
+            except Exception as e:
+                # e.g. a lost stream: reported once, then retried at the update rate
+                if self.error is None:
+                    print("Exception in the BCI pipeline (retrying):")
+                    traceback.print_exc()
+                self.error = e
+                self.errors += 1
+            due += interval
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                due = time.perf_counter()
@@ -0,0 +1,222 @@
+# -*- coding:utf-8 -*-
+"""
+Offline training of (filter-bank) CSP + LDA models from calibration recordings.
+
+Replaces scripts/trainModel.m: loads an XDF recording (EEG stream plus the
+SNAP-Markers stream written during calibration), extracts epochs following the
+target markers, estimates the model's performance with chronological
+cross-validation with margins (BCILAB's {'chron', folds, margin} scheme), and
+trains the final model on all epochs. Usage:
+
+    python -m meyendtris.bci.train calibration.xdf model.npz --markers relax chaos
+
+The CSP features only depend on the covariance matrix of each epoch, so these
+are computed once for all epochs (vectorised), after which every fold only works
+with small channels x channels matrices; folds run in parallel in a process pool.
+Reading XDF files requires the optional pyxdf package (the 'train' extra:
+pip install -e .[train]).
+"""
+import argparse
+import concurrent.futures
+
+import numpy as np
+import scipy.linalg
+import scipy.signal
+
+from meyendtris.bci.model import CSPModel, design_bandpass
+
+
+def load_xdf(path, marker_stream='SNAP-Markers'):
+    """
+    Load the EEG and marker streams of an XDF recording; returns a dict with data
+    (samples x channels), timestamps, srate, channels (labels) and markers (list of
+    (timestamp, string) pairs).
+    """
+    try:
+        import pyxdf
+    except ImportError:
+        raise ImportError("Reading XDF recordings requires pyxdf; install the 'train' extra (pip install -e .[train]).")
+    streams, _ = pyxdf.load_xdf(path)
+    eeg = next((s for s in streams if s['info']['type'][0] == 'EEG'), None)
+    markers = next((s for s in streams if s['info']['name'][0] == marker_stream), None)
+    if eeg is None or markers is None:
+        raise ValueError("%s does not contain both an EEG and a %s stream." % (path, marker_stream))
+    try:
+        channels = [c['label'][0] for c in eeg['info']['desc'][0]['channels'][0]['channel']]
+    except (KeyError, IndexError, TypeError):
+        channels = []
+    return dict(
+        data = np.asarray(eeg['time_series'], dtype=float),
+        timestamps = np.asarray(eeg['time_stamps']),
+        srate = float(eeg['info']['nominal_srate'][0]),
+        channels = channels,
+        markers = [(t, m[0]) for t, m in zip(markers['time_stamps'], markers['time_series'])])
+
+
+def extract_epochs(data, timestamps, markers, targets, srate, bands, window=(0, 1), epochs_per_marker=1, fir=None):
+    """
+    Band-pass filter continuous data and cut epochs following the target markers.
+    Returns (epochs, labels): one (n_epochs x samples x channels) array per band,
+    in chronological order, and the index of each epoch's marker in targets.
+    With epochs_per_marker > 1, consecutive epochs are cut after each marker
+    (e.g. for markers that start a longer phase).
+    """
+    if fir is None:
+        fir = [design_bandpass(srate, band) for band in bands]
+    samples = int(round((window[1] - window[0]) * srate))
+    onsets, labels = [], []
+    for t, marker in sorted(markers, key=lambda m: m[0]):
+        if marker in targets:
+            for k in range(epochs_per_marker):
+                onsets.append(t + window[0] + k * (window[1] - window[0]))
+                labels.append(targets.index(marker))
+    first = np.searchsorted(timestamps, onsets)
+    keep = first + samples <= len(timestamps)
+    first, labels = first[keep], np.asarray(labels)[keep]
+    index = first[:, np.newaxis] + np.arange(samples)
+    epochs = [scipy.signal.lfilter(taps, 1.0, data, axis=0)[index] for taps in fir]
+    return epochs, labels
+
+
+def epoch_covariances(epochs):
+    """Covariance matrix (without normalisation by n-1) of each epoch: (n_epochs x channels x channels)."""
+    centred = epochs - epochs.mean(axis=1, keepdims=True)
+    return np.einsum('nsc,nsd->ncd', centred, centred) / epochs.shape[1]
+
+
+def fit_csp(covariances, labels, pairs=3):
+    """CSP filters (2 * pairs x channels) from per-epoch covariances of two classes."""
+    class0 = covariances[labels == 0].mean(axis=0)
+    class1 = covariances[labels == 1].mean(axis=0)
+    _, vectors = scipy.linalg.eigh(class0, class0 + class1)
+    return np.concatenate([vectors[:, :pairs], vectors[:, -pairs:]], axis=1).T
+
+
+def csp_features(covariances, filters):
+    """Log-variance features from per-epoch covariances: log(diag(W C W'))."""
+    return np.log(np.einsum('fc,ncd,fd->nf', filters, covariances, filters))
+
+
+def fit_lda(features, labels):
+    """
+    Shrinkage LDA (Ledoit-Wolf shrinkage towards a scaled identity); returns
+    (weights, bias) such that features @ weights + bias is the log-odds of class 1.
+    """
+    mean0 = features[labels == 0].mean(axis=0)
+    mean1 = features[labels == 1].mean(axis=0)
+    centred = np.concatenate([features[labels == 0] - mean0, features[labels == 1] - mean1])
+    n, d = centred.shape
+    covariance = centred.T @ centred / n
+    nu = np.trace(covariance) / d
+    target = nu * np.eye(d)
+    # Ledoit-Wolf estimate of the optimal shrinkage intensity
+    products = np.einsum('ni,nj->nij', centred, centred)
+    beta = ((products - covariance) ** 2).sum() / n ** 2
+    delta = ((covariance - target) ** 2).sum()
+    shrinkage = min(1.0, beta / delta) if delta > 0 else 1.0
+    covariance = (1 - shrinkage) * covariance + shrinkage * target
+    weights = np.linalg.solve(covariance, mean1 - mean0)
+    bias = -weights @ (mean0 + mean1) / 2.0
+    return weights, bias
+
+
+def fit(covariances, labels, pairs=3):
+    """Fit CSP per band and LDA on all bands' features; returns (filters per band, weights, bias)."""
+    filters = [fit_csp(c, labels, pairs) for c in covariances]
+    features = np.concatenate([csp_features(c, f) for c, f in zip(covariances, filters)], axis=1)
+    weights, bias = fit_lda(features, labels)
+    return filters, weights, bias
+
+
+def chronological_folds(n, folds=5, margin=5):
+    """
+    Chronological cross-validation: the epochs (in time order) are split into
+    contiguous test blocks; epochs within margin of a test block are left out of
+    the training set. Yields (train, test) index arrays.
+    """
+    bounds = np.linspace(0, n, folds + 1).astype(int)
+    for k in range(folds):
+        test = np.arange(bounds[k], bounds[k + 1])
+        train = np.r_[0:max(bounds[k] - margin, 0), min(bounds[k + 1] + margin, n):n]
+        yield train, test
+
+
+def evaluate_fold(covariances, labels, train, test, pairs=3):
+    """Train on the train epochs, test on the test epochs; returns (TP rate, TN rate, accuracy)."""
+    filters, weights, bias = fit([c[train] for c in covariances], labels[train], pairs)
+    features = np.concatenate([csp_features(c[test], f) for c, f in zip(covariances, filters)], axis=1)
+    predicted = (features @ weights + bias > 0).astype(int)
+    actual = labels[test]
+    tp = np.mean(predicted[actual == 1] == 1) if np.any(actual == 1) else np.nan
+    tn = np.mean(predicted[actual == 0] == 0) if np.any(actual == 0) else np.nan
+    return tp, tn, np.mean(predicted == actual)
+
+
+def cross_validate(covariances, labels, folds=5, margin=5, pairs=3, workers=None):
+    """Chronological cross-validation with margins, folds in parallel; returns an (folds x 3) array of TP, TN, accuracy."""
+    splits = list(chronological_folds(len(labels), folds, margin))
+    if workers == 1:
+        return np.array([evaluate_fold(covariances, labels, train, test, pairs) for train, test in splits])
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        jobs = [pool.submit(evaluate_fold, covariances, labels, train, test, pairs) for train, test in splits]
+        return np.array([job.result() for job in jobs])
+
+
+def train(recording, targets=('relax', 'chaos'), bands=((6, 8, 14, 16),), window=(0, 1),
+          epochs_per_marker=1, folds=5, margin=5, pairs=3, workers=None):
+    """
+    Train a CSPModel on a recording as returned by load_xdf(); returns (model, stats),
+    stats being the (folds x 3) array of cross-validated TP rate, TN rate and accuracy.
+    """
+    targets = list(targets)
+    srate = recording['srate']
+    fir = [design_bandpass(srate, band) for band in bands]
+    epochs, labels = extract_epochs(recording['data'], recording['timestamps'], recording['markers'],
+                                    targets, srate, bands, window, epochs_per_marker, fir)
+    covariances = [epoch_covariances(e) for e in epochs]
+    stats = cross_validate(covariances, labels, folds, margin, pairs, workers) if folds > 1 else np.empty((0, 3))
+    filters, weights, bias = fit(covariances, labels, pairs)
+    model = CSPModel(srate, bands, window, filters, weights, bias, targets, recording.get('channels', ()), fir)
+    return model, stats
+
+
+def print_stats(stats):
+    print('-' * 63)
+    for k, (tp, tn, accuracy) in enumerate(stats):
+        print('Fold %2d:   TP %0.3f   TN %0.3f   (Ratio %0.3f)   Accuracy %0.3f' % (k + 1, tp, tn, tp / tn, accuracy))
+    print('_' * 63)
+    tp, tn, accuracy = np.nanmean(stats, axis=0)
+    sd = np.nanstd(stats, axis=0)
+    print('Summary:   TP %0.3f   TN %0.3f   (Ratio %0.3f)   Accuracy %0.3f' % (tp, tn, tp / tn, accuracy))
+    print('           sd %0.3f   sd %0.3f   (   sd %0.3f)         sd %0.3f' % (sd[0], sd[1], np.nanstd(stats[:, 0] / stats[:, 1]), sd[2]))
+    print('-' * 63)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train a CSP + LDA model on an XDF calibration recording.")
+    parser.add_argument('recording', help="XDF file with an EEG and a SNAP-Markers stream")
+    parser.add_argument('model', help="file to save the model to (.npz)")
+    parser.add_argument('--markers', nargs=2, default=['relax', 'chaos'], help="the two target markers")
+    parser.add_argument('--bands', nargs='+', type=float, default=[6, 8, 14, 16],
+                        help="stop/pass/pass/stop frequencies in Hz; several groups of four for filter-bank CSP")
+    parser.add_argument('--window', nargs=2, type=float, default=[0, 1], help="epoch window in seconds relative to the markers")
+    parser.add_argument('--epochs-per-marker', type=int, default=1, help="number of consecutive epochs per marker")
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--margin', type=int, default=5, help="epochs left out between training and test data")
+    parser.add_argument('--pairs', type=int, default=3, help="CSP filter pairs per band")
+    parser.add_argument('--workers', type=int, default=None, help="number of processes for cross-validation")
+    args = parser.parse_args(argv)
+    if len(args.bands) % 4:
+        parser.error("--bands takes groups of four frequencies")
+
+    bands = [args.bands[k:k + 4] for k in range(0, len(args.bands), 4)]
+    model, stats = train(load_xdf(args.recording), args.markers, bands, args.window,
+                         args.epochs_per_marker, args.folds, args.margin, args.pairs, args.workers)
+    if len(stats):
+        print_stats(stats)
+    model.save(args.model)
+    print("Model saved to", args.model)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,350 @@
+"""
+Typed, low-latency remote control of the running module.
+
+Remote clients (e.g. a classifier writing its output 10-20 times per second)
+send framed binary messages; each frame is a 4-byte header (magic byte 0xB5,
+message type, uint16 payload length, little endian) followed by the payload:
+
+  SET_FLOAT   name, float64 value, float64 send time (time.time(); 0 if unknown)
+  SET_VECTOR  name, float64 send time, uint16 n, n x float64 values
+  START / CANCEL / PRUNE / RESTART / EXIT   (no payload)
+  LOAD        module name
+  CONFIG      config name
+
+Names are sent as a uint8 length followed by UTF-8 bytes. The encode_*()
+functions build these frames, ControlClient sends them over TCP.
+
+Values are written to a ParameterTable of the module's registered numeric
+attributes; nothing is ever compiled or exec'd. ControlChannel collects the
+incoming messages from the network (on any thread) and applies them once per frame on
+the main thread, coalescing settings so that only the latest value per
+parameter is applied. Commands are never coalesced, but at most capacity
+commands are queued; further ones are dropped. Counters report how many
+messages were received, applied, coalesced (dropped) or rejected, and the
+latencies from sending and from receiving to applying.
+
+The legacy text protocol ('setup name=value', 'start', ...) is parsed into the
+same messages by ControlChannel.feed_line().
+"""
+import ast
+import numbers
+import socket
+import struct
+import threading
+import time
+
+MAGIC = 0xB5
+HEADER = struct.Struct('<BBH')
+
+SET_FLOAT = 1
+SET_VECTOR = 2
+START = 3
+CANCEL = 4
+PRUNE = 5
+LOAD = 6
+CONFIG = 7
+RESTART = 8
+EXIT = 9
+
+COMMANDS = {START: 'start', CANCEL: 'cancel', PRUNE: 'prune', LOAD: 'load', CONFIG: 'config',
+            RESTART: 'restart', EXIT: 'exit'}
+_float_payload = struct.Struct('<dd')
+_vector_header = struct.Struct('<dH')
+
+
+# ================
+# === Encoding ===
+# ================
+
+def _frame(kind, payload=b''):
+    return HEADER.pack(MAGIC, kind, len(payload)) + payload
+
+
+def _name(name):
+    data = name.encode('utf-8')
+    return bytes([len(data)]) + data
+
+
+def encode_set_float(name, value, timestamp=None):
+    """Frame setting the float parameter name to value."""
+    return _frame(SET_FLOAT, _name(name) + _float_payload.pack(value, time.time() if timestamp is None else timestamp))
+
+
+def encode_set_vector(name, values, timestamp=None):
+    """Frame setting the vector parameter name to the given values."""
+    values = [float(v) for v in values]
+    payload = _vector_header.pack(time.time() if timestamp is None else timestamp, len(values))
+    return _frame(SET_VECTOR, _name(name) + payload + struct.pack('<%dd' % len(values), *values))
+
+
+def encode_command(command, argument=None):
+    """Frame for 'start', 'cancel', 'prune', or 'load' / 'config' with a module / config name."""
+    kind = {v: k for k, v in COMMANDS.items()}[command]
+    return _frame(kind, b'' if argument is None else argument.encode('utf-8'))
+
+
+class ControlClient(object):
+    """Sends binary control messages to a launcher over TCP."""
+
+    def __init__(self, host='localhost', port=7897):
+        self.socket = socket.create_connection((host, port))
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def set_float(self, name, value, timestamp=None):
+        self.socket.sendall(encode_set_float(name, value, timestamp))
+
+    def set_vector(self, name, values, timestamp=None):
+        self.socket.sendall(encode_set_vector(name, values, timestamp))
+
+    def command(self, command, argument=None):
+        self.socket.sendall(encode_command(command, argument))
+
+    def close(self):
+        self.socket.close()
+
+
+# ================
+# === Decoding ===
+# ================
+
+class FrameDecoder(object):
+    """Splits a byte stream into messages: ('set', name, value, sent) or ('command', name, argument)."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        """Add received bytes; returns the list of complete messages."""
+        buffer = self._buffer
+        buffer += data
+        messages = []
+        offset = 0
+        while len(buffer) - offset >= HEADER.size:
+            magic, kind, length = HEADER.unpack_from(buffer, offset)
+            if magic != MAGIC:
+                raise ValueError("Corrupt control stream (bad magic byte %r)." % magic)
+            end = offset + HEADER.size + length
+            if end > len(buffer):
+                break
+            messages.append(self._decode(kind, bytes(buffer[offset + HEADER.size:end])))
+            offset = end
+        del buffer[:offset]
+        return messages
+
+    def _decode(self, kind, payload):
+        if kind in (SET_FLOAT, SET_VECTOR):
+            n = payload[0]
+            name = payload[1:1 + n].decode('utf-8')
+            if kind == SET_FLOAT:
+                value, sent = _float_payload.unpack_from(payload, 1 + n)
+            else:
+                sent, count = _vector_header.unpack_from(payload, 1 + n)
+                value = list(struct.unpack_from('<%dd' % count, payload, 1 + n + _vector_header.size))
+            return ('set', name, value, sent)
+        if kind in COMMANDS:
+            return ('command', COMMANDS[kind], payload.decode('utf-8') or None)
+        raise ValueError("Unknown control message type %d." % kind)
+
+
+# ==============================
+# === Parameters and channel ===
+# ==============================
+
+class ParameterTable(object):
+    """Named, typed parameters that can be set remotely, each writing to an attribute of an object."""
+
+    def __init__(self):
+        self._parameters = {}       # name -> (kind, target, attribute)
+        self._target = None         # object whose attributes are registered by register_attributes()
+
+    def register(self, name, target, attribute=None, kind='float'):
+        """Register target.attribute (default: name) as a 'float', 'int' or 'vector' parameter."""
+        if kind not in ('float', 'int', 'vector'):
+            raise ValueError("Unknown parameter kind: %s" % kind)
+        self._parameters[name] = (kind, target, attribute or name)
+
+    def register_attributes(self, target):
+        """
+        Register all public numeric (or numeric list) attributes of target, replacing earlier registrations.
+        Attributes that the target only assigns later (e.g. when it starts) are registered when first set.
+        """
+        self._parameters.clear()
+        self._target = target
+        for name, value in vars(target).items():
+            self._register_attribute(target, name, value)
+
+    def _register_attribute(self, target, name, value):
+        if name.startswith('_') or isinstance(value, bool):
+            return False
+        if isinstance(value, numbers.Integral):
+            self.register(name, target, kind='int')
+        elif isinstance(value, numbers.Real):
+            self.register(name, target)
+        elif isinstance(value, (list, tuple)) and value and all(
+                isinstance(v, numbers.Real) and not isinstance(v, bool) for v in value):
+            self.register(name, target, kind='vector')
+        else:
+            return False
+        return True
+
+    def __contains__(self, name):
+        return name in self._parameters
+
+    def __len__(self):
+        return len(self._parameters)
+
+    def set(self, name, value):
+        """
+        Write a value; raises KeyError for unknown parameters and TypeError for values of the wrong kind.
+        Integer attributes (and lists of integers) stay integers: non-integral values are rejected.
+        """
+        if name not in self._parameters:
+            target = self._target
+            if target is None or not self._register_attribute(target, name, vars(target).get(name)):
+                raise KeyError(name)
+        kind, target, attribute = self._parameters[name]
+        if kind != 'vector':
+            if isinstance(value, (list, tuple)):
+                raise TypeError("Parameter %s takes a single number." % name)
+            value = _integral(name, value) if kind == 'int' else float(value)
+        else:
+            if not isinstance(value, (list, tuple)):
+                raise TypeError("Parameter %s takes a list of numbers." % name)
+            current = getattr(target, attribute)
+            if len(current) == len(value) and all(isinstance(v, numbers.Integral) for v in current):
+                value = [_integral(name, v) for v in value]
+            else:
+                value = [float(v) for v in value]
+        setattr(target, attribute, value)
+
+
+def _integral(name, value):
+    # an integer parameter value, e.g. from a float sent over the binary protocol
+    value = float(value)
+    if not value.is_integer():
+        raise TypeError("Parameter %s takes an integer." % name)
+    return int(value)
+
+
+class ControlChannel(object):
+    """Collects control messages from any thread and applies them once per frame, coalescing settings."""
+
+    def __init__(self, parameters=None, capacity=256):
+        self.parameters = parameters or ParameterTable()
+        self.capacity = capacity        # maximum number of queued commands
+        self._lock = threading.Lock()
+        self._settings = {}             # name -> (value, sent, received); the latest value per parameter
+        self._commands = []             # commands in order of arrival
+
+        # counters
+        self.received = 0               # messages received
+        self.applied = 0                # settings applied
+        self.coalesced = 0              # settings overwritten by a newer value before being applied
+        self.rejected = 0               # settings for unknown parameters or with values of the wrong kind
+        self.dropped = 0                # commands dropped because the queue was full
+        self.latency = 0.0              # last send-to-apply latency in seconds (if senders give their time)
+        self.max_latency = 0.0
+        self.queue_latency = 0.0        # last receive-to-apply latency in seconds
+        self.max_queue_latency = 0.0
+
+    def put(self, message):
+        """Queue a decoded message (see FrameDecoder); returns False if it was dropped."""
+        received = time.perf_counter()
+        with self._lock:
+            self.received += 1
+            if message[0] == 'set':
+                _, name, value, sent = message
+                if name in self._settings:
+                    self.coalesced += 1
+                self._settings[name] = (value, sent, received)
+            elif len(self._commands) < self.capacity:
+                self._commands.append(message[1:])
+            else:
+                self.dropped += 1
+                return False
+        return True
+
+    def feed(self, decoder, data):
+        """Decode received bytes with the connection's FrameDecoder and queue the messages."""
+        for message in decoder.feed(data):
+            self.put(message)
+
+    def feed_line(self, line):
+        """Queue a command of the legacy text protocol, e.g. 'setup bci=1.5' or 'start'; returns False if rejected."""
+        line = line.strip()
+        if line.startswith('setup '):
+            try:
+                assignments = parse_setup(line[6:])
+            except ValueError as e:
+                print("Ignoring remote command %r: %s" % (line, e))
+                with self._lock:
+                    self.rejected += 1
+                return False
+            for name, value in assignments:
+                self.put(('set', name, value, 0.0))
+            return True
+        if line in ('start', 'cancel', 'stop', 'prune', 'restart', 'exit'):
+            return self.put(('command', 'cancel' if line == 'stop' else line, None))
+        if line.startswith('load ') or line.startswith('config '):
+            command, argument = line.split(' ', 1)
+            return self.put(('command', command, argument.strip()))
+        if line:
+            print("Ignoring unknown remote command %r" % line)
+        return False
+
+    def apply(self):
+        """Apply all pending settings (latest value per parameter); returns the pending commands as (name, argument)."""
+        with self._lock:
+            settings, self._settings = self._settings, {}
+            commands, self._commands = self._commands, []
+        now = time.perf_counter()
+        wallclock = time.time()
+        for name, (value, sent, received) in settings.items():
+            try:
+                self.parameters.set(name, value)
+            except (KeyError, TypeError, ValueError):
+                self.rejected += 1
+                continue
+            self.applied += 1
+            self.queue_latency = now - received
+            self.max_queue_latency = max(self.max_queue_latency, self.queue_latency)
+            if sent:
+                self.latency = wallclock - sent
+                self.max_latency = max(self.max_latency, self.latency)
+        return commands
+
+    @property
+    def counters(self):
+        """All counters as a dict."""
+        return dict(received=self.received, applied=self.applied, coalesced=self.coalesced, rejected=self.rejected,
+                    dropped=self.dropped,
+                    latency=self.latency, max_latency=self.max_latency,
+                    queue_latency=self.queue_latency, max_queue_latency=self.max_queue_latency)
+
+
+def parse_setup(text):
+    """
+    Parse the assignments of a legacy 'setup' command, e.g. 'bci=1.5; self.range=[1, 2]',
+    into (name, value) pairs. Only literal numbers and lists of numbers are accepted.
+    """
+    try:
+        statements = ast.parse(text.strip()).body
+    except SyntaxError as e:
+        raise ValueError(str(e))
+    assignments = []
+    for statement in statements:
+        if not (isinstance(statement, ast.Assign) and len(statement.targets) == 1):
+            raise ValueError("only assignments are supported")
+        target = statement.targets[0]
+        if isinstance(target, ast.Attribute) and isinstance(target.value, ast.Name) and target.value.id == 'self':
+            name = target.attr
+        elif isinstance(target, ast.Name):
+            name = target.id
+        else:
+            raise ValueError("unsupported assignment target")
+        try:
+            value = ast.literal_eval(statement.value)
+        except ValueError:
+            raise ValueError("only literal values are supported")
+        assignments.append((name, value))
+    return assignments
@@ -0,0 +1,164 @@
+# -*- coding:utf-8 -*-
+"""
+In-memory cache of fonts, textures, sounds and models.
+
+Loading a stimulus asset through the Panda3D loader involves resolving the path
+on disk and a lookup in the engine's pools (or a disk read) every time, which
+adds to the onset latency of stimuli. AssetCache keeps the loaded assets by
+(kind, path, options), resolves each path only once, and evicts the least
+recently used assets when their estimated size exceeds a memory budget.
+Assets are keyed by their resolved path, so 'media/x.png' and the result of
+meyendtris.path_join('media/x.png') refer to the same cache entry.
+Modules can preload everything they need from a manifest when they start, and
+release it in prune().
+
+A manifest is a list of (kind, path) pairs, a dict {kind: [paths]}, or the
+name of a JSON file containing either; kinds are 'font', 'texture', 'sound'
+and 'model'. Relative paths are resolved with meyendtris.path_join().
+
+Note that a cached sound is a single playable object: playing it again while
+it is still playing restarts it. Caching it keeps the decoded audio of the file
+loaded; stimuli play AudioSounds of their own (see BasicStimuli.sound()).
+"""
+import collections
+import json
+import os
+
+import meyendtris
+
+KINDS = ('font', 'texture', 'sound', 'model')
+
+
+class AssetCache(object):
+    """Keyed LRU cache of loaded assets with a memory budget and hit/miss statistics."""
+
+    def __init__(self,
+                 loader=None,                   # Panda3D loader; the one of meyendtris.__BASE__ if None
+                 budget=256 * 1024 * 1024):     # maximum estimated size of all cached assets in bytes
+        self._loader = loader
+        self.budget = budget
+        self._entries = collections.OrderedDict() # (kind, path, options) -> (asset, size), least recently used first
+        self._paths = {}                # path -> resolved path
+        self.size = 0                   # estimated size of all cached assets in bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def loader(self):
+        if self._loader is None:
+            self._loader = meyendtris.__BASE__.loader
+        return self._loader
+
+    def resolve(self, path):
+        """The full path of an asset (resolved once)."""
+        try:
+            return self._paths[path]
+        except KeyError:
+            full = path if os.path.isabs(path) and os.path.exists(path) else meyendtris.path_join(path)
+            self._paths[path] = full
+            return full
+
+    def get(self, kind, path, **options):
+        """The asset of the given kind at path, loaded with the given loader options if not cached."""
+        full = self.resolve(path)
+        key = (kind, full, tuple(sorted(options.items())))
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+        self.misses += 1
+        asset = self._load(kind, full, options)
+        size = self._estimate_size(asset, full)
+        self._entries[key] = (asset, size)
+        self.size += size
+        # evict least recently used assets (but never the one just loaded)
+        while self.size > self.budget and len(self._entries) > 1:
+            self._evict(next(iter(self._entries)))
+        return asset
+
+    def font(self, path, **options):
+        return self.get('font', path, **options)
+
+    def texture(self, path, **options):
+        return self.get('texture', path, **options)
+
+    def sound(self, path, **options):
+        return self.get('sound', path, **options)
+
+    def model(self, path, **options):
+        return self.get('model', path, **options)
+
+    def preload(self, manifest):
+        """Load all assets of a manifest (see module docstring); returns the number of assets loaded."""
+        if isinstance(manifest, str):
+            with open(self.resolve(manifest)) as f:
+                manifest = json.load(f)
+        if isinstance(manifest, dict):
+            manifest = [(kind, path) for kind, paths in manifest.items() for path in paths]
+        misses = self.misses
+        for kind, path in manifest:
+            self.get(kind, path)
+        return self.misses - misses
+
+    def evict(self, kind, path, **options):
+        """Remove an asset from the cache (and the engine's pools)."""
+        key = (kind, self.resolve(path), tuple(sorted(options.items())))
+        if key in self._entries:
+            self._evict(key)
+
+    def prune(self):
+        """Remove all assets from the cache."""
+        for key in list(self._entries):
+            self._evict(key)
+
+    def stats(self):
+        """Cache statistics as a dict."""
+        requests = self.hits + self.misses
+        return dict(hits=self.hits, misses=self.misses, evictions=self.evictions,
+                    hit_rate=self.hits / requests if requests else 0.0,
+                    entries=len(self._entries), size=self.size, budget=self.budget)
+
+    def __contains__(self, key):
+        kind, path = key
+        return (kind, self.resolve(path), ()) in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    # --- internal ---
+    def _load(self, kind, path, options):
+        if kind == 'font':
+            return self.loader.loadFont(path, **options)
+        if kind == 'texture':
+            return self.loader.loadTexture(path, **options)
+        if kind == 'sound':
+            return self.loader.loadSfx(path, **options)
+        if kind == 'model':
+            return self.loader.loadModel(path, **options)
+        raise ValueError("Unknown asset kind: %s (expected one of %s)" % (kind, ', '.join(KINDS)))
+
+    def _evict(self, key):
+        asset, size = self._entries.pop(key)
+        self.size -= size
+        self.evictions += 1
+        kind = key[0]
+        try:
+            if kind == 'texture':
+                self.loader.unloadTexture(asset)
+            elif kind == 'sound':
+                self.loader.unloadSfx(asset)
+            elif kind == 'model':
+                self.loader.unloadModel(asset)
+        except Exception as e:
+            print("Could not unload %s %s: %s" % (kind, key[1], e))
+
+    @staticmethod
+    def _estimate_size(asset, path):
+        if hasattr(asset, 'estimateTextureMemory'):
+            return asset.estimateTextureMemory()
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
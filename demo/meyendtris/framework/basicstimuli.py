@@ -2,11 +2,14 @@ from abc import ABC, abstractmethod
 import meyendtris
 from direct.gui.OnscreenText import OnscreenText
 from direct.gui.OnscreenImage import OnscreenImage
-from direct.showbase.ShowBase import ShowBase
 from direct.showbase.Audio3DManager import Audio3DManager
 import panda3d.core as pandac
 import meyendtris.framework.eventmarkers.eventmarkers
+from meyendtris.framework.assets import AssetCache
 from meyendtris.framework.latentmodule import LatentModule
+from meyendtris.framework.onset import flip_clock
+from meyendtris.framework.pool import ObjectRegistry, StimulusPool
+from meyendtris.framework.visualnoise import VisualNoise
 import math, warnings, os
     
 class BasicStimuli(LatentModule, ABC):
@@ -16,14 +19,27 @@ class BasicStimuli(LatentModule, ABC):
     of time are the calls to explicit time-consumption functions (see below), such as sleep().
 
     This class provides convenience functions for displaying psychological-type stimuli.
-    This includes text, rectangles, crosshairs, images, sounds, and video.
+    This includes text, rectangles, crosshairs, images, visual noise, sounds, and video.
     These functions are automatically available to any LatentModule. 
+
+    Fonts, textures and sounds are loaded through self.assets (see AssetCache); the assets
+    listed in self.asset_manifest are preloaded when the module starts, and released by prune().
+    Each sound() plays an AudioSound of its own (the engine shares the decoded audio of the file),
+    so that repeated or overlapping sounds do not cut each other off.
+
+    The visual stimuli are time-stamped at the buffer flip that first shows them: non-blocking ones have an
+    .onset attribute (an Onset handle whose .time is set at the flip, see FlipClock), and self.last_onset is the
+    onset of the last stimulus. Implicit markers (and markers sent through onset()) carry the flip time.
+
+    Text and image stimuli are taken from pools of pre-built nodes (self.text_pool and self.image_pool,
+    see StimulusPool), so calling .destroy() on them returns them to the pool for reuse.
     """
 
     class destroy_helper:
         """Small helper class to destroy multiple objects using a destroy() call."""
-        def __init__(self,objs):
+        def __init__(self,objs,onset=None):
             self.objs = objs
+            self.onset = onset
         def destroy(self):
             for o in self.objs:
                 o.destroy()
@@ -33,7 +49,33 @@ class BasicStimuli(LatentModule, ABC):
         super().__init__(make_up_for_lost_time = False)
         self.audio3d = None
         self.implicit_markers = False
-        self._to_destroy = []
+        self.last_onset = None          # Onset of the last visual stimulus
+        self._to_destroy = ObjectRegistry()
+        self._destroy_tasks = ObjectRegistry() # pending delayed destructions of non-blocking stimuli
+        self.assets = AssetCache(self._base.loader)
+        self.asset_manifest = []        # assets to preload at start(), see AssetCache.preload()
+        self.text_pool = StimulusPool(self._new_text, self._reset_text)
+        self.image_pool = StimulusPool(self._new_image, self._reset_image)
+        self.pool_reserve = 8           # number of text and image nodes to pre-build at start()
+
+    def start(self):
+        """Preload the assets of the manifest, pre-build pooled stimuli and start the module."""
+        self.assets.preload(self.asset_manifest)
+        self.text_pool.reserve(self.pool_reserve)
+        self.image_pool.reserve(self.pool_reserve)
+        super().start()
+
+    def cancel(self):
+        """Cancel the module, including the pending destructions of its non-blocking stimuli (which cancel destroys)."""
+        for task in self._destroy_tasks.drain():
+            self._base.taskMgr.remove(task)
+        super().cancel()
+
+    def prune(self):
+        """Release all cached assets and pooled stimuli."""
+        self.text_pool.clear()
+        self.image_pool.clear()
+        self.assets.prune()
 
     def marker(self,markercode):
         """
@@ -42,6 +84,13 @@ class BasicStimuli(LatentModule, ABC):
         """
         meyendtris.framework.eventmarkers.eventmarkers.send_marker(markercode)
        
+    def onset(self, *markers):
+        """
+        Register the onset of the stimuli created in the current frame; returns an Onset handle whose .time is set
+        at the buffer flip that first shows them. The given markers are sent with the flip time as their timestamp.
+        """
+        return flip_clock(self._base).onset(markers)
+
     def write(self, 
               text,                     # the text to display
               duration=1.0,             # duration for which the text will be displayed
@@ -77,24 +126,15 @@ class BasicStimuli(LatentModule, ABC):
             block = False
         
 
-        font = self._base.loader.loadFont(font)
-        obj = OnscreenText(text=text,pos=(pos[0],pos[1]-scale/4),roll=roll,scale=scale,fg=fg,bg=bg,shadow=shadow,shadowOffset=shadow_offset,frame=frame,align=align,wordwrap=wordwrap,drawOrder=draw_order,font=font,parent=parent,sort=sort)
+        font = self.assets.font(font)
+        obj = self.text_pool.acquire(text=text,pos=(pos[0],pos[1]-scale/4),roll=roll,scale=scale,fg=fg,bg=bg,shadow=shadow,shadow_offset=shadow_offset,frame=frame,align=align,wordwrap=wordwrap,draw_order=draw_order,font=font,parent=parent,sort=sort)
         self._to_destroy.append(obj)
-        if self.implicit_markers:
-            self.marker(254)
+        obj.onset = self._stimulus_onset(254)
         if block:
-            if type(duration) == list or type(duration) == tuple:
-                self.sleep(duration[0])
-                self.waitfor(duration[1])
-            elif type(duration) == str:
-                self.waitfor(duration)
-            else:
-                self.sleep(duration)
-                
-            self._destroy_object(obj,255)
+            return self._latent(self._show_for(duration,obj,255))
         else:
             if duration > 0:
-                self._base.taskMgr.doMethodLater(duration, self._destroy_object, 'ConvenienceFunctions, remove_text', extraArgs=[obj, 255])
+                self._destroy_later(duration, obj, 255, 'ConvenienceFunctions, remove_text')
             return obj
 
     def crosshair(self,
@@ -111,28 +151,18 @@ class BasicStimuli(LatentModule, ABC):
                   parent=None       # the renderer to use for displaying the object
                   ):        
         """Draw a crosshair."""
-        img = meyendtris.path_join('media/blank.tga')
-        obj1 = OnscreenImage(image=img,pos=(pos[0],0,pos[1]),scale=(size,1,width),color=color,parent=parent)
+        img = self.assets.texture('media/blank.tga')
+        obj1 = self.image_pool.acquire(image=img,pos=(pos[0],0,pos[1]),scale=(size,1,width),color=color,parent=parent)
         self._to_destroy.append(obj1)
-        obj1.setTransparency(pandac.TransparencyAttrib.MAlpha)
-        obj2 = OnscreenImage(image=img,pos=(pos[0],0,pos[1]),scale=(width,1,size),color=color,parent=parent)
+        obj2 = self.image_pool.acquire(image=img,pos=(pos[0],0,pos[1]),scale=(width,1,size),color=color,parent=parent)
         self._to_destroy.append(obj2)
-        obj2.setTransparency(pandac.TransparencyAttrib.MAlpha)
-        if self.implicit_markers:
-            self.marker(252)
+        onset = self._stimulus_onset(252)
         if block:
-            if type(duration) == list or type(duration) == tuple:
-                self.sleep(duration[0])
-                self.waitfor(duration[1])
-            elif type(duration) == str:
-                self.waitfor(duration)
-            else:
-                self.sleep(duration)
-            self._destroy_object([obj1,obj2],253)
+            return self._latent(self._show_for(duration,[obj1,obj2],253))
         else:
             if duration > 0:
-                self._base.taskMgr.doMethodLater(duration, self._destroy_object, 'ConvenienceFunctions, remove_crosshair',extraArgs=[[obj1,obj2],253])
-            return self.destroy_helper([obj1,obj2])
+                self._destroy_later(duration, [obj1,obj2], 253, 'ConvenienceFunctions, remove_crosshair')
+            return self.destroy_helper([obj1,obj2],onset)
   
     def rectangle(self,
                   rect=(0,0,0,0),   # the bounds of the rectangle (left,right,top,bottom)
@@ -155,28 +185,19 @@ class BasicStimuli(LatentModule, ABC):
         r=rect[1]
         t=rect[2]
         b=rect[3]
-        obj = OnscreenImage(
-            image= meyendtris.path_join('media/blank.tga'),
+        obj = self.image_pool.acquire(
+            image=self.assets.texture('media/blank.tga'),
             pos=((l+r)/2,depth,(b+t)/2),
             scale=((r-l)/2,1,(b-t)/2),
             color=color,
             parent=parent)
         self._to_destroy.append(obj)
-        obj.setTransparency(pandac.TransparencyAttrib.MAlpha)
-        if self.implicit_markers:
-            self.marker(250)
+        obj.onset = self._stimulus_onset(250)
         if block:
-            if type(duration) == list or type(duration) == tuple:
-                self.sleep(duration[0])
-                self.waitfor(duration[1])
-            elif type(duration) == str:
-                self.waitfor(duration)
-            else:
-                self.sleep(duration)
-            self._destroy_object(obj,251)
+            return self._latent(self._show_for(duration,obj,251))
         else:
             if duration > 0:                            
-                self._base.taskMgr.doMethodLater(duration, self._destroy_object, 'ConvenienceFunctions, remove_rect',extraArgs=[obj,251])
+                self._destroy_later(duration, obj, 251, 'ConvenienceFunctions, remove_rect')
             return obj
 
     def frame(self,
@@ -199,34 +220,22 @@ class BasicStimuli(LatentModule, ABC):
         b=rect[3]
         w=thickness[0]
         h=thickness[1]
-        img = meyendtris.path_join('media/blank.tga')
-        L = OnscreenImage(image=img,pos=(l-w/2,0,(b+t)/2),scale=(w/2,0,w+(b-t)/2),color=color,parent=parent)
-        L.setTransparency(1)
+        img = self.assets.texture('media/blank.tga')
+        L = self.image_pool.acquire(image=img,pos=(l-w/2,0,(b+t)/2),scale=(w/2,0,w+(b-t)/2),color=color,parent=parent)
         self._to_destroy.append(L)
-        R = OnscreenImage(image=img,pos=(r+w/2,0,(b+t)/2),scale=(w/2,0,w+(b-t)/2),color=color,parent=parent)
-        R.setTransparency(1)
+        R = self.image_pool.acquire(image=img,pos=(r+w/2,0,(b+t)/2),scale=(w/2,0,w+(b-t)/2),color=color,parent=parent)
         self._to_destroy.append(R)
-        T = OnscreenImage(image=img,pos=((l+r)/2,0,t-h/2),scale=(h+(r-l)/2,0,h/2),color=color,parent=parent)
-        T.setTransparency(1)
+        T = self.image_pool.acquire(image=img,pos=((l+r)/2,0,t-h/2),scale=(h+(r-l)/2,0,h/2),color=color,parent=parent)
         self._to_destroy.append(T)
-        B = OnscreenImage(image=img,pos=((l+r)/2,0,b+h/2),scale=(h+(r-l)/2,0,h/2),color=color,parent=parent)
-        B.setTransparency(1)
+        B = self.image_pool.acquire(image=img,pos=((l+r)/2,0,b+h/2),scale=(h+(r-l)/2,0,h/2),color=color,parent=parent)
         self._to_destroy.append(B)
-        if self.implicit_markers:
-            self.marker(242)
+        onset = self._stimulus_onset(242)
         if block:
-            if type(duration) == list or type(duration) == tuple:
-                self.sleep(duration[0])
-                self.waitfor(duration[1])
-            elif type(duration) == str:
-                self.waitfor(duration)
-            else:
-                self.sleep(duration)
-            self._destroy_object([L,R,T,B],243)
+            return self._latent(self._show_for(duration,[L,R,T,B],243))
         else:
             if duration > 0:
-                self._base.taskMgr.doMethodLater(duration,self._destroy_object, 'ConvenienceFunctions, remove_frame',extraArgs=[[L,R,T,B],243])    
-            return self.destroy_helper([L,R,T,B])        
+                self._destroy_later(duration, [L,R,T,B], 243, 'ConvenienceFunctions, remove_frame')    
+            return self.destroy_helper([L,R,T,B],onset)        
 
     def picture(self, 
               image,                    # the image to display (may be a file name, preferably a relative path)
@@ -252,24 +261,22 @@ class BasicStimuli(LatentModule, ABC):
             hpr = (0,0,hpr)
         if duration == 0:
             block = False
+        if isinstance(image, str):
+            image = self.assets.texture(image)
             
-        obj = OnscreenImage(image=image,pos=pos,hpr=hpr,scale=scale,color=color,parent=parent)
+        if isinstance(image, pandac.Texture):
+            obj = self.image_pool.acquire(image=image,pos=pos,hpr=hpr,scale=scale,color=color,parent=parent)
+        else:
+            # models and node paths are not pooled
+            obj = OnscreenImage(image=image,pos=pos,hpr=hpr,scale=scale,color=color,parent=parent)
+            obj.setTransparency(pandac.TransparencyAttrib.MAlpha)
         self._to_destroy.append(obj)
-        obj.setTransparency(pandac.TransparencyAttrib.MAlpha)
-        if self.implicit_markers:
-            self.marker(248)
+        obj.onset = self._stimulus_onset(248)
         if block:
-            if type(duration) == list or type(duration) == tuple:
-                self.sleep(duration[0])
-                self.waitfor(duration[1])
-            elif type(duration) == str:
-                self.waitfor(duration)
-            else:
-                self.sleep(duration)
-            self._destroy_object(obj,249)
+            return self._latent(self._show_for(duration,obj,249))
         else:
             if duration > 0:
-                self._base.taskMgr.doMethodLater(duration, self._destroy_object, 'ConvenienceFunctions, remove_picture', extraArgs=[obj,249])
+                self._destroy_later(duration, obj, 249, 'ConvenienceFunctions, remove_picture')
             return obj
 
     def sound(self,
@@ -292,7 +299,7 @@ class BasicStimuli(LatentModule, ABC):
             self._to_destroy.append(obj)
             self.audio3d.setSoundVelocityAuto(obj)
         else:
-            obj = self._base.loader.loadSfx(filename)
+            obj = self._base.loader.loadSfx(self.assets.resolve(filename))
             self._to_destroy.append(obj)
             obj.setVolume(volume)
             obj.setBalance(direction)
@@ -312,10 +319,9 @@ class BasicStimuli(LatentModule, ABC):
         if self.implicit_markers:
             self.marker(246)
         if block:
-            self.sleep(length)
-            self._destroy_object(obj,247)            
+            return self._latent(self._show_for(length,obj,247))
         else:
-            self._base.taskMgr.doMethodLater(length, self._destroy_object, 'ConvenienceFunctions, end_sound', extraArgs=[None,247])
+            self._destroy_later(length, None, 247, 'ConvenienceFunctions, end_sound')
             return obj
 
     def movie(self,
@@ -425,32 +431,56 @@ class BasicStimuli(LatentModule, ABC):
 
         # start playback and assure its destruction
         playable.play()
-        if self.implicit_markers:
-            self.marker(244)            
+        self._stimulus_onset(244)
         if block:
-            self.sleep(length)
-            self._destroy_object(img, 245)
+            return self._latent(self._show_for(length,img,245))
         else:
-            self._base.taskMgr.doMethodLater(length, self._destroy_object, 'ConvenienceFunctions, remove_movie', extraArgs=[[img,tex,snd],245])
+            self._destroy_later(length, [img,tex,snd], 245, 'ConvenienceFunctions, remove_movie')
             return playable
 
+    def noise(self,
+              count=3,                  # number of random rectangles
+              duration=1.0,             # duration for which the noise will be displayed
+                                        # if this is a string, the stimulus will be displayed until the corresponding event is generated
+                                        # if this is a list of [number,string], the stimulus will at least be displayed for <number> seconds, but needs to confirmed with the respective event
+                                        # if this is 0, the noise will be non-blocking and you have to .destroy() the return value of this function manually
+              block=True,               # whether to wait for the duration until the function returns
+              # optional parameters:
+              seed=None,                # seed of the random generator (or a numpy Generator, to continue its sequence)
+              rate=None,                # updates per second; None to draw new rectangles at every frame
+              parent=None,              # parent rendering context or Panda3d NodePath
+              **kwargs                  # further parameters of VisualNoise (ranges of positions, sizes and opacities)
+              ):
+        """Display visual noise (randomly placed and coloured rectangles, redrawn at every frame) for a particular duration."""
+        if duration == 0:
+            block = False
+        obj = VisualNoise(count=count,seed=seed,rate=rate,parent=parent,taskmgr=self._base.taskMgr,**kwargs).start()
+        self._to_destroy.append(obj)
+        obj.onset = self._stimulus_onset(240)
+        if block:
+            return self._latent(self._show_for(duration,obj,241))
+        else:
+            if duration > 0:
+                self._destroy_later(duration, obj, 241, 'ConvenienceFunctions, remove_noise')
+            return obj
+
     def precache_sound(self,filename):
         """Pre-cache a sound file."""
         if filename is None:
             return
-        return self._base.loader.loadSfx(filename)
+        return self.assets.sound(filename)
     
     def precache_picture(self,filename):
         """Pre-cache a picture file."""
         if filename is None:
             return
-        return self._base.loader.loadTexture(filename)
+        return self.assets.texture(filename)
 
     def precache_model(self,filename):
         """Pre-cache a model file."""
         if filename is None:
             return
-        return self._base.loader.loadModel(filename)
+        return self.assets.model(filename)
     
     def precache_movie(self,filename):
         """Pre-cache a movie file."""
@@ -469,19 +499,13 @@ class BasicStimuli(LatentModule, ABC):
         """Un-cache a previously cached sound file."""
         if filename is None:
             return
-        # get the handle
-        h = self._base.loader.loadSfx(filename)
-        # remove it
-        self._base.loader.unloadSfx(h)
+        self.assets.evict('sound', filename)
 
     def uncache_picture(self,filename):
         """Un-cache a previously cached picture file."""
         if filename is None:
             return
-        # get the handle
-        h = self._base.loader.loadTexture(filename)
-        # remove it
-        self._base.loader.unloadTexture(h)
+        self.assets.evict('texture', filename)
 
     def uncache_movie(self,filename):
         """Un-cache a previously cached movie file."""
@@ -509,14 +533,51 @@ class BasicStimuli(LatentModule, ABC):
         """
         self.marker('Experiment Control/Setup/Parameters/%s:"%s"%s' % (self.__class__, str(self.__dict__).replace('"','\\"'), extra_msg))
 
-    def _destroy_object(self, obj, id=-1):
-        """Internal helper to automatically destroy a stimulus object."""
+    def _stimulus_onset(self, id):
+        """Internal helper registering the onset of a visual stimulus (with its implicit marker)."""
+        self.last_onset = self.onset(id) if self.implicit_markers else self.onset()
+        return self.last_onset
+
+    def _show_for(self, duration, obj, id=-1):
+        """Internal time-consumption generator keeping a stimulus object for the given duration (see write()), then destroying it."""
+        if type(duration) == list or type(duration) == tuple:
+            yield from self._sleep(duration[0])
+            yield from self._waitfor(duration[1],100000.0,None)
+        elif type(duration) == str:
+            yield from self._waitfor(duration,100000.0,None)
+        else:
+            yield from self._sleep(duration)
+        self._destroy_object(obj,id)
+
+    def _destroy_later(self, duration, obj, id, name):
+        """Internal helper to destroy a stimulus object after the given duration (see _destroy_object)."""
+        objs = obj if isinstance(obj, (list, tuple)) else [obj]
+        generations = [getattr(ele, 'pool_generation', None) for ele in objs]
+
+        def destroy(task):
+            self._destroy_tasks.discard(scheduled)
+            self._destroy_object(obj, id, generations)
+            return task.done
+
+        scheduled = self._base.taskMgr.doMethodLater(duration, destroy, name)
+        self._destroy_tasks.append(scheduled)
+
+    def _destroy_object(self, obj, id=-1, generations=None):
+        """
+        Internal helper to automatically destroy a stimulus object. Given the pool generations of the objects
+        at the time the destruction was scheduled, pooled objects that have been handed out again since are kept.
+        """
         obj = list(obj) if isinstance(obj, tuple) else obj
         obj = [obj] if not isinstance(obj, list) else obj
+        if generations is not None:
+            obj = [ele for ele, generation in zip(obj, generations) if getattr(ele, 'pool_generation', None) == generation]
+            if not obj:
+                return
 
         try:
             if id > 0 and self.implicit_markers:
-                self.marker(id)
+                # the offset is visible at the next flip
+                self.onset(id)
                 
             for ele in obj:
                 if ele is not None:
@@ -527,10 +588,56 @@ class BasicStimuli(LatentModule, ABC):
                     else:
                         obj.remove(ele)
                     # remove from cancel list
-                    self._to_destroy.remove(ele)
+                    self._to_destroy.discard(ele)
         except:
             warnings.warn("Error in destryoing objects")
 
+    def _new_text(self):
+        """Internal factory of pooled text nodes."""
+        return OnscreenText(text='', mayChange=True)
+
+    def _reset_text(self, node, text='', pos=(0,0), roll=0, scale=0.07, fg=(1,1,1,1), bg=None, shadow=None, shadow_offset=(0.04,0.04),
+                    frame=None, align=pandac.TextNode.ACenter, wordwrap=None, draw_order=None, font=None, parent=None, sort=0):
+        """Internal helper to apply the properties of a text stimulus (see write()) to a pooled node."""
+        node.reparentTo(parent if parent is not None else self._base.aspect2d, sort)
+        node.setText(text)
+        if font is not None:
+            node.setFont(font)
+        node.setAlign(align)
+        node.setWordwrap(wordwrap)
+        node.setFg(fg)
+        node.setBg(bg or (0,0,0,0))
+        node.setFrame(frame or (0,0,0,0))
+        node.setShadow(shadow or (0,0,0,0))
+        if shadow is not None and shadow[3] != 0:
+            node.textNode.setShadow(*shadow_offset)
+        if draw_order is not None:
+            node.textNode.setBin('fixed')
+            node.textNode.setDrawOrder(draw_order)
+        else:
+            node.textNode.clearBin()
+            node.textNode.clearDrawOrder()
+        node.setScale(scale)
+        node.setRoll(roll)
+        node.setPos(pos[0],pos[1])
+
+    def _new_image(self):
+        """Internal factory of pooled image nodes."""
+        return OnscreenImage(image=self.assets.texture('media/blank.tga'))
+
+    def _reset_image(self, node, image=None, pos=None, hpr=None, scale=None, color=None, parent=None):
+        """Internal helper to apply the properties of an image stimulus (see picture()) to a pooled node."""
+        node.reparentTo(parent if parent is not None else self._base.aspect2d)
+        node.setTexture(image if image is not None else self.assets.texture('media/blank.tga'))
+        node.setPos(pos if pos is not None else (0,0,0))
+        node.setHpr(hpr if hpr is not None else (0,0,0))
+        node.setScale(scale if scale is not None else 1)
+        if color:
+            node.setColor(color[0],color[1],color[2],color[3])
+        else:
+            node.clearColor()
+        node.setTransparency(pandac.TransparencyAttrib.MAlpha)
+
     # ======================
     # === Core Interface ===
     # ======================
@@ -541,6 +648,8 @@ class BasicStimuli(LatentModule, ABC):
         Override this function with your code.
         * Expect to receive a ModuleCancelled exception during any call to a time-consumption function (like sleep());
           this happens when the experimenter decides to cancel your current run.
+        * This may also be a generator function (see LatentModule), which runs cooperatively on the main thread;
+          all time-consumption functions (and stimuli with a blocking duration) must then be called with yield from.
         * Consider using try/finally in your run() function to clean up any on-screen (or audio) resources when the
           module is cancelled. This is especially true in the advanced use case of implementing parallel sub-tasks that
           are intended to be cancelled at some point by the main task.
@@ -2,6 +2,10 @@ import time
 import os
 import socket
 import sys
+import threading
+import queue
+import atexit
+from meyendtris.framework.eventmarkers.markerlog import open_new_marker_log
 
 global marker_log
 marker_log = None
@@ -12,6 +16,20 @@ lsl_backend = None
 global river_backend
 river_backend = None
 
+# markers are time-stamped by send_marker() and handed to a background thread through
+# this queue, which sends them to the backends; the calling thread never blocks on I/O
+global marker_queue
+marker_queue = queue.SimpleQueue()
+
+global marker_writer
+marker_writer = None
+
+global local_clock
+local_clock = None
+
+# serialises sending to the backends (the writer thread, or the sending threads if there is none)
+send_lock = threading.Lock()
+
 
 
 def init_markers(lsl,logfile,datariver):
@@ -19,25 +37,22 @@ def init_markers(lsl,logfile,datariver):
 
     if lsl:
         try:
-            global lsl_backend
+            global lsl_backend, local_clock
             import pylsl.pylsl as pylsl
             info = pylsl.stream_info("SNAP-Markers","Markers",1,0,pylsl.cf_string,"SNAPmarkers-" + socket.gethostname() + time.asctime())
             lsl_backend = pylsl.stream_outlet(info)
             lsl_backend.pylsl = pylsl
+            local_clock = pylsl.local_clock
             print("The lab streaming layer is ready for sending markers.")
         except:
             print("Error initializing the lab streaming layer backend. You will not be able to send and record event markers via LSL.")
-            
+
     if logfile:
         try:
-            # find a new slot for the logfiles
-            for k in range(10000):
-                fname = 'logs/markerlog-' + str(k) + '.log'
-                if not os.path.exists(fname):
-                    global marker_log
-                    marker_log = open(fname,'w')
-                    break
-            print("A marker logfile has been prepared for logging.")
+            # binary log in a new slot (see markerlog.py), time-stamped with the LSL clock if available
+            global marker_log
+            marker_log = open_new_marker_log('logs', clock = 'time' if local_clock is None else 'lsl')
+            print("A marker logfile has been prepared for logging:", marker_log.path)
         except:
             print("Error initializing the marker logging. Your event markers will not be logged into a file.")
 
@@ -50,18 +65,127 @@ def init_markers(lsl,logfile,datariver):
         except:
             print("Error initializing the DataRiver backend. You will not be able to send and record event markers via DataRiver.")
 
+    if lsl_backend is not None or marker_log is not None or river_backend is not None:
+        start_marker_writer()
+
+
+def send_marker(markercode,timestamp=None):
+    """Global marker sending / logging function.
+
+    The marker is time-stamped here, on the calling thread (with the LSL clock,
+    or with the given timestamp in LSL time), and sent by the marker writer thread.
+    """
+
+    if lsl_backend is None and marker_log is None and river_backend is None:
+        return
+    if timestamp is None and local_clock is not None:
+        timestamp = local_clock()
+    if marker_writer is None:
+        # no writer thread (e.g. backends assigned directly, or after shutdown): sending synchronously,
+        # bypassing the queue, which only the writer thread reads from
+        _send_batch([(markercode, timestamp, time.time())])
+    else:
+        marker_queue.put((markercode, timestamp, time.time()))
+
+
+def start_marker_writer():
+    """Start the background thread that sends queued markers to the backends."""
+
+    global marker_writer
+    if marker_writer is None or not marker_writer.is_alive():
+        marker_writer = threading.Thread(target=_marker_writer_loop, name="MarkerWriter", daemon=True)
+        marker_writer.start()
+
+
+def flush_markers(timeout=5.0):
+    """Wait until all markers sent so far have been passed on to the backends."""
+
+    if marker_writer is None or not marker_writer.is_alive():
+        return
+    done = threading.Event()
+    marker_queue.put(done)
+    done.wait(timeout)
 
-def send_marker(markercode):
-    """Global marker sending / logging function."""
-    
-    global lsl_backend
-    if lsl_backend is not None:
-        lsl_backend.push_sample(lsl_backend.pylsl.vectorstr([str(markercode)]), lsl_backend.pylsl.local_clock(), True)
 
-    global marker_log
+def shutdown_markers(timeout=5.0):
+    """Send all pending markers, stop the writer thread and close the log file."""
+
+    global marker_writer, marker_log
+    if marker_writer is not None and marker_writer.is_alive():
+        marker_queue.put(None)
+        marker_writer.join(timeout)
+    marker_writer = None
     if marker_log is not None:
-        marker_log.write(repr(time.time()) + ': ' + str(markercode) + '\n')
+        marker_log.close()
+        marker_log = None
+
+atexit.register(shutdown_markers)
+
+
+def _drain(item):
+    """Return the given queue item plus all items that are queued right now."""
+
+    items = [item]
+    try:
+        while True:
+            items.append(marker_queue.get_nowait())
+    except queue.Empty:
+        pass
+    return items
+
+
+def _marker_writer_loop():
+    while True:
+        items = _drain(marker_queue.get())
+        running = _write_markers(items)
+        if not running:
+            break
+
+
+def _write_markers(items):
+    """Send a batch of queued markers to all backends; returns False if a stop request was among them."""
+
+    running = True
+    markers = []
+    for item in items:
+        if item is None:
+            running = False
+        elif isinstance(item, threading.Event):
+            _send_batch(markers)
+            markers = []
+            item.set()
+        else:
+            markers.append(item)
+    _send_batch(markers)
+    return running
+
+
+def _send_batch(markers):
+    if not markers:
+        return
+    with send_lock:
+        _send_to_backends(markers)
+
+
+def _send_to_backends(markers):
+    try:
+        if lsl_backend is not None:
+            last = len(markers) - 1
+            for k, (markercode, timestamp, walltime) in enumerate(markers):
+                # pushing through once per batch rather than once per marker
+                lsl_backend.push_sample([str(markercode)], timestamp or 0.0, k == last)
+    except Exception as e:
+        print("Error sending markers via LSL:", e)
+
+    try:
+        if marker_log is not None:
+            marker_log.write([(markercode, walltime if timestamp is None else timestamp) for markercode, timestamp, walltime in markers])
+    except Exception as e:
+        print("Error writing markers to the logfile:", e)
 
-    global river_backend
-    if river_backend is not None:
-        river_backend.send_marker(int(markercode))
+    try:
+        if river_backend is not None:
+            for markercode, timestamp, walltime in markers:
+                river_backend.send_marker(int(markercode))
+    except Exception as e:
+        print("Error sending markers via DataRiver:", e)
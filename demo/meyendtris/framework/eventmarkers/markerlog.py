@@ -0,0 +1,137 @@
+# -*- coding:utf-8 -*-
+"""
+Compact binary marker log.
+
+A marker log consists of two files:
+  markerlog-N.bin      --> a 16-byte header (magic, version, clock), followed by one fixed-size
+                           record per marker: float64 timestamp, uint32 marker id (little endian)
+  markerlog-N.strings  --> the string table: marker id k is the (JSON-encoded) string on line k
+
+Both files are only ever appended to, so a log that was cut short (e.g. by a crash)
+stays readable up to its last complete record. read_marker_log() memory-maps the
+records into a NumPy structured array, so even logs with millions of markers open
+instantly and can be filtered with vectorised operations.
+"""
+import json
+import os
+import re
+import struct
+
+import numpy as np
+
+MAGIC = b'SNAPMLOG'
+VERSION = 1
+CLOCKS = ('time', 'lsl')    # clock of the timestamps: time.time() or LSL local_clock()
+HEADER = struct.Struct('<8sII')
+RECORD = np.dtype([('timestamp', '<f8'), ('marker', '<u4')])
+_record = struct.Struct('<dI')
+
+
+def open_new_marker_log(directory='logs', prefix='markerlog-', clock='time'):
+    """Create a marker log with the next free number in the given directory; returns a MarkerLogWriter."""
+    pattern = re.compile(re.escape(prefix) + r'(\d+)\.')
+    numbers = [int(m.group(1)) for m in map(pattern.match, os.listdir(directory)) if m]
+    k = max(numbers) + 1 if numbers else 0
+    while True:
+        path = os.path.join(directory, prefix + str(k) + '.bin')
+        try:
+            # exclusive creation, in case another process claims the same slot
+            return MarkerLogWriter(path, clock)
+        except FileExistsError:
+            k += 1
+
+
+class MarkerLogWriter(object):
+    """Appends markers to a new binary marker log, interning marker strings."""
+
+    def __init__(self,
+                 path,              # file name of the record file (.bin); the string table goes next to it
+                 clock='time'):     # clock of the timestamps, one of CLOCKS
+        self.path = path
+        self._file = open(path, 'xb')
+        try:
+            self._strings = open(strings_path(path), 'x', encoding='utf-8')
+        except:
+            self._file.close()
+            os.remove(path)
+            raise
+        self._ids = {}              # marker string -> id
+        self._file.write(HEADER.pack(MAGIC, VERSION, CLOCKS.index(clock)))
+
+    def write(self, markers):
+        """Append a batch of (markercode, timestamp) pairs and flush them to disk."""
+        ids = self._ids
+        records = []
+        new = []
+        for markercode, timestamp in markers:
+            marker = str(markercode)
+            markerid = ids.get(marker)
+            if markerid is None:
+                markerid = ids[marker] = len(ids)
+                new.append(json.dumps(marker) + '\n')
+            records.append(_record.pack(timestamp, markerid))
+        if new:
+            # the string table is written first, so that every record refers to a known string
+            self._strings.write(''.join(new))
+            self._strings.flush()
+        self._file.write(b''.join(records))
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+        self._strings.close()
+
+
+class MarkerLog(object):
+    """A marker log opened for reading; records are memory-mapped."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, version, clock = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a marker log (version %d): %s" % (VERSION, path))
+        self.clock = CLOCKS[clock]
+        count = (os.path.getsize(path) - HEADER.size) // RECORD.itemsize
+        if count:
+            self.records = np.memmap(path, dtype=RECORD, mode='r', offset=HEADER.size, shape=(count,))
+        else:
+            self.records = np.empty(0, dtype=RECORD)
+        with open(strings_path(path), encoding='utf-8') as f:
+            self.strings = [json.loads(line) for line in f]
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def timestamps(self):
+        return self.records['timestamp']
+
+    @property
+    def markers(self):
+        """Marker strings of all records, as a NumPy array."""
+        return np.asarray(self.strings, dtype=object)[self.records['marker']]
+
+    def marker_id(self, markercode):
+        """Id of the given marker, or None if it does not occur in the log."""
+        try:
+            return self.strings.index(str(markercode))
+        except ValueError:
+            return None
+
+    def find(self, markercode):
+        """Timestamps of all occurrences of the given marker."""
+        markerid = self.marker_id(markercode)
+        if markerid is None:
+            return np.empty(0)
+        return self.timestamps[self.records['marker'] == markerid]
+
+
+def read_marker_log(path):
+    """Open a binary marker log for reading."""
+    return MarkerLog(path)
+
+
+def strings_path(path):
+    """File name of the string table belonging to the record file path."""
+    return os.path.splitext(path)[0] + '.strings'
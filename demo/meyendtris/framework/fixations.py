@@ -0,0 +1,140 @@
+# -*- coding:utf-8 -*-
+"""
+Streaming fixation detection for gaze data.
+
+FixationDetector groups gaze samples (screen pixels, timestamps in seconds)
+into fixations using one of two classic algorithms:
+  'dispersion' (I-DT) --> a sample belongs to the current fixation if the dispersion of all
+                          its samples, (max x - min x) + (max y - min y), stays within a threshold
+  'velocity' (I-VT)   --> a sample belongs to the current fixation if the gaze velocity since
+                          the previous fixation sample stays below a threshold
+
+A fixation is reported once it lasted for the minimum duration. Each call of
+process() returns the resulting events, in order:
+  FixationEvent('start', ...)   --> a fixation reached the minimum duration
+  FixationEvent('update', ...)  --> the current fixation grew (at most one per call)
+  FixationEvent('end', ...)     --> the fixation ended; gaze has moved elsewhere
+
+Durations are in milliseconds, from the first to the last sample of the
+fixation, so they do not depend on the frame rate or on how the samples were
+chunked. Samples that do not fit the current fixation only end it once such
+samples have continued for the given tolerance; shorter excursions (noise
+spikes, tracking glitches) are ignored. Invalid (NaN) samples are skipped.
+"""
+import collections
+import math
+
+FixationEvent = collections.namedtuple('FixationEvent', 'kind start duration x y')
+FixationEvent.__doc__ = "Fixation event; start in seconds, duration in milliseconds, x/y the centroid in pixels."
+
+
+class FixationDetector(object):
+    """Online I-DT / I-VT fixation detector that emits start, update and end events."""
+
+    def __init__(self,
+                 method='dispersion',   # 'dispersion' (I-DT) or 'velocity' (I-VT)
+                 dispersion=50.0,       # maximum dispersion of a fixation in pixels (I-DT)
+                 velocity=1000.0,       # maximum gaze velocity within a fixation in pixels per second (I-VT)
+                 min_duration=50.0,     # minimum duration in ms before a fixation is reported
+                 tolerance=30.0):       # deviating samples are ignored until they continue for this many ms
+        if method not in ('dispersion', 'velocity'):
+            raise ValueError("Unknown fixation detection method: %s" % method)
+        self.method = method
+        self.dispersion = dispersion
+        self.velocity = velocity
+        self.min_duration = min_duration
+        self.tolerance = tolerance
+        self.reset()
+
+    def reset(self):
+        """Forget the current fixation."""
+        self.start = None           # timestamp of the first sample of the current (candidate) fixation
+        self.last = None            # timestamp of its last sample
+        self.confirmed = False      # whether the current fixation lasted long enough to be reported
+        self._outlier = None        # timestamp of the first sample of a run of deviating samples
+        self._updated = False       # whether the confirmed fixation grew since the last event
+
+    @property
+    def duration(self):
+        """Duration of the current fixation in ms (0 if there is none)."""
+        if self.start is None:
+            return 0.0
+        return (self.last - self.start) * 1000.0
+
+    @property
+    def current(self):
+        """The current fixation as an 'update' event, or None if no fixation is in progress."""
+        if not self.confirmed:
+            return None
+        return self._event('update')
+
+    def process(self, x, y, timestamps):
+        """Process a chunk of samples (sequences of equal length); returns a list of FixationEvents."""
+        events = []
+        if hasattr(x, 'tolist'):
+            x, y, timestamps = x.tolist(), y.tolist(), timestamps.tolist()
+        for sx, sy, t in zip(x, y, timestamps):
+            if sx != sx or sy != sy:
+                continue
+            self._push(sx, sy, t, events)
+        if self._updated:
+            self._updated = False
+            events.append(self._event('update'))
+        return events
+
+    # ========================
+    # === Internal Helpers ===
+    # ========================
+
+    def _push(self, x, y, t, events):
+        if self.start is None:
+            self._begin(x, y, t, events)
+        elif self._fits(x, y, t):
+            self._add(x, y, t)
+            self._outlier = None
+            self._grown(events)
+        else:
+            if self._outlier is None:
+                self._outlier = t
+            if (t - self._outlier) * 1000.0 >= self.tolerance:
+                if self.confirmed:
+                    self._updated = False
+                    events.append(self._event('end'))
+                self._begin(x, y, t, events)
+
+    def _fits(self, x, y, t):
+        if self.method == 'dispersion':
+            return (max(self._maxx, x) - min(self._minx, x)) + (max(self._maxy, y) - min(self._miny, y)) <= self.dispersion
+        return math.hypot(x - self._lastx, y - self._lasty) <= self.velocity * (t - self.last)
+
+    def _begin(self, x, y, t, events):
+        self.start = t
+        self.confirmed = False
+        self._outlier = None
+        self._updated = False
+        self._minx = self._maxx = x
+        self._miny = self._maxy = y
+        self._sumx = 0.0
+        self._sumy = 0.0
+        self._count = 0
+        self._add(x, y, t)
+        self._grown(events)
+
+    def _add(self, x, y, t):
+        self.last = t
+        self._lastx, self._lasty = x, y
+        self._minx, self._maxx = min(self._minx, x), max(self._maxx, x)
+        self._miny, self._maxy = min(self._miny, y), max(self._maxy, y)
+        self._sumx += x
+        self._sumy += y
+        self._count += 1
+
+    def _grown(self, events):
+        if self.confirmed:
+            self._updated = True
+        elif self.duration >= self.min_duration:
+            self.confirmed = True
+            events.append(self._event('start'))
+
+    def _event(self, kind):
+        return FixationEvent(kind, self.start, self.duration, self._sumx / self._count, self._sumy / self._count)
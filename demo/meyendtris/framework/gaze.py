@@ -0,0 +1,83 @@
+# -*- coding:utf-8 -*-
+"""
+Chunked ingestion of gaze (or cursor position) streams from LSL.
+
+GazeInlet pulls every sample that arrived since the previous call in as few
+pull_chunk() calls as possible, with liblsl writing straight into a
+preallocated NumPy buffer, so no Python objects are created per sample. After
+each pull() the backlog is available as array views:
+  samples      --> (n, channels) array of all samples pulled
+  timestamps   --> (n,) array of their LSL timestamps, on the local LSL clock
+  x, y         --> (n,) views of the x and y position channels
+
+The views are only valid until the next pull(); copy them to keep them.
+
+The inlet's clock synchronisation is switched on, so that the timestamps of a
+stream from another machine (e.g. a remote eye tracker) are comparable with
+local_clock(), e.g. when measuring dwell times up to the current time.
+"""
+import numpy as np
+
+
+class GazeInlet(object):
+    """Pulls the backlog of an LSL inlet into preallocated NumPy buffers once per frame."""
+
+    def __init__(self,
+                 inlet,             # pylsl stream inlet of a numeric gaze/position stream
+                 xpos=0,            # index of the x screen position in each sample
+                 ypos=1,            # index of the y screen position in each sample
+                 capacity=256,      # initial number of samples the buffer can hold; grows when exceeded
+                 clocksync=True):   # whether to map the timestamps to the local clock (liblsl's time correction)
+        self.inlet = inlet
+        self.xpos = xpos
+        self.ypos = ypos
+        self.channels = inlet.channel_count
+        if clocksync and hasattr(inlet, 'set_postprocessing'):
+            from pylsl import proc_clocksync
+            inlet.set_postprocessing(proc_clocksync)
+        self._buffer = np.zeros((capacity, self.channels), dtype=np.dtype(inlet.value_type))
+        self._timestamps = np.zeros(capacity)
+        self.count = 0                      # number of samples pulled during the last pull()
+        self.total = 0                      # number of samples pulled since creation
+        self._views()
+
+    def _views(self):
+        n = self.count
+        self.samples = self._buffer[:n]
+        self.timestamps = self._timestamps[:n]
+        self.x = self._buffer[:n, self.xpos]
+        self.y = self._buffer[:n, self.ypos]
+
+    def _grow(self):
+        capacity = 2 * len(self._buffer)
+        buffer = np.zeros((capacity, self.channels), dtype=self._buffer.dtype)
+        buffer[:len(self._buffer)] = self._buffer
+        timestamps = np.zeros(capacity)
+        timestamps[:len(self._timestamps)] = self._timestamps
+        self._buffer, self._timestamps = buffer, timestamps
+
+    def pull(self):
+        """Pull all samples available right now (without blocking); returns their number."""
+        n = 0
+        while True:
+            if n == len(self._buffer):
+                self._grow()
+            free = len(self._buffer) - n
+            _, timestamps = self.inlet.pull_chunk(timeout=0.0, max_samples=free, dest_obj=self._buffer[n:])
+            received = len(timestamps)
+            self._timestamps[n:n + received] = timestamps
+            n += received
+            if received < free:
+                break
+        self.count = n
+        self.total += n
+        self._views()
+        return n
+
+    @property
+    def last(self):
+        """The (x, y) position of the most recent sample of the last pull(), or None."""
+        if not self.count:
+            return None
+        sample = self._buffer[self.count - 1]
+        return float(sample[self.xpos]), float(sample[self.ypos])
@@ -5,10 +5,14 @@
 
 from abc import ABC, abstractmethod
 import meyendtris.framework.base_classes
-import meyendtris.framework.basicstimuli
-import threading, time, traceback
+from meyendtris.framework.pool import ObjectRegistry
+from meyendtris.framework.profiling import profiler
+import inspect, threading, time, traceback
 import warnings
 
+# the clock of all time-consumption functions and tick(); monotonic, in seconds
+clock = time.perf_counter
+
 class LatentModule(
     meyendtris.framework.base_classes.TickModule,
     meyendtris.framework.base_classes.TimeConsumingModule):
@@ -30,6 +34,13 @@ class LatentModule(
     elaborate hierarchy of event handlers, sequences and intervals (as usual in Panda3d), or you
     can implement the majority of code as "regular code" with interleaved time-consumption functions,
     or mix these styles.
+
+    If run() is a generator function, the module runs cooperatively on the main thread instead of in
+    a thread of its own: it is advanced from tick(), and every time-consumption function (including
+    stimuli with a blocking duration) returns a generator that has to be delegated to with yield from,
+    e.g. "yield from self.sleep(1)" or "key = yield from self.waitfor('space')". This avoids the lock
+    handoffs and thread switches per frame and makes the wake-up latency deterministic (the frame
+    closest to the resume time).
     """
 
     def __init__(self,
@@ -46,10 +57,12 @@ class LatentModule(
         super().__init__()
 
         self._thread = None             # the internal runner thread; None if not running
+        self._coroutine = None          # the run() generator of a cooperative module; None if not running
+        self._cooperative = False       # whether run() is a generator function, driven from tick() on the main thread
         self._resumecond = threading.Condition(meyendtris.framework.base_classes.shared_lock) # condition variable that signals that the sleep period is over
         self._cancelled = False         # signals whether cancel() has been invoked (i.e. that run() shall terminate at the next opportunity)
 
-        now = time.time()
+        now = clock()
         self._resumeat = now            # the point in time when the currently running time-consumption function should resume (if any)
         self._exectime = now            # the time point when the last time-consumption function was invoked
         self._lasttick = now            # the time point of the last tick()
@@ -63,7 +76,9 @@ class LatentModule(
         
         self._subtasks = []             # optional list of any semi-parallel sub-tasks; tick and cancel are propagated down to them
         self._messages = []             # queue of messages to be sent off at the next tick
-        self._to_destroy = []           # list of objects to .destroy() upon cancel
+        self._to_destroy = ObjectRegistry() # objects to .destroy() upon cancel
+        self._notified = None           # time at which tick() signalled the end of a wait to the run() thread (when profiling)
+        self.error = None               # the exception that ended run(), if it failed (checked by the launcher)
 
     def launch(self,newtask,inherit_timing_parameters=True):
         """
@@ -88,20 +103,14 @@ class LatentModule(
         Sleep for a number of seconds; optionally execute some tick function at every frame.
         Event handlers may fire during this time, and content is rendered every frame.
         """
-        self._exectime = time.time()
-        if self._make_up_for_lost_time and abs(self._resumeat - self._exectime) < self._max_compensated_time:
-            self._resumeat = self._resumeat + duration
-        else:
-            self._resumeat = self._exectime + duration
+        return self._latent(self._sleep(duration,cur_tick))
 
-        self._cur_tick = cur_tick
-        if self._cancelled:
-            # make sure that run() terminates
-            raise self.ModuleCancelled
-        self._resumecond.wait(self._resumeat - self._exectime)
-        if self._cancelled:
-            # make sure that run() terminates
-            raise self.ModuleCancelled
+    def sleep_until(self,deadline,cur_tick=None):
+        """
+        Sleep until the given point in time (on the clock of this module, see FrameScheduler);
+        resumes at the frame closest to the deadline, or at the next frame if it has passed.
+        """
+        return self._latent(self._sleep_until(deadline,cur_tick))
 
     def waitfor(self,eventid,duration=100000.0,cur_tick=None):            
         """
@@ -111,6 +120,9 @@ class LatentModule(
         Returns None if no event has happened and otherwise the time when the 
         event occurred (relative to the beginning of the wait period).
         """
+        return self._latent(self._waitfor(eventid,duration,cur_tick))
+
+    def _waitfor(self,eventid,duration,cur_tick):
         # register the event handler(s)
         self._events_received = []
         self._times_received = []
@@ -121,7 +133,7 @@ class LatentModule(
             # call sleep
             if self.implicit_markers:
                 self.marker(228)
-            self.sleep(duration,cur_tick)
+            yield from self._sleep(duration,cur_tick)
 
         finally:
             self.ignore(eventid)
@@ -141,6 +153,9 @@ class LatentModule(
         id of the event that happened first and the time when it occurred
         (relative to the beginning of the wait period).
         """
+        return self._latent(self._waitfor_multiple(eventids,duration,cur_tick))
+
+    def _waitfor_multiple(self,eventids,duration,cur_tick):
         # register the event handler(s)
         self._events_received = []
         self._times_received = []
@@ -154,7 +169,7 @@ class LatentModule(
             # call sleep
             if self.implicit_markers:
                 self.marker(228)
-            self.sleep(duration,cur_tick)
+            yield from self._sleep(duration,cur_tick)
 
         finally:
             for eventid in eventids:
@@ -174,8 +189,11 @@ class LatentModule(
         Returns a list of times at which the event occurred (relative to the 
         beginning of the watch period), or an empty list if it did not occur.
         """
+        return self._latent(self._watchfor(eventid,duration,cur_tick))
+
+    def _watchfor(self,eventid,duration,cur_tick):
         try:
-            self._measuretime = time.time()
+            self._measuretime = clock()
             # register an event handler
             self._received_dict = {eventid:[]}
             self._events_received = []
@@ -184,7 +202,7 @@ class LatentModule(
             # call sleep
             if self.implicit_markers:
                 self.marker(228)
-            self.sleep(duration,cur_tick)
+            yield from self._sleep(duration,cur_tick)
             
         finally:
             # unregister the handler
@@ -203,8 +221,11 @@ class LatentModule(
         occurred (relative to the beginning of the watch period). If list_only is given
         as true, instead a list of event codes in order of appearance is returned 
         """
+        return self._latent(self._watchfor_multiple(eventids,duration,cur_tick,list_only))
+
+    def _watchfor_multiple(self,eventids,duration,cur_tick,list_only):
         try:
-            self._measuretime = time.time()
+            self._measuretime = clock()
             # register event handlers and reset the dict
             self._received_dict = {}
             self._events_received = []
@@ -215,7 +236,7 @@ class LatentModule(
             # call sleep
             if self.implicit_markers:
                 self.marker(228)
-            self.sleep(duration,cur_tick)
+            yield from self._sleep(duration,cur_tick)
             
         finally:
             # unregister the handlers
@@ -239,7 +260,7 @@ class LatentModule(
         results = watchfor_multiple_end(h);
         """
         # register event handlers and reset the dict
-        self._measuretime = time.time()        
+        self._measuretime = clock()        
         self._received_dict = {}
         self._events_received = []
         for eventid in eventids:
@@ -268,13 +289,13 @@ class LatentModule(
         """
         Resume from a time-consumption function, e.g., in response to some event.
         """
-        self._resumeat = time.time()
+        self._resumeat = clock()
 
     def consumed_duration(self):
         """
         The amount of time that has been consumed since the most recent time-consumption function was entered.
         """
-        return time.time() - self._exectime
+        return clock() - self._exectime
     
 
     # ==============================================
@@ -296,16 +317,28 @@ class LatentModule(
         """
         Implementation of the start() interface, see TickModule.
         """
+        self._cooperative = inspect.isgeneratorfunction(self.run)
+        if self._cooperative:
+            if self._coroutine is None:
+                self._cancelled = False
+                self.error = None
+                self._resumeat = clock()
+                self._subtasks = []
+                # run on the main thread until the first time-consumption function
+                self._coroutine = self.run()
+                self._step()
+            return
         try:
             meyendtris.framework.base_classes.shared_lock.acquire()
             #framework.tickmodule.engine_lock.acquire()
             if self._thread is None:
                 # create the runner thread and launch it
+                self.error = None
                 self._thread = threading.Thread(target=self._run_wrap)
                 self._thread.daemon = True
                 self._thread.start()
                 self._cancelled = False
-                self._resumeat = time.time()
+                self._resumeat = clock()
                 # make sure that the sub-tasks are clean
                 self._subtasks = []  
         finally:
@@ -321,6 +354,20 @@ class LatentModule(
             t.cancel()
         self._subtasks = []
 
+        if self._coroutine is not None:
+            # cancel a cooperative run() at its current time-consumption function
+            self._cancelled = True
+            coroutine, self._coroutine = self._coroutine, None
+            try:
+                coroutine.throw(self.ModuleCancelled)
+            except (StopIteration, self.ModuleCancelled):
+                pass
+            except Exception as inst:
+                print("Exception during cancel():")
+                print(inst)
+                traceback.print_exc()
+            coroutine.close()
+
         meyendtris.framework.base_classes.shared_lock.acquire()
         #framework.tickmodule.engine_lock.acquire()
                 
@@ -339,8 +386,7 @@ class LatentModule(
             meyendtris.framework.base_classes.shared_lock.release()
 
         # finally destroy all objects in self._to_destroy (in reverse order)
-        self._to_destroy.reverse()
-        for e in self._to_destroy:
+        for e in self._to_destroy.drain():
             try:
                 e.destroy()
             except Exception as err:
@@ -350,16 +396,35 @@ class LatentModule(
         """
         Implementation of the tick() interface, see TickModule.
         """
+        if self._cooperative:
+            # run() is advanced from here on the main thread, no locking needed
+            self._tick()
+            return
         try:
-            meyendtris.framework.base_classes.shared_lock.acquire()
+            if profiler.enabled:
+                start = clock()
+                meyendtris.framework.base_classes.shared_lock.acquire()
+                profiler.record('lock_wait', clock() - start)
+            else:
+                meyendtris.framework.base_classes.shared_lock.acquire()
             #framework.tickmodule.engine_lock.acquire()
-            
+            self._tick()
+        finally:
+            #framework.tickmodule.engine_lock.release()
+            meyendtris.framework.base_classes.shared_lock.release()
+
+    def _tick(self):
+        """
+        Internal helper: the work of tick().
+        """
+        try:
             # determine the inter-frame time delta (if it's not a hickup)
-            now = time.time()
+            now = clock()
             delta = now - self._lasttick
             if delta < self._max_inter_frame_interval:
                 self._frametime = delta
             self._lasttick = now
+            profiling = profiler.enabled
             
             # send all queued messages
             for msg in self._messages:
@@ -369,21 +434,38 @@ class LatentModule(
                     warnings.warn("Failing sending messages")
                     break
             self._messages = []          
+            if profiling:
+                mark = clock()
+                profiler.record('messages', mark - now)
                         
             # if we are closer to the frame at which we should resume than the one before, end the sleep period 
+            phase = None
             if now > self._resumeat - self._frametime/2:
                 # time-consumption function may finish now
-                self._resumecond.notify()
+                if not self._cooperative:
+                    if profiling:
+                        self._notified = mark
+                    self._resumecond.notify()
+                elif self._coroutine is not None:
+                    phase = 'run_step'
+                    self._step()
             elif self._cur_tick is not None:
                 # invoke current tick function
+                phase = 'tick_callback'
                 if self._cur_tick(delta) is False:
                     self.resume()
             elif self._default_tick is not None:
                 # invoke default tick function
+                phase = 'tick_callback'
                 if self._default_tick(delta) is False:
                     self.resume()
+            if profiling and phase is not None:
+                end = clock()
+                profiler.record(phase, end - mark)
+                mark = end
                 
             # propagate tick to sub-tasks    
+            profile_subtasks = profiling and self._subtasks
             for t in self._subtasks[:]:
                 if not t.is_alive():
                     # optimization: remove from subtasks if not alive anymore
@@ -391,15 +473,14 @@ class LatentModule(
                 else:
                     # invoke tick
                     t.tick()
+            if profile_subtasks:
+                profiler.record('subtasks', clock() - mark)
 
         except Exception as inst:
             print("Exception during tick():")
             print(inst)
             traceback.print_exc()
             raise
-        finally:
-            #framework.tickmodule.engine_lock.release()
-            meyendtris.framework.base_classes.shared_lock.release()
         
     def prune(self):
         """
@@ -413,7 +494,7 @@ class LatentModule(
 
     def is_alive(self):
         """ Check whether the current module is (still) running."""
-        return self._thread is not None    
+        return self._thread is not None or self._coroutine is not None
 
 
     class ModuleCancelled(Exception):
@@ -424,6 +505,71 @@ class LatentModule(
         pass
 
         
+    def _latent(self,steps):
+        """
+        Internal helper for the time-consumption functions, given as generators that yield whenever they wait
+        for self._resumeat: a cooperative module gets the generator to delegate to (yield from), otherwise it
+        is run to completion here, blocking the module thread until tick() signals the end of each wait.
+        """
+        if self._cooperative:
+            return steps
+        try:
+            while True:
+                next(steps)
+                self._resumecond.wait(self._resumeat - self._exectime)
+                if self._notified is not None:
+                    profiler.record('wake_latency', clock() - self._notified)
+                    self._notified = None
+        except StopIteration as result:
+            return result.value
+
+    def _sleep(self,duration,cur_tick=None):
+        """
+        Internal time-consumption generator behind sleep().
+        """
+        self._exectime = clock()
+        if self._make_up_for_lost_time and abs(self._resumeat - self._exectime) < self._max_compensated_time:
+            self._resumeat = self._resumeat + duration
+        else:
+            self._resumeat = self._exectime + duration
+        yield from self._wait(cur_tick)
+
+    def _sleep_until(self,deadline,cur_tick=None):
+        """
+        Internal time-consumption generator behind sleep_until().
+        """
+        self._exectime = clock()
+        self._resumeat = deadline
+        yield from self._wait(cur_tick)
+
+    def _wait(self,cur_tick):
+        """
+        Internal helper: wait (yield) until self._resumeat, executing cur_tick at every frame.
+        """
+        self._cur_tick = cur_tick
+        if self._cancelled:
+            # make sure that run() terminates
+            raise self.ModuleCancelled
+        yield
+        if self._cancelled:
+            # make sure that run() terminates
+            raise self.ModuleCancelled
+
+    def _step(self):
+        """
+        Internal helper: advance a cooperative run() to its next time-consumption function.
+        """
+        try:
+            next(self._coroutine)
+        except (StopIteration, self.ModuleCancelled):
+            self._coroutine = None
+        except Exception as e:
+            print("Exception during run():")
+            print(e)
+            traceback.print_exc()
+            self.error = e
+            self._coroutine = None
+
     def _run_wrap(self):
         """
         Internal wrapper around the run function; executed in a separate thread.
@@ -440,6 +586,7 @@ class LatentModule(
             print("Exception during run():")
             print(e)
             traceback.print_exc()
+            self.error = e
         finally:
             # make sure that we release the lock and reset the state
             self._thread = None
@@ -451,7 +598,7 @@ class LatentModule(
         """
         Internal event handler for waitfor (triggers resume).
         """
-        self._times_received.append(time.time()-self._exectime)
+        self._times_received.append(clock()-self._exectime)
         self.marker(229)
         self._events_received.append(eventid)
         self.resume()
@@ -461,7 +608,7 @@ class LatentModule(
         """
         Internal event handler for watchfor(_multiple).
         """
-        self._received_dict[eventid].append(time.time()-self._measuretime)
+        self._received_dict[eventid].append(clock()-self._measuretime)
         idx = [i for i,x in enumerate(self._received_dict.keys()) if x == eventid]
         self.marker(230+idx[0])
         self._events_received.append(eventid)
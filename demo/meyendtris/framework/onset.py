@@ -0,0 +1,118 @@
+# -*- coding:utf-8 -*-
+"""
+Stimulus onset times taken at the buffer flip.
+
+A stimulus created during a frame first reaches the screen when the frame is
+rendered and the back buffer is flipped, which can be up to a frame period after
+the Python call that created it. FlipClock resolves onsets at that point: a task
+of the Panda3D task manager that runs right after rendering (after igLoop)
+flips the buffers of the frame (which otherwise would only happen at the start
+of the next frame, with auto-flip off), reads the clock, and stamps all onsets
+registered during the frame with that time, including their markers. With
+video sync enabled, the flip returns at the vertical retrace, so that the time
+corresponds to what a photodiode on the screen would measure (up to the
+display's own latency).
+
+Onsets are stamped with the LSL clock if the LSL marker backend is active (the
+same clock as send_marker's timestamps), and with time.perf_counter otherwise.
+"""
+import threading
+import time
+
+from meyendtris.framework.eventmarkers import eventmarkers
+
+POST_RENDER_SORT = 55       # after igLoop (50), before the audio update (60)
+
+
+def flip_time_clock():
+    """The clock of the onset times (the LSL clock if markers are sent via LSL)."""
+    return eventmarkers.local_clock() if eventmarkers.local_clock is not None else time.perf_counter()
+
+
+class Onset(object):
+    """Handle of a stimulus onset; .time is set at the flip of the frame that first shows the stimulus."""
+
+    def __init__(self, markers=(), frame=None):
+        self.markers = list(markers)    # markers to send with the flip time
+        self.frame = frame              # number of the frame during which the stimulus was created
+        self.time = None                # flip time (see flip_time_clock), None until resolved
+        self.flip_frame = None          # number of the frame that was flipped
+        self._callbacks = []
+
+    @property
+    def resolved(self):
+        return self.time is not None
+
+    def add_callback(self, callback):
+        """Call callback(onset) once the onset is resolved (right away if it already is)."""
+        if self.resolved:
+            callback(self)
+        else:
+            self._callbacks.append(callback)
+
+    def _resolve(self, flip_time, frame):
+        self.time = flip_time
+        self.flip_frame = frame
+        for code in self.markers:
+            eventmarkers.send_marker(code, flip_time if eventmarkers.local_clock is not None else None)
+        for callback in self._callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                print("Error in onset callback:", e)
+        self._callbacks = []
+
+    def __repr__(self):
+        return "Onset(markers=%r, frame=%r, time=%r)" % (self.markers, self.frame, self.time)
+
+
+class FlipClock(object):
+    """Resolves registered onsets at the buffer flip of the frame they were registered in."""
+
+    def __init__(self,
+                 base,                  # the ShowBase instance
+                 flip=True):            # whether to flip the buffers right after rendering to take the time (otherwise the time after rendering is taken)
+        self._base = base
+        self.flip = flip
+        self._pending = []
+        self._lock = threading.Lock()
+        self._task = base.taskMgr.add(self._post_render, 'FlipClock.post_render', sort=POST_RENDER_SORT)
+        self.last_flip = None           # time of the last flip at which onsets were resolved
+
+    def onset(self, markers=()):
+        """Register an onset for the stimuli created in the current frame; returns its Onset handle."""
+        onset = Onset(markers, self._base.clock.getFrameCount())
+        with self._lock:
+            self._pending.append(onset)
+        return onset
+
+    def pending(self):
+        """Number of onsets waiting for a flip."""
+        return len(self._pending)
+
+    def destroy(self):
+        self._base.taskMgr.remove(self._task)
+
+    def _post_render(self, task):
+        if not self._pending:
+            return task.cont
+        if self.flip:
+            self._base.graphicsEngine.flipFrame()
+        flip_time = flip_time_clock()
+        # igLoop has advanced the frame counter: onsets of the frame just rendered have a smaller number
+        frame = self._base.clock.getFrameCount()
+        with self._lock:
+            due = [onset for onset in self._pending if onset.frame < frame]
+            self._pending = [onset for onset in self._pending if onset.frame >= frame]
+        for onset in due:
+            onset._resolve(flip_time, frame - 1)
+        self.last_flip = flip_time
+        return task.cont
+
+
+def flip_clock(base):
+    """The FlipClock of base (created on first use)."""
+    clock = getattr(base, '_flip_clock', None)
+    if clock is None:
+        clock = base._flip_clock = FlipClock(base)
+    return clock
@@ -0,0 +1,136 @@
+# -*- coding:utf-8 -*-
+"""
+Reusable stimulus objects.
+
+Creating an OnscreenText or OnscreenImage allocates new scene graph nodes (and
+geometry), and destroying it releases them again; when that happens every frame
+(e.g., for visual noise), the allocations and the resulting garbage show up as
+frame time spikes. StimulusPool instead keeps pre-built nodes around: acquire()
+hands out a hidden node after resetting its properties and shows it, and
+destroying the node (through its destroy() method, as for any stimulus) hides
+it and puts it back into the pool. The nodes are really destroyed by clear().
+Since a node is reused under the same identity, each acquire() stamps it with
+a new pool_generation, by which delayed destructions (e.g. at the end of a
+stimulus duration) can tell whether the node still shows the same stimulus.
+
+ObjectRegistry is an insertion-ordered set of objects with O(1) add and remove,
+used by the modules to keep track of the objects to destroy upon cancel.
+"""
+
+
+class ObjectRegistry(object):
+    """Insertion-ordered set of objects (by identity) with O(1) add and remove."""
+
+    def __init__(self):
+        self._objects = {}              # id(object) -> object, in insertion order
+
+    def append(self, obj):
+        """Add an object (adding it again has no effect)."""
+        self._objects[id(obj)] = obj
+
+    add = append
+
+    def remove(self, obj):
+        """Remove an object; raises ValueError if it is not in the registry."""
+        if self._objects.pop(id(obj), None) is None:
+            raise ValueError("object not in registry")
+
+    def discard(self, obj):
+        """Remove an object if it is in the registry."""
+        self._objects.pop(id(obj), None)
+
+    def drain(self):
+        """Remove all objects; returns them in reverse order of addition."""
+        objects = list(self._objects.values())
+        self._objects.clear()
+        objects.reverse()
+        return objects
+
+    def __contains__(self, obj):
+        return id(obj) in self._objects
+
+    def __iter__(self):
+        return iter(list(self._objects.values()))
+
+    def __len__(self):
+        return len(self._objects)
+
+
+class StimulusPool(object):
+    """Pool of pre-built stimulus nodes that are shown and hidden instead of created and destroyed."""
+
+    def __init__(self,
+                 factory,               # function creating a new node
+                 reset,                 # function reset(node, **properties) applying the properties of a stimulus to a node
+                 capacity=64):          # maximum number of idle nodes kept; further released nodes are destroyed
+        self._factory = factory
+        self._reset = reset
+        self.capacity = capacity
+        self._free = []                 # idle (hidden) nodes
+        self._used = {}                 # id(node) -> node for nodes handed out
+        self.created = 0                # number of nodes created
+        self.reused = 0                 # number of acquire() calls served by an idle node
+        self.acquisitions = 0           # number of acquire() calls; each node's pool_generation is its last one
+
+    def reserve(self, count):
+        """Pre-build nodes until at least count of them are idle."""
+        while len(self._free) < min(count, self.capacity):
+            self._free.append(self._new())
+
+    def acquire(self, **properties):
+        """A node with the given properties, shown on the screen; destroy() returns it to the pool."""
+        if self._free:
+            node = self._free.pop()
+            self.reused += 1
+        else:
+            node = self._new()
+        self.acquisitions += 1
+        node.pool_generation = self.acquisitions
+        self._reset(node, **properties)
+        node.show()
+        self._used[id(node)] = node
+        return node
+
+    def release(self, node):
+        """Hide a node and return it to the pool (called by the node's destroy())."""
+        if self._used.pop(id(node), None) is None or node.isEmpty():
+            # released twice, or removed from the scene graph by other means
+            return
+        node.hide()
+        if len(self._free) < self.capacity:
+            self._free.append(node)
+        else:
+            self._destroy(node)
+
+    def release_all(self):
+        """Return all nodes that are handed out to the pool."""
+        for node in list(self._used.values()):
+            self.release(node)
+
+    def clear(self):
+        """Destroy all nodes of the pool, including the ones that are handed out."""
+        for node in self._free + list(self._used.values()):
+            self._destroy(node)
+        self._free = []
+        self._used = {}
+
+    def stats(self):
+        """Pool statistics as a dict."""
+        return dict(created=self.created, reused=self.reused, idle=len(self._free), used=len(self._used))
+
+    def __len__(self):
+        return len(self._free) + len(self._used)
+
+    # --- internal ---
+    def _new(self):
+        node = self._factory()
+        node.hide()
+        # destroying a pooled node returns it to the pool
+        node.destroy = lambda: self.release(node)
+        self.created += 1
+        return node
+
+    @staticmethod
+    def _destroy(node):
+        del node.destroy
+        node.destroy()
@@ -0,0 +1,261 @@
+# -*- coding:utf-8 -*-
+"""
+Opt-in timing instrumentation of the main loop and of LatentModule.tick().
+
+When profiler.enabled is set (e.g., via the launcher's --PROFILE option), the
+framework records the duration of the phases below into fixed-bucket
+histograms, at the cost of a few clock reads per frame; when disabled, each
+instrumented place costs a single attribute check.
+
+    lock_wait       tick() waiting for the shared lock (i.e., for the run() thread to reach a wait)
+    messages        dispatch of the messages queued for the frame
+    tick_callback   the current (or default) tick function
+    run_step        advancing a cooperative run() to its next wait
+    subtasks        ticking the sub-tasks
+    wake_latency    time from the end of a wait (signalled in tick) until the run() thread continues
+    render          rendering the frame (the igLoop task)
+    main_lock_wait  the main loop waiting for the shared lock before a frame
+    frame           one step of the task manager (the whole frame)
+
+Histogram buckets are log-linear as in HDR histograms: values are counted in
+microseconds, exactly below 2**bits and with a relative precision of
+2**-(bits-1) above, up to a fixed maximum, so that histograms have a constant
+size, can be merged by adding the counts, and percentiles are accurate to the
+bucket width. The launcher publishes the profiler's histograms once per second
+on the PUB socket of the control plane (topic b'profile', see server.py), where
+they can be summarised with
+
+    python -m meyendtris.framework.profiling tcp://hostname:18813
+"""
+import argparse
+import array
+import contextlib
+import json
+import math
+import time
+
+TOPIC = b'profile'
+PHASES = ('lock_wait', 'messages', 'tick_callback', 'run_step', 'subtasks', 'wake_latency',
+          'render', 'main_lock_wait', 'frame')
+
+
+class Histogram(object):
+    """Fixed-bucket log-linear histogram of durations (recorded in seconds, counted in microseconds)."""
+
+    def __init__(self,
+                 bits=5,                    # sub-bucket bits: relative precision of 2**-(bits-1) (~6% for 5)
+                 highest=60.0):             # highest value that is counted exactly in its bucket, in seconds; larger values go into the last bucket
+        self.bits = bits
+        self.highest = highest
+        self._half = 1 << (bits - 1)
+        self.counts = array.array('Q', [0] * (self._index(int(highest * 1e6)) + 1))
+        self.reset()
+
+    def reset(self):
+        for k in range(len(self.counts)):
+            self.counts[k] = 0
+        self.count = 0
+        self.total = 0.0                    # sum of all values in seconds
+        self.min = math.inf
+        self.max = 0.0
+
+    def record(self, seconds):
+        """Count one duration."""
+        index = min(self._index(int(seconds * 1e6)), len(self.counts) - 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other):
+        """Add the counts of another histogram with the same layout."""
+        if (other.bits, len(other.counts)) != (self.bits, len(self.counts)):
+            raise ValueError("Histograms have different bucket layouts")
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, p):
+        """The value (upper end of its bucket, in seconds) below which p percent of the durations lie."""
+        if not self.count:
+            return 0.0
+        rank = max(1, int(math.ceil(self.count * p / 100.0)))
+        seen = 0
+        last = len(self.counts) - 1
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                # (the last bucket also holds all values beyond highest)
+                return self.max if index == last else min(self._upper(index) / 1e6, self.max)
+        return self.max
+
+    def summary(self):
+        """The statistics in ms, as a dict."""
+        return dict(count=self.count, mean=self.mean * 1000, min=(self.min if self.count else 0.0) * 1000,
+                    p50=self.percentile(50) * 1000, p90=self.percentile(90) * 1000, p99=self.percentile(99) * 1000,
+                    p999=self.percentile(99.9) * 1000, max=self.max * 1000)
+
+    def to_dict(self):
+        """Compact representation (non-empty buckets only), e.g. for sending as JSON."""
+        return dict(bits=self.bits, highest=self.highest, count=self.count, total=self.total,
+                    min=self.min if self.count else None, max=self.max,
+                    buckets=[[index, count] for index, count in enumerate(self.counts) if count])
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data['bits'], data['highest'])
+        for index, count in data['buckets']:
+            histogram.counts[index] = count
+        histogram.count = data['count']
+        histogram.total = data['total']
+        histogram.min = math.inf if data['min'] is None else data['min']
+        histogram.max = data['max']
+        return histogram
+
+    # --- internal ---
+    def _index(self, value):
+        magnitude = max(value.bit_length() - self.bits, 0)
+        return magnitude * self._half + (value >> magnitude)
+
+    def _upper(self, index):
+        # exclusive upper bound of a bucket in microseconds
+        if index < 2 * self._half:
+            return index + 1
+        magnitude = (index >> (self.bits - 1)) - 1
+        return (index - magnitude * self._half + 1) << magnitude
+
+
+class Profiler(object):
+    """Per-phase duration histograms; records only while enabled."""
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.enabled = False
+        self.histograms = {}
+        self.since = clock()                # time of the last reset
+        self._render_tasks = None
+        self._render_start = None
+
+    def enable(self, base=None):
+        """Start recording; with a ShowBase, the render time of each frame is recorded as well."""
+        self.enabled = True
+        if base is not None and self._render_tasks is None:
+            self._render_tasks = (base.taskMgr.add(self._before_render, 'Profiler.before_render', sort=49),
+                                  base.taskMgr.add(self._after_render, 'Profiler.after_render', sort=51),
+                                  base.taskMgr)
+
+    def disable(self):
+        self.enabled = False
+        if self._render_tasks is not None:
+            before, after, taskmgr = self._render_tasks
+            taskmgr.remove(before)
+            taskmgr.remove(after)
+            self._render_tasks = None
+
+    def record(self, phase, seconds):
+        """Count a duration of the given phase (if enabled)."""
+        if self.enabled:
+            try:
+                self.histograms[phase].record(seconds)
+            except KeyError:
+                self.histograms[phase] = Histogram()
+                self.histograms[phase].record(seconds)
+
+    @contextlib.contextmanager
+    def timed(self, phase):
+        """Context manager recording the duration of its body as phase."""
+        if not self.enabled:
+            yield
+            return
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.record(phase, self.clock() - start)
+
+    def reset(self):
+        self.histograms = {}
+        self.since = self.clock()
+
+    def export(self):
+        """All histograms as a JSON-compatible dict (see Histogram.to_dict)."""
+        return dict(time=self.clock(), since=self.since,
+                    phases={phase: histogram.to_dict() for phase, histogram in self.histograms.items()})
+
+    def publish(self, server):
+        """Publish the histograms on the PUB socket of a Server (topic TOPIC)."""
+        server.publish(TOPIC + json.dumps(self.export(), separators=(',', ':')).encode('utf-8'))
+
+    def report(self):
+        """Summary table of all phases (in ms)."""
+        return format_report(self.histograms)
+
+    # --- internal ---
+    def _before_render(self, task):
+        self._render_start = self.clock()
+        return task.cont
+
+    def _after_render(self, task):
+        if self._render_start is not None:
+            self.record('render', self.clock() - self._render_start)
+        return task.cont
+
+
+# the profiler of the framework
+profiler = Profiler()
+
+
+def format_report(histograms):
+    """Summary table of a dict of histograms, in ms."""
+    columns = ('count', 'mean', 'p50', 'p90', 'p99', 'p999', 'max')
+    lines = ['%-16s' % 'phase (ms)' + ''.join('%10s' % column for column in columns)]
+    order = [phase for phase in PHASES if phase in histograms] + sorted(set(histograms) - set(PHASES))
+    for phase in order:
+        summary = histograms[phase].summary()
+        lines.append('%-16s' % phase + '%10d' % summary['count'] +
+                     ''.join('%10.3f' % summary[column] for column in columns[1:]))
+    return '\n'.join(lines)
+
+
+def unpack(message):
+    """Dict of Histograms from a published message."""
+    data = json.loads(message[len(TOPIC):].decode('utf-8'))
+    return {phase: Histogram.from_dict(histogram) for phase, histogram in data['phases'].items()}
+
+
+def main(argv=None):
+    import zmq
+    parser = argparse.ArgumentParser(description="Print the timing histograms of a running Meyendtris launcher (started with --PROFILE).")
+    parser.add_argument('address', nargs='?', default='tcp://localhost:18813', help="address of the launcher's PUB socket")
+    parser.add_argument('--once', action='store_true', help="print the first summary received and exit")
+    args = parser.parse_args(argv)
+
+    socket = zmq.Context.instance().socket(zmq.SUB)
+    socket.setsockopt(zmq.LINGER, 0)
+    socket.setsockopt(zmq.CONFLATE, 1)
+    socket.setsockopt(zmq.SUBSCRIBE, TOPIC)
+    socket.connect(args.address)
+    try:
+        while True:
+            print(format_report(unpack(socket.recv())))
+            print()
+            if args.once:
+                break
+    except KeyboardInterrupt:
+        pass
+    socket.close()
+
+
+if __name__ == '__main__':
+    main()
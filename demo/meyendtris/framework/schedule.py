@@ -0,0 +1,206 @@
+# -*- coding:utf-8 -*-
+"""
+Precomputed trial schedules (timelines) for stimulus modules.
+
+Instead of drawing random trial parameters inside run(), a module compiles its
+whole session up front from a seed with a ScheduleBuilder: every step of the
+timeline is a call of a BasicStimuli/LatentModule function (write, rectangle,
+frame, picture, sound, sleep, waitfor, ...) with its arguments, the markers to
+send right before it, and optionally a key under which the returned object is
+kept (for a later 'destroy' step). Running the session is then a matter of
+table lookups per step (see TimelinePlayer), and the same seed (or the saved
+timeline file) reproduces it exactly:
+
+    def schedule(self, seed):
+        builder = ScheduleBuilder(seed)
+        for trial in range(self.trials):
+            builder.add('rectangle', rect=tuple(builder.rng.uniform(-1, 1, 4)), duration=1, markers=['trial'])
+        return builder.build(module=self.__class__.__module__)
+
+    def run(self):
+        TimelinePlayer(self).play(load_or_compile(self.schedule, self.scheduleSeed, self.scheduleFile))
+
+Besides the module's functions, a step can be a 'destroy' (of the objects kept
+under the given keys) or a 'clock' step, which resets the time that markers can
+refer to as {elapsed}; markers can also refer to the return value of the
+previous step (e.g., the response time of a waitfor) as {result}. The markers
+of a step are stamped with the flip time of the frame in which the step starts
+(see BasicStimuli.onset()), i.e., the onset of the stimulus it shows.
+
+The onset of each step is the nominal time from the last user-paced step (one
+that waits for an event), so that the timeline can be checked and analysed
+without running it. Timelines are saved as compact JSON (gzip-compressed if the
+file name ends with .gz).
+"""
+import collections
+import gzip
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+VERSION = 1
+
+Step = collections.namedtuple('Step', [
+    'onset',            # nominal onset in seconds since the last user-paced step
+    'action',           # name of the function to call ('destroy' and 'clock' are handled by the player)
+    'args',             # keyword arguments of the call
+    'markers',          # markers to send right before the call ({elapsed} and {result} are filled in)
+    'key'])             # key under which the return value is kept (for 'destroy'), or None
+
+# actions that do not block unless asked to, and actions that never take time
+_NONBLOCKING = ('sound', 'movie')
+_INSTANT = ('destroy', 'clock', 'marker')
+
+
+class Timeline(object):
+    """A compiled session: the steps and the seed they were generated from."""
+
+    def __init__(self, steps, seed=None, info=None):
+        self.steps = list(steps)
+        self.seed = seed
+        self.info = info or {}
+
+    def digest(self):
+        """Short hash of the timeline (identical for identical sessions)."""
+        return hashlib.sha1(self._dumps().encode('utf-8')).hexdigest()[:12]
+
+    def save(self, filename):
+        opener = gzip.open if filename.endswith('.gz') else open
+        with opener(filename, 'wt') as f:
+            f.write(self._dumps())
+
+    @classmethod
+    def load(cls, filename):
+        opener = gzip.open if filename.endswith('.gz') else open
+        with opener(filename, 'rt') as f:
+            data = json.load(f)
+        if data.get('version') != VERSION:
+            raise ValueError("Unsupported timeline version in %s: %s" % (filename, data.get('version')))
+        return cls([Step(*s) for s in data['steps']], data['seed'], data['info'])
+
+    def __len__(self):
+        return len(self.steps)
+
+    def __iter__(self):
+        return iter(self.steps)
+
+    def _dumps(self):
+        return json.dumps(dict(version=VERSION, seed=self.seed, info=self.info, steps=[list(s) for s in self.steps]),
+                          separators=(',', ':'), default=_json_default)
+
+
+def _json_default(obj):
+    # numpy scalars and arrays from the builder's generator
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError("Cannot serialise %r in a timeline" % (obj,))
+
+
+class ScheduleBuilder(object):
+    """Builds a Timeline step by step; self.rng is the seeded generator to draw all random parameters from."""
+
+    def __init__(self, seed=None):
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.steps = []
+        self.time = 0.0                 # nominal time since the last user-paced step
+
+    def add(self, action, markers=(), key=None, **args):
+        """Append a step calling action(**args), preceded by the given markers."""
+        self.steps.append(Step(round(self.time, 6), action, args, list(markers), key))
+        duration = self._duration(action, args)
+        if duration is None:
+            self.time = 0.0
+        else:
+            self.time += duration
+        return self
+
+    def destroy(self, *keys, markers=()):
+        """Append a step destroying the objects kept under the given keys."""
+        return self.add('destroy', markers, keys=list(keys))
+
+    def clock(self, markers=()):
+        """Append a step resetting the time of {elapsed} in markers."""
+        return self.add('clock', markers)
+
+    def build(self, **info):
+        return Timeline(self.steps, self.seed, info)
+
+    @staticmethod
+    def _duration(action, args):
+        # nominal time a step takes; None if it waits for an event
+        if action in _INSTANT:
+            return 0.0
+        if action == 'waitfor':
+            return None
+        duration = args.get('duration', 1.0)
+        if action != 'sleep' and (duration == 0 or not args.get('block', action not in _NONBLOCKING)):
+            return 0.0
+        if isinstance(duration, (str, list, tuple)):
+            return None
+        return float(duration)
+
+
+class TimelinePlayer(object):
+    """Executes a Timeline with the stimulus functions of a module (from within its run())."""
+
+    def __init__(self,
+                 module,                # the module whose functions are called (a BasicStimuli)
+                 flip_markers=True):    # whether to stamp markers with the flip time (via module.onset()) rather than sending them right away
+        self.module = module
+        self.flip_markers = flip_markers
+        self.objects = {}               # key -> object returned by a step
+        self.result = None              # return value of the last step
+        self._clock = time.perf_counter()
+
+    def play(self, timeline, start=0):
+        """Run the steps of timeline (from the given index on); returns the result of the last step."""
+        self.module.marker('Experiment Control/Schedule/%s:seed=%s' % (timeline.digest(), timeline.seed))
+        try:
+            for step in timeline.steps[start:]:
+                self.step(step)
+        finally:
+            self.destroy(list(self.objects))
+        return self.result
+
+    def step(self, step):
+        """Execute a single step."""
+        if step.markers:
+            context = dict(elapsed=time.perf_counter() - self._clock, result=self.result)
+            markers = [marker.format(**context) if '{' in marker else marker for marker in step.markers]
+            if self.flip_markers:
+                self.module.onset(*markers)
+            else:
+                for marker in markers:
+                    self.module.marker(marker)
+        if step.action == 'destroy':
+            self.destroy(step.args['keys'])
+        elif step.action == 'clock':
+            self._clock = time.perf_counter()
+        elif step.action != 'marker':
+            self.result = getattr(self.module, step.action)(**step.args)
+            if step.key is not None:
+                self.objects[step.key] = self.result
+
+    def destroy(self, keys):
+        for key in keys:
+            obj = self.objects.pop(key, None)
+            if obj is not None and hasattr(obj, 'destroy'):
+                obj.destroy()
+
+
+def load_or_compile(compile, seed=None, filename=None):
+    """The timeline saved in filename if it exists; otherwise compile(seed), saved to filename if given."""
+    if filename and os.path.exists(filename):
+        return Timeline.load(filename)
+    timeline = compile(seed)
+    if filename:
+        timeline.save(filename)
+    return timeline
@@ -0,0 +1,136 @@
+# -*- coding:utf-8 -*-
+"""
+Frame pacing for module code running a per-frame loop.
+
+FrameScheduler keeps the frame deadlines of a loop on a fixed grid of the
+monotonic clock (time.perf_counter), so that the loop does not drift when
+single frames take longer, and runs the game logic with a fixed timestep that
+is decoupled from the render rate: each frame, the elapsed time is added to an
+accumulator from which whole timesteps are taken. Typical use in a
+LatentModule, whose sleep_until() resumes at the Panda3D frame closest to the
+deadline:
+
+    scheduler = FrameScheduler(rate=60)
+    while True:
+        for _ in range(scheduler.begin_frame()):
+            step(scheduler.timestep)
+        render_state()
+        self.sleep_until(scheduler.end_frame())
+
+The jitter of the frame intervals is tracked in scheduler.stats. If the loop
+pauses (e.g. to wait for the user), call restart() before the next frame, so
+that the pause neither counts as a frame interval nor is made up for with
+logic steps.
+"""
+import math
+import time
+
+
+class JitterStats(object):
+    """Running statistics of frame intervals relative to a target period (O(1) per frame)."""
+
+    def __init__(self, period):
+        self.period = period            # target frame interval in seconds
+        self.reset()
+
+    def reset(self):
+        self.count = 0                  # number of intervals
+        self.mean = 0.0                 # mean interval in seconds
+        self._m2 = 0.0                  # sum of squared deviations from the mean (Welford)
+        self.min = math.inf
+        self.max = 0.0
+        self.mean_jitter = 0.0          # mean absolute deviation from the period in seconds
+        self.max_jitter = 0.0           # maximum absolute deviation from the period in seconds
+        self.late = 0                   # intervals longer than 1.5 periods (i.e. missed frames)
+
+    def add(self, interval):
+        self.count += 1
+        delta = interval - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (interval - self.mean)
+        self.min = min(self.min, interval)
+        self.max = max(self.max, interval)
+        jitter = abs(interval - self.period)
+        self.mean_jitter += (jitter - self.mean_jitter) / self.count
+        self.max_jitter = max(self.max_jitter, jitter)
+        if interval > 1.5 * self.period:
+            self.late += 1
+
+    @property
+    def std(self):
+        """Standard deviation of the intervals in seconds."""
+        return math.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def summary(self):
+        """The statistics in ms, as a dict."""
+        return dict(frames=self.count, mean=self.mean * 1000, std=self.std * 1000,
+                    min=(self.min if self.count else 0.0) * 1000, max=self.max * 1000,
+                    mean_jitter=self.mean_jitter * 1000, max_jitter=self.max_jitter * 1000, late=self.late)
+
+    def __str__(self):
+        return ("%(frames)d frames: interval %(mean).2f +- %(std).2f ms (%(min).2f - %(max).2f), "
+                "jitter %(mean_jitter).2f ms (max %(max_jitter).2f), %(late)d late" % self.summary())
+
+
+class FrameScheduler(object):
+    """Deadline-based frame pacing with a fixed-timestep accumulator for the game logic."""
+
+    def __init__(self,
+                 rate=60.0,                     # frames per second of the loop
+                 timestep=None,                 # duration of one logic step in seconds; 1 / rate if None
+                 max_steps=5,                   # maximum number of logic steps per frame; the rest is dropped after hiccups
+                 clock=time.perf_counter):      # monotonic clock returning seconds
+        self.period = 1.0 / rate
+        self.timestep = timestep or self.period
+        self.max_steps = max_steps
+        self.clock = clock
+        self.stats = JitterStats(self.period)
+        self.now = None                 # time at which the current frame began
+        self.deadline = None            # time at which the next frame is due
+        self.accumulator = 0.0          # time not yet consumed by logic steps
+        self.overruns = 0               # frames that ended after their deadline
+        self.dropped_steps = 0          # logic steps dropped because of max_steps
+
+    def restart(self):
+        """Start over with the next begin_frame(), e.g. after the loop was paused (keeps the statistics)."""
+        self.now = None
+        self.deadline = None
+        self.accumulator = 0.0
+
+    def begin_frame(self, now=None):
+        """Begin a frame; returns the number of logic steps of self.timestep to run."""
+        now = self.clock() if now is None else now
+        if self.now is None:
+            self.deadline = now
+            steps = 1
+        else:
+            interval = now - self.now
+            self.stats.add(interval)
+            self.accumulator += interval
+            steps = int(self.accumulator / self.timestep)
+            self.accumulator -= steps * self.timestep
+            if steps > self.max_steps:
+                self.dropped_steps += steps - self.max_steps
+                steps = self.max_steps
+        self.now = now
+        return steps
+
+    @property
+    def alpha(self):
+        """Fraction of a logic step accumulated but not yet run (for interpolating the rendered state)."""
+        return self.accumulator / self.timestep
+
+    def end_frame(self, now=None):
+        """End a frame; returns the deadline of the next frame (on the grid of frame periods)."""
+        now = self.clock() if now is None else now
+        self.deadline += self.period
+        if self.deadline <= now:
+            # overrun: skip to the next deadline on the grid rather than trying to catch up
+            self.overruns += 1
+            self.deadline += math.ceil((now - self.deadline) / self.period + 1e-9) * self.period
+        return self.deadline
+
+    def remaining(self, now=None):
+        """Time until the next deadline in seconds (never negative)."""
+        now = self.clock() if now is None else now
+        return max(0.0, self.deadline - now)
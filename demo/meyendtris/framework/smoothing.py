@@ -0,0 +1,182 @@
+# -*- coding:utf-8 -*-
+"""
+Online smoothers for noisy control signals (e.g. BCI classifier output).
+
+All smoothers share the same interface:
+  push(value, timestamp=None)       --> add one sample, returns the current smoothed value
+  extend(values, timestamps=None)   --> add a burst of samples, returns the current smoothed value
+  value                             --> the current smoothed value
+  reset(value)                      --> forget the history and restart from the given value
+
+Updates are O(1) per sample (O(log n) for the median), and no memory is
+allocated per sample once the buffers are full.
+"""
+import bisect
+import collections
+import math
+
+
+class Smoother(object):
+    """Base class for all smoothers."""
+
+    def __init__(self, initial=0.0):
+        self.value = initial
+
+    def push(self, value, timestamp=None):
+        """Add a single sample; returns the current smoothed value."""
+        raise NotImplementedError
+
+    def extend(self, values, timestamps=None):
+        """Add multiple samples (e.g. a chunk received since the last frame); returns the current smoothed value."""
+        if timestamps is None:
+            for v in values:
+                self.push(v)
+        else:
+            for v, t in zip(values, timestamps):
+                self.push(v, t)
+        return self.value
+
+    def reset(self, value=0.0):
+        """Forget all samples, restarting from the given value."""
+        self.value = value
+
+
+class RingBufferMean(Smoother):
+    """Mean of the last n samples, kept in a preallocated ring buffer with a running sum."""
+
+    def __init__(self, length, initial=0.0):
+        self.length = int(length)
+        super().__init__(initial)
+        self.reset(initial)
+
+    def push(self, value, timestamp=None):
+        buf = self._buffer
+        pos = self._pos
+        self._sum += value - buf[pos]
+        buf[pos] = value
+        pos += 1
+        if pos == self.length:
+            # recomputing the sum once per cycle keeps rounding errors from accumulating
+            pos = 0
+            self._sum = math.fsum(buf)
+        self._pos = pos
+        self.value = self._sum / self.length
+        return self.value
+
+    def extend(self, values, timestamps=None):
+        values = list(values)
+        if len(values) >= self.length:
+            # the burst replaces the whole buffer
+            self._buffer[:] = values[-self.length:]
+            self._pos = 0
+            self._sum = math.fsum(self._buffer)
+            self.value = self._sum / self.length
+            return self.value
+        return super().extend(values)
+
+    def reset(self, value=0.0):
+        self._buffer = [float(value)] * self.length
+        self._pos = 0
+        self._sum = float(value) * self.length
+        self.value = value
+
+
+class ExponentialSmoother(Smoother):
+    """
+    Exponential moving average. With timestamps, the decay is based on the time
+    elapsed between samples (time constant in seconds), otherwise on sample counts.
+    """
+
+    def __init__(self, alpha=0.05, timeconstant=None, initial=0.0):
+        super().__init__(initial)
+        self.alpha = alpha                  # weight of a new sample when no timestamps are given
+        self.timeconstant = timeconstant    # time constant in seconds when timestamps are given
+        self._last = None                   # timestamp of the previous sample
+
+    def push(self, value, timestamp=None):
+        alpha = self.alpha
+        if timestamp is not None and self.timeconstant:
+            if self._last is not None:
+                alpha = 1.0 - math.exp(-max(timestamp - self._last, 0.0) / self.timeconstant)
+            self._last = timestamp
+        self.value += alpha * (value - self.value)
+        return self.value
+
+    def reset(self, value=0.0):
+        self.value = value
+        self._last = None
+
+
+class MedianSmoother(Smoother):
+    """Median of the last n samples; a ring buffer plus a sorted copy maintained by bisection."""
+
+    def __init__(self, length, initial=0.0):
+        self.length = int(length)
+        super().__init__(initial)
+        self.reset(initial)
+
+    def push(self, value, timestamp=None):
+        old = self._buffer[self._pos]
+        self._buffer[self._pos] = value
+        self._pos = (self._pos + 1) % self.length
+        del self._sorted[bisect.bisect_left(self._sorted, old)]
+        bisect.insort(self._sorted, value)
+        mid = self.length // 2
+        if self.length % 2:
+            self.value = self._sorted[mid]
+        else:
+            self.value = (self._sorted[mid - 1] + self._sorted[mid]) / 2.0
+        return self.value
+
+    def reset(self, value=0.0):
+        self._buffer = [value] * self.length
+        self._sorted = [value] * self.length
+        self._pos = 0
+        self.value = value
+
+
+class TimeWindowMean(Smoother):
+    """
+    Mean of all samples whose timestamps lie within the last window seconds. The
+    window is defined in real time, so the response does not depend on how often
+    samples arrive (e.g. on the frame rate).
+    """
+
+    def __init__(self, window=2.0, initial=0.0):
+        super().__init__(initial)
+        self.window = window                # window length in seconds
+        self._samples = collections.deque() # (timestamp, value) pairs within the window
+        self._sum = 0.0
+
+    def push(self, value, timestamp=None):
+        if timestamp is None:
+            raise ValueError("TimeWindowMean requires sample timestamps.")
+        samples = self._samples
+        samples.append((timestamp, value))
+        self._sum += value
+        cutoff = timestamp - self.window
+        while samples[0][0] < cutoff:
+            self._sum -= samples.popleft()[1]
+        self.value = self._sum / len(samples)
+        return self.value
+
+    def reset(self, value=0.0):
+        self._samples.clear()
+        self._sum = 0.0
+        self.value = value
+
+
+def create_smoother(kind, length=120, window=2.0, alpha=0.05, timeconstant=None, initial=0.0):
+    """
+    Create a smoother by name: 'mean' (last length samples), 'median' (last length samples),
+    'exponential' (alpha per sample, or timeconstant in seconds), or 'window' (last window seconds).
+    """
+    if kind == 'mean':
+        return RingBufferMean(length, initial)
+    elif kind == 'median':
+        return MedianSmoother(length, initial)
+    elif kind == 'exponential':
+        return ExponentialSmoother(alpha, timeconstant, initial)
+    elif kind == 'window':
+        return TimeWindowMean(window, initial)
+    raise ValueError("Unknown smoother: %s" % kind)
@@ -0,0 +1,126 @@
+# -*- coding:utf-8 -*-
+"""
+Visual noise: randomly placed and coloured rectangles, as a single mesh.
+
+All rectangles of a VisualNoise stimulus are quads of one Geom whose vertex data
+is regenerated in place at every update: positions, sizes and colours are drawn
+as NumPy arrays from a seeded generator (so that a session can be reproduced)
+and written into the vertex buffer in one go. The updates are driven by a task
+of the Panda3D task manager, i.e., they are locked to the rendered frames (and
+thus to the display refresh if video sync is enabled), optionally at a lower rate.
+"""
+import numpy as np
+import panda3d.core as pandac
+
+import meyendtris
+
+# per-quad corner offsets (in units of the half width/height) and the two triangles of a quad
+_CORNERS = np.array([(-1, -1), (1, -1), (1, 1), (-1, 1)], dtype=np.float32)
+_TRIANGLES = np.array([0, 1, 2, 0, 2, 3], dtype=np.uint32)
+
+
+def _vertex_format():
+    array = pandac.GeomVertexArrayFormat()
+    array.addColumn(pandac.InternalName.getVertex(), 3, pandac.Geom.NTFloat32, pandac.Geom.CPoint)
+    array.addColumn(pandac.InternalName.getColor(), 4, pandac.Geom.NTFloat32, pandac.Geom.CColor)
+    return pandac.GeomVertexFormat.registerFormat(pandac.GeomVertexFormat(array))
+
+
+class VisualNoise(object):
+    """A number of random rectangles that are redrawn at every frame (or at a given rate)."""
+
+    def __init__(self,
+                 count=3,                   # number of rectangles
+                 seed=None,                 # seed of the random generator (or a numpy Generator); None for an unpredictable one
+                 xrange=(-1, 1),            # range of the rectangle centers (horizontal)
+                 yrange=(-1, 1),            # range of the rectangle centers (vertical)
+                 sizerange=None,            # range of the half widths/heights; (-aspect ratio, aspect ratio) if None (negative sizes flip the quad)
+                 alpharange=(0, 1),         # range of the opacities
+                 rate=None,                 # updates per second; None to update at every frame
+                 parent=None,               # parent rendering context or Panda3d NodePath
+                 taskmgr=None):             # task manager driving the updates; the global one if None
+        self.count = count
+        self.rng = np.random.default_rng(seed)
+        self.xrange = xrange
+        self.yrange = yrange
+        if sizerange is None:
+            aspect = meyendtris.__BASE__.getAspectRatio()
+            sizerange = (-aspect, aspect)
+        self.sizerange = sizerange
+        self.alpharange = alpharange
+        self.period = 1.0 / rate if rate else 0.0
+        self.updates = 0                    # number of updates so far
+        self._taskmgr = taskmgr or meyendtris.__BASE__.taskMgr
+        self._task = None
+        self._last = None
+
+        # one quad (4 vertices, 2 triangles) per rectangle; the index buffer never changes
+        self._vdata = pandac.GeomVertexData('VisualNoise', _vertex_format(), pandac.Geom.UHDynamic)
+        self._vdata.uncleanSetNumRows(4 * count)
+        self._block = np.zeros((count, 4, 7), dtype=np.float32)
+        prim = pandac.GeomTriangles(pandac.Geom.UHStatic)
+        prim.setIndexType(pandac.GeomEnums.NTUint32)
+        indices = (_TRIANGLES[None, :] + 4 * np.arange(count, dtype=np.uint32)[:, None]).ravel()
+        handle = prim.modifyVertices()
+        handle.uncleanSetNumRows(len(indices))
+        memoryview(handle).cast('B')[:] = memoryview(indices).cast('B')
+        geom = pandac.Geom(self._vdata)
+        geom.addPrimitive(prim)
+        node = pandac.GeomNode('VisualNoise')
+        node.addGeom(geom)
+        self.node = (parent if parent is not None else meyendtris.__BASE__.aspect2d).attachNewNode(node)
+        self.node.setTransparency(pandac.TransparencyAttrib.MAlpha)
+        self.node.setTwoSided(True)
+        self.update()
+
+    def update(self):
+        """Draw new rectangles."""
+        n, rng, block = self.count, self.rng, self._block
+        centers = np.empty((n, 2), dtype=np.float32)
+        centers[:, 0] = rng.uniform(*self.xrange, size=n)
+        centers[:, 1] = rng.uniform(*self.yrange, size=n)
+        sizes = rng.uniform(*self.sizerange, size=(n, 2)).astype(np.float32)
+        colors = rng.random((n, 4), dtype=np.float32)
+        colors[:, 3] = self.alpharange[0] + colors[:, 3] * (self.alpharange[1] - self.alpharange[0])
+        # x, (y=0), z of the corners, then the colour of the quad at each corner
+        block[:, :, 0] = centers[:, None, 0] + _CORNERS[None, :, 0] * sizes[:, None, 0]
+        block[:, :, 2] = centers[:, None, 1] + _CORNERS[None, :, 1] * sizes[:, None, 1]
+        block[:, :, 3:] = colors[:, None, :]
+        memoryview(self._vdata.modifyArray(0)).cast('B')[:] = memoryview(block).cast('B')
+        self.updates += 1
+
+    def start(self):
+        """Update the rectangles from the next frame on."""
+        if self._task is None:
+            self._task = self._taskmgr.add(self._update_task, 'VisualNoise.update')
+        return self
+
+    def stop(self):
+        """Stop updating (the current rectangles stay on the screen)."""
+        if self._task is not None:
+            self._taskmgr.remove(self._task)
+            self._task = None
+
+    def show(self):
+        self.node.show()
+
+    def hide(self):
+        self.node.hide()
+
+    def destroy(self):
+        """Stop updating and remove the rectangles from the screen."""
+        self.stop()
+        if not self.node.isEmpty():
+            self.node.removeNode()
+
+    def _update_task(self, task):
+        if self.period:
+            if self._last is not None:
+                if task.time - self._last < self.period:
+                    return task.cont
+                # stay on the grid of update periods
+                self._last = task.time - (task.time - self._last) % self.period
+            else:
+                self._last = task.time
+        self.update()
+        return task.cont
@@ -7,7 +7,7 @@ The SNAP experiment launcher program. To be run on the subject's PC.
   (one at a time).
 
 * The module to be launched (and various other options) can be specified at the command line; here is a complete listing of all possible config options and their defaults:
-  launcher.py --MODULENAME relaxation.calibration --STUDYPATH studies/Sample1 --AUTOLAUNCH 1 --DEVELOPER 1 --engineconfig defaultsettings.prc --DATARIVER 0 --LABSTREAMING 1 --FULLSCREEN 0 --WINDOWSIZE 800x600 --WINDOWORIGIN 50/50 --NOBORDER 0 --NOMOUSECURSOR 0 --TIMECONSUMPENSATE 1
+  launcher.py --MODULENAME relaxation.calibration --STUDYPATH studies/Sample1 --AUTOLAUNCH 1 --DEVELOPER 1 --engineconfig defaultsettings.prc --DATARIVER 0 --LABSTREAMING 1 --FULLSCREEN 0 --WINDOWSIZE 800x600 --WINDOWORIGIN 50/50 --NOBORDER 0 --NOMOUSECURSOR 0 --TIMECONSUMPENSATE 1 --PROFILE 0
     
 * If in DEVELOPER mode, several key bindings are enabled:
    Esc: exit program
@@ -22,39 +22,41 @@ The SNAP experiment launcher program. To be run on the subject's PC.
   In addition, the directory where to look for the .cfg file can be specified as the STUDYPATH.
   launcher.py --module=test1.cfg --STUDYPATH=studies/DAS
   
-* The program can be remote-controlled via a simple TCP text-format network protocol (on port 7899) supporting the following messages:
+* The program can be remote-controlled via a simple TCP text-format network protocol (on port 7897) supporting the following messages:
   start                  --> start the current module
   cancel                 --> cancel execution of the current module
   load modulename        --> load the module named modulename
   config configname.cfg  --> load a config named configname.cfg (make sure that the STUDYPATH is set correctly so that it's found)
-  setup name=value       --> assign a value to a member variable in the current module instance
-                             can also involve multiple assignments separated by semicolons, full Python syntax allowed.
+  setup name=value       --> assign a value to a numeric member variable in the current module instance
+                             can also involve multiple assignments separated by semicolons; values must be numbers or lists of numbers.
+  The same port also accepts the typed binary protocol of meyendtris.control (detected by its first byte), which is preferable
+  for values sent at high rates, e.g. classifier outputs. Only the latest value per variable is applied each frame.
+  The same commands (plus restart and exit) are accepted over ZMQ REQ/REP on port 18812; log records are published on port 18813.
+  All of these are served by one asyncio event loop (see server.py), which also publishes per-frame telemetry (see telemetry.py).
+  With --PROFILE 1, timing histograms of the main loop are published there as well, once per second (see framework/profiling.py).
    
 * The underlying Panda3d engine can be configured via a custom .prc file (specified as --engineconfig=filename.prc), see
   http://www.panda3d.org/manual/index.php/Configuring_Panda3D
+  The configuration is loaded before the window is opened: importing meyendtris does not create the ShowBase,
+  the launcher does (meyendtris.create_base()) once the configuration is in place.
   
 * For quick-and-dirty testing you may also override the launch options below under "Default Launcher Configuration", but note that you cannot check these changes back into the main source repository of SNAP.  
     
 '''
-import sys, os
+import sys, os, atexit, errno
 import warnings
 from argparse import ArgumentParser
-import threading
-import queue
-import socketserver
 import importlib
 
-from direct.task.Task import Task
 from panda3d.core import loadPrcFile, loadPrcFileData
 
 import meyendtris
+from meyendtris.control import ControlChannel
 from meyendtris.framework.eventmarkers.eventmarkers import send_marker, init_markers
 import meyendtris.framework.base_classes
+from meyendtris.framework.profiling import profiler
 
-import zmq
 import logging
-from zmq.log.handlers import PUBHandler
-from meyendtris.server import Server
 
 SNAP_VERSION = '2.0'
 logger = logging.getLogger("meyendtris")
@@ -111,6 +113,9 @@ DEVELOPER_MODE = True
 # Whether lost time (e.g., to processing or jitter) is compensated for by making the next sleep() slightly shorter
 COMPENSATE_LOST_TIME = True
 
+# Whether to record timing histograms of the main loop and the module's tick (see framework/profiling.py)
+PROFILE = False
+
 
 
 # -----------------------------------
@@ -136,15 +141,11 @@ class MainApp:
             serverport=SERVER_PORT,
             developer=DEVELOPER_MODE,
             timecompensate=COMPENSATE_LOST_TIME,
-            autolaunch=AUTO_LAUNCH, **kwargs):
+            autolaunch=AUTO_LAUNCH,
+            profile=PROFILE, **kwargs):
         """Needs a modulename to load and execute, pass it in global variable LOAD_MODULE or as cmdline args, --modulename
         """
         # load the parameters from kwargs, if passed any
-        self._base = meyendtris.__BASE__
-
-        # setting black background colour (black)
-        self._base.win.setClearColor((0, 0, 0, 1))
-
         self._module = kwargs.get("MODULENAME") if kwargs.get("MODULENAME") else modulename
         self._labstreaming = kwargs.get("LABSTREAMING") if kwargs.get("LABSTREAMING") else labstreaming
         self._datariver = kwargs.get("DATARIVER") if kwargs.get("DATARIVER") else datariver
@@ -158,16 +159,23 @@ class MainApp:
         self._compensate_lost_time = kwargs.get("TIMECONSUMPENSATE") if kwargs.get("TIMECONSUMPENSATE") else timecompensate
         self._studypath =  meyendtris.path_join(f'studies/{kwargs.get("STUDYPATH")}') if kwargs.get("STUDYPATH") else path_join(f"studies/{studypath}") # type: ignore
         self._autolaunch = kwargs.get("AUTOLAUNCH") if kwargs.get("AUTOLAUNCH") else autolaunch
+        self._profile = kwargs.get("PROFILE") if kwargs.get("PROFILE") else profile
 
         # whether we are executing the module
         self._executing = False
 
+        # the engine configuration must be loaded before the window is opened
+        self._load_serverconfig()
+        self._base = meyendtris.create_base()
+
+        # setting black background colour (black)
+        self._base.win.setClearColor((0, 0, 0, 1))
+
         # preload some data and init some settings
         self._set_defaults()
-        self._load_serverconfig()
 
-        # a message queue filled by the TCP server
-        self._remote_commands = queue.Queue()
+        # remote control messages received by the TCP server, applied once per frame
+        self._control = ControlChannel()
         # instance of the module's Main class
         # load the initial module or config if desired
         self._instance = self._load_module(self._module)
@@ -194,6 +202,12 @@ class MainApp:
         # start the TCP server for remote control
         self._init_server(self._server_port)
 
+        # record (and publish) timing histograms if desired
+        if self._profile in (True, 1, "1", "True", "true"):
+            profiler.enable(self._base)
+            self._profile_published = profiler.clock()
+            atexit.register(lambda: print(profiler.report()))
+
     def _load_serverconfig(self):
         if os.path.exists(self._studypath):
             print("Applying the engine configuration file/settings...")
@@ -227,6 +241,8 @@ class MainApp:
                 module = importlib.import_module(f'meyendtris.modules.{runner}')
                 instance = module.Main() # type: ignore
                 instance._make_up_for_lost_time = self._compensate_lost_time
+                # the numeric member variables can be set remotely
+                self._control.parameters.register_attributes(instance)
                 print(f"module {runner} loaded sucessfully.")
                 return instance
             except:
@@ -270,31 +286,21 @@ class MainApp:
     # --- internal ---
     def _init_server(self,port):
         """Initialize the remote control server."""
-        destination = self._remote_commands 
-        class ThreadedTCPRequestHandler(socketserver.StreamRequestHandler):
-            def handle(self):
-                try:
-                    print("Client connection opened.")
-                    while True:
-                        data = self.rfile.readline().strip()
-                        if len(data)==0:
-                            break                        
-                        destination.put(data)
-                except:
-                    print("Connection closed by client.")
-
-        class ThreadedTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
-            pass
-
         print("Bringing up remote-control server on port", port, "...", end=' ')
+        self._telemetry = None
         try:
-            server = ThreadedTCPServer(("", port),ThreadedTCPRequestHandler)
-            server_thread = threading.Thread(target=server.serve_forever)
-            server_thread.setDaemon(True)
-            server_thread.start()
+            # (zmq is only needed from here on)
+            from meyendtris.server import Server
+            from meyendtris.telemetry import TelemetryPublisher
+            self._server = Server(log=True, line_port=int(port), control=self._control)
+            self._server.start()
+            self._telemetry = TelemetryPublisher(self._server)
             print("done.")
-        except:
-            print("failed; the port is already taken (probably the previous process is still around).")
+        except Exception as e:
+            if getattr(e, 'errno', None) == errno.EADDRINUSE:
+                print("failed; the port is already taken (probably the previous process is still around).")
+            else:
+                print(f"failed: {e!r}")
 
 
     # main loop step, ticked every frame
@@ -302,38 +308,45 @@ class MainApp:
         #framework.tickmodule.engine_lock.release()
         meyendtris.framework.base_classes.shared_lock.release()
 
-        # process any queued-up remote control messages
-        try:
-            while True:
-                cmd = str(self._remote_commands.get_nowait()).strip()            
-                if cmd == "start":
-                    self.start_module()
-                elif (cmd == "cancel") or (cmd == "stop"):
-                    self.cancel_module()
-                elif cmd == "prune":
-                    self.prune_module()
-                elif cmd.startswith("load "):
-                    self._load_module(cmd[5:])
-                elif cmd.startswith("setup "):
-                    try:
-                        exec(cmd[6:], self._instance.__dict__)
-                    except:
-                        pass
-                elif cmd.startswith("config "):
-                    if not cmd.endswith(".cfg"):
-                        self._load_remoteconfig(cmd[7:]+".cfg")
-                    else:
-                        self._load_remoteconfig(cmd[7:])
-        except queue.Empty:
-            pass
+        # apply the latest remotely set values and process any queued-up remote control commands
+        for cmd, argument in self._control.apply():
+            if cmd == "start":
+                self.start_module()
+            elif cmd == "cancel":
+                self.cancel_module()
+            elif cmd == "restart":
+                self.start_module()
+            elif cmd == "exit":
+                sys.exit("Exit command entered")
+            elif cmd == "prune":
+                self.prune_module()
+            elif cmd == "load":
+                self.cancel_module()
+                self._instance = self._load_module(argument or "")
+            elif cmd == "config":
+                if not argument.endswith(".cfg"):
+                    self._load_remoteconfig(argument+".cfg")
+                else:
+                    self._load_remoteconfig(argument)
 
         # tick the current module
         if (self._instance is not None) and self._executing:
             self._instance.tick()
+            if self._telemetry is not None:
+                self._telemetry.publish(self._instance)
+            if getattr(self._instance, 'error', None) is not None:
+                # run() crashed: the module is no longer executing
+                logger.error(f"Module {type(self._instance).__module__} failed: {self._instance.error!r}")
+                self.cancel_module()
+
+        # publish the timing histograms once per second
+        if profiler.enabled and self._telemetry is not None and profiler.clock() - self._profile_published >= 1.0:
+            profiler.publish(self._server)
+            self._profile_published = profiler.clock()
 
         meyendtris.framework.base_classes.shared_lock.acquire()
         #framework.tickmodule.engine_lock.acquire()
-        return Task.cont
+        return task.cont
 
 
 # ------------------------------
@@ -371,19 +384,28 @@ if __name__ == "__main__":
                     help="The port on which the launcher listens for remote control commands (e.g. loading a module).")
     parser.add_argument("-t","--TIMECONSUMPENSATE", dest="TIMECONSUMPENSATE", default=COMPENSATE_LOST_TIME,
                     help="Compensate time lost to processing or jitter by making the successive sleep() call shorter by a corresponding amount of time (good for real time, can be a hindrance during debugging).")
+    parser.add_argument("-P","--PROFILE", dest="PROFILE", default=PROFILE,
+                    help="Record timing histograms of the main loop, printed at exit and published on the PUB socket (see framework/profiling.py).")
     args = parser.parse_args()
 
     # ----------------------
     # --- SNAP Main Loop ---
     # ----------------------
-    server = Server(log=True)
     app = MainApp(**vars(args))
 
     # Needed after the call to MainApp
     while True:
-        meyendtris.framework.base_classes.shared_lock.acquire()
-        #framework.tickmodule.engine_lock.acquire()
-        app._base.taskMgr.step()
+        if profiler.enabled:
+            start = profiler.clock()
+            meyendtris.framework.base_classes.shared_lock.acquire()
+            frame_start = profiler.clock()
+            profiler.record('main_lock_wait', frame_start - start)
+            app._base.taskMgr.step()
+            profiler.record('frame', profiler.clock() - frame_start)
+        else:
+            meyendtris.framework.base_classes.shared_lock.acquire()
+            #framework.tickmodule.engine_lock.acquire()
+            app._base.taskMgr.step()
         #framework.tickmodule.engine_lock.release()
         meyendtris.framework.base_classes.shared_lock.release()
     # --------------------------------
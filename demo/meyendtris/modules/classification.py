@@ -31,6 +31,7 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import sys
 import meyendtris
 from meyendtris.framework.basicstimuli import BasicStimuli
+from meyendtris.framework.smoothing import RingBufferMean
 from direct.gui.OnscreenImage import OnscreenImage
 from direct.gui.OnscreenText import OnscreenText
 from panda3d.core import PerlinNoise2
@@ -110,7 +111,7 @@ class Main(BasicStimuli):
         perlin = PerlinNoise2(1, 1)
         perlinCount = 0
         bufferLength = int(self.fps * 2) 
-        bufferList = [(self.inputRange[1] - self.inputRange[0]) / 2] * bufferLength
+        buffer = RingBufferMean(bufferLength, (self.inputRange[1] - self.inputRange[0]) / 2)
     
         self.loop = True
         def loop_false(): self.loop=False
@@ -125,15 +126,13 @@ class Main(BasicStimuli):
             if self.useThresholds:
                 if self.bci < self.bciThresholds[0] or self.bci > self.bciThresholds[1]:
                     # appending input only if it is beyond the thresholds
-                    bufferList.append(self.bci)
-                    bufferList = bufferList[1:]
+                    buffer.push(self.bci)
             else:
                 # always appending input
-                bufferList.append(self.bci)
-                bufferList = bufferList[1:]
+                buffer.push(self.bci)
             
-            # taking bufferList mean as current value
-            currentValue = sum(bufferList) / len(bufferList)
+            # taking buffer mean as current value
+            currentValue = buffer.value
                 
             # redrawing bar
             maxHeight = self.frameHeight - 4 * self.frameWidth
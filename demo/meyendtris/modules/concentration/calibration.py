@@ -27,9 +27,9 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 import meyendtris
 import sys
-import random
 import numpy as np
 from meyendtris.framework.basicstimuli import BasicStimuli
+from meyendtris.framework.schedule import ScheduleBuilder, TimelinePlayer, load_or_compile
 from direct.gui.OnscreenImage import OnscreenImage
 from panda3d.core import Point3
 
@@ -50,19 +50,15 @@ class Main(BasicStimuli):
         self.beepVolume = 1.0
 
         self.image = meyendtris.path_join('/media/blank.tga')
+        self.asset_manifest = [('sound', self.beepSound), ('texture', self.image), ('font', 'media/arial.ttf')]
 
         self.framecolour = (0.92, 0.96, 0.11, 0.7)
         self.squarecolour = (0.2, 0.6, 1, 0.7)
 
-    def run(self):
-        self.accept("escape", sys.exit)
-        # initialising beep audio
-        beep = self._base.loader.loadSfx(self.beepSound)
-        beep.setVolume(self.beepVolume)
-        beep.setLoop(False)
+        self.scheduleSeed = None    # seed of the trial schedule (None: a new one every run, logged in a marker)
+        self.scheduleFile = None    # optional timeline file: played if it exists, otherwise the compiled schedule is saved to it
 
-        self.write(text = self.textPressSpace, duration = 'space')
-        random_question = [
+        self.questions = [
             "How much liters of water did you drink today, to two decimal points?",
             "How many birds did you see today? Do you remember the color of each bird?",
             "When did you wake up today?",
@@ -84,46 +80,53 @@ class Main(BasicStimuli):
             "How many minutes per day do you spend on social media?",
             "Name five animals starting with the letter S."
         ]
-        random.shuffle(random_question)
+
+    def schedule(self, seed):
+        # compiling the whole session: question order, block positions and markers
+        if len(self.questions) < self.trial:
+            raise ValueError("Questions are less, Add some more to the list.")
+        builder = ScheduleBuilder(seed)
+        questions = [self.questions[i] for i in builder.rng.permutation(len(self.questions))]
         block_moving_count = int(np.ceil(self.duration * 0.5))
-        for idx, trial in enumerate(range(self.trial)):
-            if len(random_question) < self.trial:
-                raise ValueError("Questions are less, Add some more to the list.")
-            self.marker(f"trial {trial+1}/{self.trial}")
-            self.write(text=f"Trial {trial+1}/{self.trial}", duration=5)
-            self.marker("question key press")
-            self.write(text = f"{random_question[idx]} \n\n(Press space when you have read the question)", duration = "space")
-            beep.play()
-            self.sleep(1)
-            self.frame(
+        duration_array = np.concatenate(
+            (
+            np.ones(block_moving_count),
+            np.array([self.duration-(block_moving_count)]),
+            np.array(self.last_response)),
+            axis=None).tolist()
+
+        builder.add('write', text = self.textPressSpace, duration = 'space')
+        for trial in range(self.trial):
+            builder.add('write', markers = [f"trial {trial+1}/{self.trial}"],
+                text=f"Trial {trial+1}/{self.trial}", duration=5)
+            builder.add('write', markers = ["question key press"],
+                text = f"{questions[trial]} \n\n(Press space when you have read the question)", duration = "space")
+            builder.add('sound', filename = self.beepSound, volume = self.beepVolume)
+            builder.add('sleep', duration = 1)
+            builder.add('frame',
                 rect=(-0.5,0.5,0.5,-0.5),
                 duration=self.duration + self.last_response,
                 color=self.framecolour,
-                block=False
-            )
-
-            duration_array = np.concatenate(
-                (
-                np.ones(block_moving_count),
-                np.array([self.duration-(block_moving_count)]),
-                np.array(self.last_response)),
-                axis=None)
-            for idx, duration in enumerate(duration_array):
-                l = 2*random.random() - 1
-                r = 2*random.random() - 1
-                t = 2*random.random() - 1
-                b = 2*random.random() - 1
+                block=False)
+
+            for duration in duration_array:
+                l, r, t, b = (2*builder.rng.random(4) - 1).tolist()
                 if (duration != 1 and duration != self.last_response):
-                    self.marker("distraction phase")
-                    self.write(text = "Answer the question", duration = 0.5, block=False)
-                else: self.marker("concentration phase")
-                self.rectangle(
+                    builder.add('write', markers = ["distraction phase"],
+                        text = "Answer the question", duration = 0.5, block=False)
+                else: builder.add('marker', markers = ["concentration phase"])
+                builder.add('rectangle',
                     rect=(l,r,t,b),
                     duration=duration,
                     block = False if duration == self.last_response else True,
                     color=self.squarecolour)
-            self.marker("Final Response")
-            response = self.waitfor("enter")
-            self.marker(f"response time {response}")
-            self.write(text = "How many blocks were inside the frame in this trial? \n\n(Say it loud and press enter)", duration = 'enter')
-        self.write(text = self.textEndExperiment, duration = 'space')
\ No newline at end of file
+            builder.add('waitfor', markers = ["Final Response"], eventid = "enter")
+            builder.add('write', markers = ["response time {result}"],
+                text = "How many blocks were inside the frame in this trial? \n\n(Say it loud and press enter)", duration = 'enter')
+        builder.add('write', text = self.textEndExperiment, duration = 'space')
+        return builder.build(module = __name__, trials = self.trial)
+
+    def run(self):
+        self.accept("escape", sys.exit)
+        timeline = load_or_compile(self.schedule, self.scheduleSeed, self.scheduleFile)
+        TimelinePlayer(self).play(timeline)
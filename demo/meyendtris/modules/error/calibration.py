@@ -24,14 +24,12 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-import random as rdm
-from time import time
-import math, sys, colorsys, random
+import math, sys, colorsys
 import meyendtris
 # import numpy as np
-from direct.gui.OnscreenImage import OnscreenImage
 
 from meyendtris.framework.basicstimuli import BasicStimuli
+from meyendtris.framework.schedule import ScheduleBuilder, TimelinePlayer, load_or_compile
 from direct.showbase.ShowBase import ShowBase
 
 
@@ -50,22 +48,22 @@ class Main(BasicStimuli):
         self.beepVolume = 1.0
 
         self.image = meyendtris.path_join('/media/blank.tga')
+        self.asset_manifest = [('sound', self.beepSound), ('texture', self.image), ('font', 'media/arial.ttf')]
 
         self.framecolour = (0.92, 0.96, 0.11, 0.7)
         self.squarecolour = (0.2, 0.6, 1, 0.7)
-    
-    def start_calibration(self):
-        self.accept("escape", sys.exit)
-        # initialising beep audio
-        beep = self._base.loader.loadSfx(self.beepSound)
-        beep.setVolume(self.beepVolume)
-        beep.setLoop(False)
 
-        self.write(text = self.textPressSpace, duration = 'space')
+        self.scheduleSeed = None    # seed of the trial schedule (None: a new one every run, logged in a marker)
+        self.scheduleFile = None    # optional timeline file: played if it exists, otherwise the compiled schedule is saved to it
+
+    def schedule(self, seed):
+        # compiling the whole session: target directions, error movements and intervals
+        builder = ScheduleBuilder(seed)
+        rng = builder.rng
+        builder.add('write', text = self.textPressSpace, duration = 'space')
 
         for trial in range(self.trial): #Begin trial series
             #Progress bar for errors(maxed out at 5 errors)
-            begin = time()
             Pg_bar_right = (0.1,1.3,-0.8,-0.9)
             Pg_bar_left = (-0.1,-1.3,-0.8,-0.9)
             
@@ -73,104 +71,82 @@ class Main(BasicStimuli):
             pg_block_left = [-0.1,-0.1,-0.8,-0.9]
             block_increment = (Pg_bar_right[1] - Pg_bar_right[0])/5
 
-            blocks_rt, blocks_lt = [], []
+            blocks = []     # keys of the error bars of this trial
+            frames = False
 
-            self.marker(f"Begin err trial {trial+1}")
+            # {elapsed} in markers: time since the beginning of the trial
+            builder.clock(markers = [f"Begin err trial {trial+1}"])
             err_left,err_right = 0,0 #error count
 
             while err_left <5 and err_right <5: #Single trial
                 
-                self.sleep(1)
+                builder.add('sleep', duration = 1)
 
-                target_right = 1 if random.random()>0.5 else 0 #Ranomized target direction
-                # dir_text = "Right" if target_right else "Left"
-                # self.write("Move "+dir_text, duration="arrow_right" or "arrow_left")
+                target_right = 1 if rng.random()>0.5 else 0 #Ranomized target direction
+                #Left arrow for left movement and Right arrow for right movement
                 if target_right:
-                    self.marker("Move Right")
-                    self.write("Move Right", duration="arrow_right")
+                    builder.add('write', markers = ["Move Right"], text = "Move Right", duration="arrow_right")
                 else:
-                    self.marker("Move Left")
-                    self.write("Move Left", duration="arrow_left")
+                    builder.add('write', markers = ["Move Left"], text = "Move Left", duration="arrow_left")
 
-
-                #Left arrow for left movement and Right arrow for right movement
-                elapsed_keypress = time() - begin
-                self.marker("Arrow Keypress")
-                self.marker("Keypress "+str(elapsed_keypress))
-                
-                self.sleep(1) #Randomized interval to prevent habituation
+                builder.add('sleep', markers = ["Arrow Keypress", "Keypress {elapsed}"], duration = 1)
                 
-                #progerss bars
-                frame_rt = self.frame(
-                    rect=(Pg_bar_right),
-                    duration=0,
-                    color=self.framecolour,
-                    block=False
-                )
-                frame_lt = self.frame(
-                    rect=(Pg_bar_left),
-                    duration=0,
-                    color=self.framecolour,
-                    block=False
-                )
-
-                error_movement = 1 if random.random()<=0.25 else 0 #Randomized error probablity
+                #progress bars (shown from the first movement of the trial on)
+                if not frames:
+                    frames = True
+                    builder.add('frame', key = 'frame_rt',
+                        rect=(Pg_bar_right),
+                        duration=0,
+                        color=self.framecolour,
+                        block=False)
+                    builder.add('frame', key = 'frame_lt',
+                        rect=(Pg_bar_left),
+                        duration=0,
+                        color=self.framecolour,
+                        block=False)
+
+                error_movement = 1 if rng.random()<=0.25 else 0 #Randomized error probablity
 
                 if target_right:
                     if error_movement: #Target directio right and actual movement left
                         pg_block_right[1]+=block_increment
                         err_right += 1
-                        err_bar_rt = self.rectangle(tuple(pg_block_right),
+                        blocks.append(f"block {len(blocks)}")
+                        builder.add('rectangle', key = blocks[-1],
+                                    rect=tuple(pg_block_right),
                                     duration=0,
-                                    block=True,
-                                    color=(0.8,0.92,0.74,0.5),
-                                    parent=None,      # the renderer to use for displaying the object
-                                    depth=0,)
-                        blocks_rt.append(err_bar_rt)
-                        arrow = OnscreenImage(image=meyendtris.path_join('/media/arrow_left.png'), scale=(0.3,1,0.3))
-                        arrow.setTransparency(1)
-                        elapsed_feedback = time() - begin
-                        self.marker("Error movement")
-                        self.marker("Error movement right "+str(elapsed_feedback))
+                                    color=(0.8,0.92,0.74,0.5))
+                        arrow, markers = 'arrow_left.png', ["Error movement", "Error movement right {elapsed}"]
                     else:
-                        arrow = OnscreenImage(image=meyendtris.path_join('/media/arrow_right.png'), scale=(0.3,1,0.3))
-                        elapsed_feedback = time() - begin
-                        self.marker("Non-Error movement")
-                        self.marker("Non-Error movement right "+str(elapsed_feedback))
-                        arrow.setTransparency(1)
+                        arrow, markers = 'arrow_right.png', ["Non-Error movement", "Non-Error movement right {elapsed}"]
                 else:
                     if error_movement: #Target direction left and actual movement right
                         pg_block_left[1]-=block_increment
                         err_left += 1
-                        err_bar_lt = self.rectangle(tuple(pg_block_left),
+                        blocks.append(f"block {len(blocks)}")
+                        builder.add('rectangle', key = blocks[-1],
+                                    rect=tuple(pg_block_left),
                                     duration=0,
-                                    block=True,
-                                    color=(0.8,0.92,0.74,0.5),
-                                    parent=None,      # the renderer to use for displaying the object
-                                    depth=0,)
-                        blocks_lt.append(err_bar_lt)
-                        arrow = OnscreenImage(image=meyendtris.path_join('/media/arrow_right.png'), scale=(0.3,1,0.3))
-                        arrow.setTransparency(1)
-                        elapsed_feedback = time() - begin
-                        self.marker("Error movement")
-                        self.marker("Error movement left "+str(elapsed_feedback))
+                                    color=(0.8,0.92,0.74,0.5))
+                        arrow, markers = 'arrow_right.png', ["Error movement", "Error movement left {elapsed}"]
                     else:
-                        arrow = OnscreenImage(image=meyendtris.path_join('/media/arrow_left.png'), scale=(0.3,1,0.3))
-                        arrow.setTransparency(1)
-                        elapsed_feedback = time() - begin
-                        self.marker("Non-Error movement")
-                        self.marker("Non-Error movement left "+str(elapsed_feedback))
-
-                self.sleep(random.randint(2,3)) #Randomized interval to prevent habituation
-                arrow.destroy()
-
-            self.write(f"trial {trial+1} complete. Press space to begin next trail",duration = 'space')
-            for block in blocks_rt:
-                block.destroy()
-            for block in blocks_lt:
-                block.destroy()
-
-        self.write(text = self.textEndExperiment, duration = 'space')
+                        arrow, markers = 'arrow_left.png', ["Non-Error movement", "Non-Error movement left {elapsed}"]
+                builder.add('picture', key = 'arrow', image = 'media/' + arrow, duration = 0, scale = (0.3,1,0.3))
+
+                #Randomized interval to prevent habituation
+                builder.add('sleep', markers = markers, duration = int(rng.integers(2, 4)))
+                builder.destroy('arrow')
+
+            builder.add('write', text = f"trial {trial+1} complete. Press space to begin next trail", duration = 'space')
+            builder.destroy(*blocks, 'frame_rt', 'frame_lt')
+
+        builder.add('write', text = self.textEndExperiment, duration = 'space')
+        return builder.build(module = __name__, trials = self.trial)
+
+    def start_calibration(self):
+        self.accept("escape", sys.exit)
+        timeline = load_or_compile(self.schedule, self.scheduleSeed, self.scheduleFile)
+        TimelinePlayer(self).play(timeline)
 
     def run(self):
         self.start_calibration()
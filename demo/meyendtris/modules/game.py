@@ -22,7 +22,7 @@ The error detection mechanism is not currently implemented, but "simulated" usin
 
 To set up, make sure either a gaze or a cursor position LSL stream is available and that the width of the SNAP window equals the width of the screen, in pixels. This can be configured in src/studies/meyendtrisdisplaysettings.prc. The height of the window can also be adjusted there. Note that some eye trackers may not function if the SNAP window fills the entire screen. In that case, a window height slightly smaller than the screen height can be given.
 
-For game speed adaptation, a value between 1 and 2 must be written to self.bci. This value represents the user's current relaxation. SNAP allows this to be done through TCP by sending the string 'setup self.bci=1.5' (or any other number) to port 7897 of the computer on which SNAP is running (unless another port has been set). BCILAB has a built-in function to communicate with SNAP.
+For game speed adaptation, a value between 1 and 2 must be written to self.bci. This value represents the user's current relaxation. SNAP allows this to be done through TCP by sending the string 'setup self.bci=1.5' (or any other number) to port 7897 of the computer on which SNAP is running (unless another port has been set). BCILAB has a built-in function to communicate with SNAP. Alternatively, self.bciModel can be set to a CSP model file (see meyendtris.bci) to classify the EEG stream in-process and write self.bci directly.
 
 The size of the blocks can be varied to correspond to the eye tracker's accuracy. This is done by changing the number of rows in the playing field (self.rows). The block size will adjust automatically to fill the screen height.
 
@@ -56,70 +56,36 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 
+import threading
 from ctypes import windll
 from direct.gui.DirectGui import DirectEntry
 from framework.latentmodule import LatentModule
-from pylsl.pylsl import stream_inlet, resolve_stream, resolve_streams, vectorf
-from random import choice, random
-from time import time
-
-class MeyendtrisGame(LatentModule):
+from meyendtris.framework.gaze import GazeInlet
+from meyendtris.framework.scheduler import FrameScheduler
+from meyendtris.modules.tetris.boardmesh import BoardMesh
+from meyendtris.modules.tetris.renderer import FieldRenderer, RectangleSurface
+from meyendtris.modules.tetris.rules import MeyendtrisRules
+from pylsl.pylsl import stream_inlet, resolve_stream, resolve_streams, local_clock
+
+class MeyendtrisGame(LatentModule, MeyendtrisRules):
     def __init__(self):
         LatentModule.__init__(self)
+        MeyendtrisRules.__init__(self)          # game rules and their parameters (speed, dwell times, field size, tetrominoes)
 
         self.backgroundColour = (0, 0, 0, 1)    # background colour
-        self.fps = 60                           # frames per second
-
-        self.bciBufferLength = 120              # number of samples to take the mean of (collects 1 sample per frame)
 
         self.musicFile = "tetris.mp3"           # music file; playback speed will be scaled by BCI output
         self.musicPlayRateRange = [1.5, 0.75]   # playback speed range in # times normal speed [fastest, slowest]
-        self.moveTimeRange = [.4, 1.5]          # game speed range in seconds per step, also scaled by BCI output [fastest, slowest]
-        self.undoProbability = 0.00             # probability that a tetromino drop will be undone (to be replaced by ERP-based undo)
 
-        self.rows = 17                          # playing field configuration
-        self.cols = 10
+        self.useBoardMesh = True                # whether to draw the board as a single mesh (one draw call) rather than one rectangle per block
 
-        self.rotationRows = 4                   # number of upper rows to use as rotation area
+        self.bciModel = None                    # file name of a CSP model (see meyendtris.bci.model) to classify an EEG LSL stream with;
+                                                # if None, self.bci must be set externally
+        self.bciUpdateRate = 20                 # classifier outputs per second when using bciModel
+        self.bciPipeline = None                 # the running OnlinePipeline, if any
 
         # eyetracking vars
         self.showGaze = True                    # whether or not to show current gaze location
-        self._colOffset = 10                    # horizontal margin in pixels (column border margins will be ignored)
-        self.columnDwellTime = 5                # dwell time in frames for column selections
-        self.dropDwellTime = 300                # dwell time in frames for tetromino drops
-        self.rotationDwellTime = 60             # dwell time in frames for tetromino rotations
-        
-        self.mapDwellTimes = True               # whether or not to also adjust dwell times based on BCI input
-        self.columnDwellTimeRange = [5, 5]      # [fastest, slowest]
-        self.dropDwellTimeRange = [100, 300]
-        self.rotationDwellTimeRange = [30, 120]
-
-        self.tetrominoes = [                    # tetromino shapes; different numbers represent different colours
-                        [[0,1,0],
-                         [1,1,1]],
-
-                        [[2,0],
-                         [2,0],
-                         [2,2]],
-
-                        [[0,3],
-                         [0,3],
-                         [3,3]],
-
-                        [[4,4],
-                         [4,4]],
-
-                        [[5,5,0],
-                         [0,5,5]],
-
-                        [[0,6,6],
-                         [6,6,0]],
-
-                        [[7],
-                         [7],
-                         [7],
-                         [7]]
-                ]
 
         self.colours = [ (53/255.0, 115/255.0, 226/255.0, .9),      # the colours of the seven tetrominos;
                          (226/255.0, 65/255.0, 7/255.0, .9),        # the last colour is for the error animation
@@ -132,8 +98,8 @@ class MeyendtrisGame(LatentModule):
         
 
     def waitForUser(self):
-        # waiting for user to be ready
-        self.write(
+        # waiting for user to be ready (a time-consumption function: use with yield from)
+        return self.write(
                 text = "Press enter to continue",
                 fg = (.5, .5, .5, 1),
                 bg = ( 0,  0,  0,  .5),
@@ -142,96 +108,112 @@ class MeyendtrisGame(LatentModule):
 
     def get_gazeData(self):
         if self.inlet:
-            # getting current x, y position in pixels
-            sample = vectorf()
-            while self.inlet.pull_sample(sample, 0.0):
-                self._gazeX = list(sample)[self.inletXpos]
-                self._gazeY = list(sample)[self.inletYpos]
+            # getting all x, y positions in pixels received since the last frame;
+            # the last one is the current gaze position. all are passed on to fixation detection
+            self.inlet.pull()
+            self.receiveGaze(self.inlet.x, self.inlet.y, self.inlet.timestamps, local_clock())
 
             if self.showGaze and self._gazeX and self._gazeY:
                 self.highlightPixel(self._gazeX, self._gazeY)
 
 
+    def openStreams(self, kinds, timeout = 1.0):
+        # resolving the LSL streams and opening an inlet for the first stream of each of the given types;
+        # resolving blocks for the whole timeout, so run() calls this in a worker thread
+        streams = list(resolve_streams(timeout))
+        inlets = {}
+        for kind in kinds:
+            stream = next((s for s in streams if s.type() == kind), None)
+            if stream is not None:
+                print("Found", kind, "stream", stream.name(), "from", stream.hostname())
+                inlets[kind] = stream_inlet(stream)
+        return inlets
+
+
+    def startBCIPipeline(self, inlet):
+        # classifying the EEG stream in-process, writing the output to self.bci
+        # (imported here: the classifier needs SciPy, which the game does not need otherwise)
+        from meyendtris.bci.model import CSPModel
+        from meyendtris.bci.pipeline import OnlinePipeline
+        if inlet is None:
+            print("No EEG stream found: BCI model not used")
+            return
+        self.bciPipeline = OnlinePipeline(
+                CSPModel.load(self.bciModel),
+                inlet,
+                target = self,
+                update_rate = self.bciUpdateRate)
+        self.bciPipeline.start()
+
+
+    def stopBCIPipeline(self):
+        # stopping the classifier thread, so that it no longer writes to this module
+        if self.bciPipeline is not None:
+            self.bciPipeline.stop()
+            self.bciPipeline = None
+
+
+    def cancel(self):
+        self.stopBCIPipeline()
+        LatentModule.cancel(self)
+
+
     def run(self):
-        # finding stream
+        # finding streams, in a worker thread: run() executes on the main thread, which has to keep
+        # rendering and handling events while the streams are being resolved
         self.inlet = None
-        streams = list(resolve_streams(1.0))
-        try:
-            # first trying to find a gaze stream
-            stream = next(s for s in streams if s.type() == 'Gaze')
-            print("Found gaze stream", stream.name(), "from", stream.hostname())
-            self.inlet = stream_inlet(stream)
-            self.inletXpos = 0  # index of x screen position in each sample
-            self.inletYpos = 1  # index of y screen position in each sample
-        except:
-            try:
-                # if no gaze stream is available, trying to find a cursor position stream.
-                # most eye trackers allow the tracker to take control over the cursor, thus
-                # bypassing the requirement for LSL support by the tracker. this does
-                # require the LSL Mouse Connector to be running.
-                stream = next(s for s in streams if s.type() == 'Position')
-                print("Found position stream", stream.name(), "from", stream.hostname())
-                self.inlet = stream_inlet(stream)
-                self.inletXpos = 0
-                self.inletYpos = 1
-            except:
-                # fallback: manual control
-                print("No stream found: manual control")
-                self.showGaze = False
-                self.accept("arrow_left", self.moveTetromino, [0, -1])
-                self.accept("arrow_right", self.moveTetromino, [0, 1])
-                self.accept("arrow_down", self.moveTetromino, [1, 0])
-                self.accept("arrow_up", self.rotateTetromino)
-                self.accept("1", self.setSelectedColumn, [0])
-                self.accept("2", self.setSelectedColumn, [1])
-                self.accept("3", self.setSelectedColumn, [2])
-                self.accept("4", self.setSelectedColumn, [3])
-                self.accept("5", self.setSelectedColumn, [4])
-                self.accept("6", self.setSelectedColumn, [5])
-                self.accept("7", self.setSelectedColumn, [6])
-                self.accept("8", self.setSelectedColumn, [7])
-                self.accept("9", self.setSelectedColumn, [8])
-                self.accept("0", self.setSelectedColumn, [9])
-                self.accept("space", self.dropTetromino)
-                
+        inlets = {}
+        kinds = ['Gaze', 'Position', 'EEG'] if self.bciModel else ['Gaze', 'Position']
+        worker = threading.Thread(target = lambda: inlets.update(self.openStreams(kinds)), name = "openStreams", daemon = True)
+        worker.start()
+        while worker.is_alive():
+            yield from self.sleep(0.05)
+        if self.bciModel:
+            self.startBCIPipeline(inlets.get('EEG'))
+        if 'Gaze' in inlets:
+            # first trying to use a gaze stream
+            self.inlet = GazeInlet(inlets['Gaze'], xpos = 0, ypos = 1) # indices of x, y screen position in each sample
+        elif 'Position' in inlets:
+            # if no gaze stream is available, trying to use a cursor position stream.
+            # most eye trackers allow the tracker to take control over the cursor, thus
+            # bypassing the requirement for LSL support by the tracker. this does
+            # require the LSL Mouse Connector to be running.
+            self.inlet = GazeInlet(inlets['Position'], xpos = 0, ypos = 1)
+        else:
+            # fallback: manual control
+            print("No stream found: manual control")
+            self.showGaze = False
+            self.accept("arrow_left", self.moveTetromino, [0, -1])
+            self.accept("arrow_right", self.moveTetromino, [0, 1])
+            self.accept("arrow_down", self.moveTetromino, [1, 0])
+            self.accept("arrow_up", self.rotateTetromino)
+            self.accept("1", self.setSelectedColumn, [0])
+            self.accept("2", self.setSelectedColumn, [1])
+            self.accept("3", self.setSelectedColumn, [2])
+            self.accept("4", self.setSelectedColumn, [3])
+            self.accept("5", self.setSelectedColumn, [4])
+            self.accept("6", self.setSelectedColumn, [5])
+            self.accept("7", self.setSelectedColumn, [6])
+            self.accept("8", self.setSelectedColumn, [7])
+            self.accept("9", self.setSelectedColumn, [8])
+            self.accept("0", self.setSelectedColumn, [9])
+            self.accept("space", self.dropTetromino)
+            
         # setting background colour
         base.win.setClearColor(self.backgroundColour)
         
-        self.waitForUser()
-
-        # initial values
-        self.blockSize = 2.0 / self.rows
-        self.bci = 1.5
-        self.bciBuffer = [self.bci] * self.bciBufferLength
-        self.undoAnimation = False
-        self._currentSampleCol = -1
-        self._currentSelectedCol = -1
-        self._gazeX = None
-        self._gazeY = None
-        self._lastCol = None
-        self.pickedColumn = False
-        self.gazeDwellTimeList = []
-        self.inRotationArea = False
-        self.rotateTimeList = []
-
-        # generating game field array
-        self.field = [[0 for i in range(self.cols)] for j in range(self.rows)]
+        yield from self.waitForUser()
+
+        # initial values, generating game field
+        self.resetState()
         self.initialiseFieldGraphics()
 
-        # getting column boundaries in pixels
-        self.screensize = windll.user32.GetSystemMetrics(0), windll.user32.GetSystemMetrics(1)
-        farLeft = -(self.cols * self.blockSize) / 2.0
-        self.columnBoundaries = [[farLeft + (self.blockSize * col), farLeft + (self.blockSize * (col + 1))] for col in range(self.cols)]
-        for col in range(self.cols):
-            for boundary in range(2):
-                self.columnBoundaries[col][boundary] = int(self.map(
-                        self.columnBoundaries[col][boundary],
-                        [-base.getAspectRatio(), base.getAspectRatio()],
-                        [0, self.screensize[0]]))
+        # getting column boundaries and rotation area in pixels
+        farLeft, rotationPart = self.computeScreenAreas(
+                (windll.user32.GetSystemMetrics(0), windll.user32.GetSystemMetrics(1)),
+                base.getAspectRatio())
 
         # generating rotation area
-        rotationPart = (4 * self.blockSize) / 2.0
-        self.rotationArea = self.screensize[1] * rotationPart
         self.rotationAreaBoundaryGraphics = self.rectangle(
                 (farLeft, -farLeft, 1, 1 - (2.0 * rotationPart)),
                 color = (1, 1, 1, .1),
@@ -252,181 +234,69 @@ class MeyendtrisGame(LatentModule):
         # starting game: spawning first tetromino
         self.spawnTetromino()
 
-        # entering game loop
-        lastFrameTime = time()
-        lastMoveTime = time()
-
-        while True:
-            # getting current values
-            self.updateBCI()
-            self.get_gazeData()
-            self.check_RotationArea()
-            self.check_Columns()
-
-            # adjusting dependent values
-            self.music.setPlayRate(self.map(self.currentBCI, [1, 2], self.musicPlayRateRange))
-            if not self.inRotationArea: self.rotationAreaBoundaryGraphics.configure( color = (1, 1, 1, .1 ))
-            else: self.rotationAreaBoundaryGraphics.configure( color = (1, 1, 1, .25))
-            if self.mapDwellTimes:
-                self.columnDwellTime = self.map(self.currentBCI, [1, 2], self.columnDwellTimeRange)
-                self.dropDwellTime = self.map(self.currentBCI, [1, 2], self.dropDwellTimeRange)
-                self.rotationDwellTime = self.map(self.currentBCI, [1, 2], self.rotationDwellTimeRange)
-
-            # handling those actions that happen at game speed intervals
-            currentMoveTime = self.map(self.currentBCI, [1, 2], self.moveTimeRange)
-            if time() - lastMoveTime > currentMoveTime:
-                if self.undoAnimation:
-                    self.undoTetromino()
-                else:
-                    self.moveTetromino(1, 0)
-                lastMoveTime = time()
+        # entering game loop: frames are paced on a fixed grid of deadlines, and the game
+        # logic advances in fixed timesteps, independent of the actual frame times
+        # the game runs cooperatively on the main thread (run() is a generator, see LatentModule)
+        # (created only now, after the initial wait for the user and the setup, which would otherwise count as a frame)
+        self.frameScheduler = FrameScheduler(self.fps)
+        self.restartPending = False
 
+        try:
+            while True:
+                yield from self.gameFrame()
+        finally:
+            self.stopBCIPipeline()
+            print("Frame timing:", self.frameScheduler.stats)
+
+
+    def gameFrame(self):
+        # one frame of the game loop
+        if self.restartPending:
+            # game over: waiting for the user, then resetting the game field and spawning a new tetromino
+            self.restartPending = False
             self.updateFieldGraphics()
+            yield from self.waitForUser()
+            MeyendtrisRules.restartGame(self)
+            # the wait is not a frame interval
+            self.frameScheduler.restart()
 
-            self.sleep(1.0 / self.fps - (time() - lastFrameTime))
-            lastFrameTime = time()
-
-
-    def setSelectedColumn(self, col):
-        # changing currently selected column, and corresponding tetromino position
-        self._currentSelectedCol = col
-        self.positionTetronimo(col)
-
-
-    def updateBCI(self):
-        # updating current BCI buffer and mean value
-        self.bciBuffer.append(self.bci)
-        self.bciBuffer = self.bciBuffer[1:]
-        self.currentBCI = sum(self.bciBuffer) / float(len(self.bciBuffer))
-
-
-    def spawnTetromino(self):
-        # spawning random tetromino at top middle of the field
-        self.currentTetromino = choice(self.tetrominoes)
-        self.currentTetrominoTopLeft = [0, self.cols / 2 - len(self.currentTetromino[0]) / 2]
-
-        # resetting dwell times
-        self.resetGaze()
-
-        # ending game if there's no room for the selected tetromino
-        if self.collision(self.currentTetrominoTopLeft):
-            self.restartGame()
-
-
-    def moveTetromino(self, down, right):
-        # moving tetromino if no collision is detected at the indicated position;
-        # landing tetromino if a downward motion caused a colision
-        newTopLeft = [self.currentTetrominoTopLeft[0] + down, self.currentTetrominoTopLeft[1] + right]
-
-        if down > 0 and self.collision(newTopLeft):
-            self.landTetromino()
-        elif not self.collision(newTopLeft):
-            self.currentTetrominoTopLeft[0] += down
-            self.currentTetrominoTopLeft[1] += right
-
-    def dropTetromino(self):
-        # dropping tetromino by moving it downwards until it collides
-        while not self.collision([self.currentTetrominoTopLeft[0]+1, self.currentTetrominoTopLeft[1]]):
-            self.moveTetromino(1,0)
+        steps = self.frameScheduler.begin_frame()
 
-        self.landTetromino()
+        # getting current values
+        self.updateBCI(self.frameScheduler.now)
+        self.get_gazeData()
 
+        # advancing game logic: gaze dwell selections, BCI-scaled dwell times and game speed
+        for step in range(steps):
+            self.gameStep(self.frameScheduler.timestep)
+            if self.restartPending:
+                break
 
-    def positionTetronimo(self, column):
-        # moving tetromino horizontally towards selected column
-        # (in steps of one, because collision detection must happen at every step)
-        diff = self.currentTetrominoTopLeft[1] - column
-        if diff > 0:
-            for m in range(diff):
-                self.moveTetromino(0, -1)
-        elif diff < 0:
-            for m in range(abs(diff)):
-                self.moveTetromino(0, 1)
+        # adjusting dependent values
+        self.music.setPlayRate(self.map(self.currentBCI, [1, 2], self.musicPlayRateRange))
+        if not self.inRotationArea: self.rotationAreaBoundaryGraphics.configure( color = (1, 1, 1, .1 ))
+        else: self.rotationAreaBoundaryGraphics.configure( color = (1, 1, 1, .25))
 
+        self.updateFieldGraphics()
 
-    def rotateTetromino(self):
-        # rotating tetromino if no collision is caused
-        newShape = [list(i) for i in zip(*self.currentTetromino[::-1])]
-        if not self.collision(self.currentTetrominoTopLeft, newShape):
-            self.currentTetromino = newShape
-
-
-    def collision(self, newTopLeft, newShape = None):
-        # checking if the current tetromino at a newly indicated position, or
-        # a given tetromino shape at a given position, causes a collision,
-        # i.e. whether or not any blocks overlap with already-landed blocks
-        if newShape == None: newShape = self.currentTetromino
-        for row in range(len(newShape)):
-            for col in range(len(newShape[0])):
-                if not newShape[row][col] == 0:
-                    if newTopLeft[0]+row < 0 or newTopLeft[0]+row >= self.rows or newTopLeft[1]+col < 0 or newTopLeft[1]+col >= self.cols:
-                        return True
-                    elif not self.field[newTopLeft[0] + row][newTopLeft[1] + col] == 0:
-                        return True
-
-        return False
+        yield from self.sleep_until(self.frameScheduler.end_frame())
 
 
-    def landTetromino(self):
-        if random() < self.undoProbability:
-            # removing tetromino if error detected
-            self.undoTetromino()
-        else:
-            # adding tetromino to game field array
-            for row in range(len(self.currentTetromino)):
-                for col in range(len(self.currentTetromino[0])):
-                    if not self.currentTetromino[row][col] == 0:
-                        self.field[self.currentTetrominoTopLeft[0]+row][self.currentTetrominoTopLeft[1]+col] = self.currentTetromino[row][col]
-
-            self.clearLines()
-            self.spawnTetromino()
-
-
-    def undoTetromino(self):
-        # removing landed tetromino
-        # this method is called twice: once to start the animation (highlighting the field),
-        # once more to end the animation and spawn a new tetromino
-        if not self.undoAnimation:
-            # highlighting all empty field blocks
-            for row in range(self.rows):
-                for col in range(self.cols):
-                    if self.field[row][col] == 0:
-                        self.field[row][col] = 8
-            self.undoAnimation = True
-        else:
-            # reverting highlight, spawning new tetromino
-            for row in range(self.rows):
-                for col in range(self.cols):
-                    if self.field[row][col] == 8:
-                        self.field[row][col] = 0
-            self.undoAnimation = False
-            self.spawnTetromino()
-            
-            
     def restartGame(self):
-        self.updateFieldGraphics()
-        self.waitForUser()
+        # called from the game logic when the game is over; the restart
+        # happens at the beginning of the next frame (see gameFrame)
+        self.restartPending = True
         
-        # resetting game field
-        for row in range(self.rows):
-            for col in range(self.cols):
-                self.field[row][col] = 0
-                
-        self.updateFieldGraphics()
-        
-        self.spawnTetromino()
-        
-
-    def clearLines(self):
-        # checking for full horizontal rows
-        for row in range(self.rows):
-            if all(col > 0 for col in self.field[row]):
-                for r in range(row, -1, -1):
-                    self.field[r] = self.field[r-1][:]
-                self.field[0] = [0] * self.cols
-
 
     def initialiseFieldGraphics(self):
+        if self.useBoardMesh:
+            # drawing all field and overlay blocks as a single vertex-coloured mesh
+            self.fieldGraphics = self.overlayGraphics = None
+            board = BoardMesh(self.rows, self.cols, self.blockSize, base.aspect2d)
+            self._to_destroy.append(board)
+            self.fieldRenderer = FieldRenderer(self.field, board, self.colours)
+            return
+
         # drawing a rectangle for each element in the field array,
         # adding these to a fieldGraphics array
 
@@ -469,56 +339,21 @@ class MeyendtrisGame(LatentModule):
                                 duration = 0))
             self.overlayGraphics.append(rowGraphics)
 
+        # only cells that changed since the previous frame will be redrawn
+        self.fieldRenderer = FieldRenderer(
+                self.field,
+                RectangleSurface(self.fieldGraphics, self.overlayGraphics),
+                self.colours)
+
 
     def updateFieldGraphics(self):
-        # drawing the field
-        for row in range(self.rows):
-            for col in range(self.cols):
-                if self.field[row][col] == 0:
-                    self.fieldGraphics[row][col].configure(color = (.1, .1, .1, 1))
-                else:
-                    self.fieldGraphics[row][col].configure(color = self.colours[self.field[row][col]-1])
-
-        # drawing the current tetromino
-        for row in range(len(self.currentTetromino)):
-            for col in range(len(self.currentTetromino[0])):
-                drawrow = row + self.currentTetrominoTopLeft[0]
-                drawcol = col + self.currentTetrominoTopLeft[1]
-                if not self.currentTetromino[row][col] == 0:
-                    self.fieldGraphics[drawrow][drawcol].configure(color = self.colours[self.currentTetromino[row][col]-1])
-
-        # highlighting currently selected column using the overlay graphics
-        if not self._currentSelectedCol == -1:
-            for row in range(self.rows):
-                for col in range(self.cols):
-                    if col == self._currentSelectedCol:
-                        self.overlayGraphics[row][col].configure(color = (1,1,1,.25))
-                    else:
-                        self.overlayGraphics[row][col].configure(color = (1,1,1,.1))
-
-
-    def map(self, sourcevalue, sourcerange, targetrange):
-        # mapping a value from one range onto another
-
-        # converting source range into a 0-1 range
-        sourceSpan = sourcerange[1] - sourcerange[0]
-        if sourceSpan == 0 or sourcevalue == float("-inf"):
-            return targetrange[0]
-        elif sourcevalue == float("inf"):
-            return targetrange[1]
-        valueScaled = float(sourcevalue - sourcerange[0]) / sourceSpan
-
-        # converting the 0-1 range into a value in the right range
-        targetSpan = targetrange[1] - targetrange[0]
-        targetValue = targetrange[0] + (valueScaled * targetSpan)
-
-        # fixing it within the target range
-        if targetValue < min(targetrange):
-            targetValue = min(targetrange)
-        elif targetValue > max(targetrange):
-            targetValue = max(targetrange)
-
-        return targetValue
+        # drawing the field, the current tetromino and the selected column;
+        # only the cells that changed since the last call are touched
+        self.fieldRenderer.update(
+                self.currentPiece,
+                self.currentRotation,
+                self.currentTetrominoTopLeft,
+                self._currentSelectedCol)
 
 
     def toggleBCI(self):
@@ -535,48 +370,3 @@ class MeyendtrisGame(LatentModule):
         y = self.map(y, [0, self.screensize[1]], [1, -1])
         self.pixel.configure( pos = (x, 0, y) )
 
-
-    #eye
-    def check_RotationArea(self):
-        if self._gazeY and self._gazeY < self.rotationArea:
-            self.rotateTimeList.append(self._gazeY)
-            self.inRotationArea = True
-
-            if len(self.rotateTimeList) > self.rotationDwellTime:
-                self.rotateTetromino()
-                self.rotateTimeList = []
-                self.inRotationArea = False
-
-        else:
-            self.inRotationArea = False
-            self.rotateTimeList = []
-
-
-    def check_Columns(self):
-            self._lastCol = self._currentSampleCol
-            self.pickedColumn = False
-
-            for col in range(self.cols): #0-9
-                if self._gazeX > self.columnBoundaries[col][0] + self._colOffset and self._gazeX < self.columnBoundaries[col][1] - self._colOffset:
-                    self._currentSampleCol = col
-                    self.pickedColumn = True
-                    #print(self._currentSampleCol)
-
-            if self._currentSampleCol == self._lastCol and self._currentSampleCol != -1 and self.inRotationArea == False:
-                 self.gazeDwellTimeList.append(self._gazeX)
-                 if len(self.gazeDwellTimeList) > self.columnDwellTime: #random upper limit, has to be tested
-                    self.setSelectedColumn(self._currentSampleCol)
-                     # self.positionTetronimo(self._currentSampleCol)
-
-                 if len(self.gazeDwellTimeList) > self.dropDwellTime and self.inRotationArea == False:
-                     self.dropTetromino()
-                     self.gazeDwellTimeList = []
-
-            else: self.gazeDwellTimeList = []
-
-
-    def resetGaze(self):
-        # resetting gaze buffers
-        self.gazeDwellTimeList = []
-        self.rotateTimeList = []
-
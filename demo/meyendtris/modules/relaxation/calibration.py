@@ -38,9 +38,7 @@ import sys
 import meyendtris
 from meyendtris.framework.basicstimuli import BasicStimuli
 from panda3d.core import TextProperties, TextPropertiesManager
-from direct.gui.OnscreenImage import OnscreenImage
-from random import random
-from time import time
+import numpy as np
 
 class Main(BasicStimuli):
     def __init__(self):
@@ -55,10 +53,12 @@ class Main(BasicStimuli):
         
         self.beepSound = meyendtris.path_join("/media/ding.wav") # audio file for beep
         self.beepVolume = 1.0                       # beep volume, 0-1
+        self.asset_manifest = [('sound', self.beepSound), ('texture', 'media/blank.tga'), ('font', 'media/arial.ttf')]
         
         self.crossColour = (0.2, 0.2, 0.2, 1)       # crosshair colour
         
-        self.maxSquares = 3                        # maximum number of squares on the screen
+        self.maxSquares = 3                        # number of squares on the screen
+        self.noiseSeed = 0                          # seed of the visual noise, for reproducible sessions (None: different every run)
 
         self.textPressSpace = "Press space to continue"     # text to display before beginning
         self.textEndExperiment = "End of experiment \nPress 'escape' to exit"        # text to indicate end of experiment
@@ -108,13 +108,13 @@ class Main(BasicStimuli):
         tpMgr.setProperties("text", tp)
                 
         # initialising beep audio
-        beep = self._base.loader.loadSfx(self.beepSound)
+        beep = self._base.loader.loadSfx(self.assets.resolve(self.beepSound))
         beep.setVolume(self.beepVolume)
         beep.setLoop(False)
         
         self.waitForUser()
 
-        noise = []
+        noiseGenerator = np.random.default_rng(self.noiseSeed)
         for trial in range(self.trials):
             # starting of trial: sounding bell, waiting
             beep.play()            
@@ -138,30 +138,12 @@ class Main(BasicStimuli):
                     self.marker("chaos")
                     self.marker("chaos" + str(second))
                     
-                    # showing visual noise
-                    startTime = time()
-                    while time() < startTime + 1:
-                    
-                        red, green, blue, alpha = random(), random(), random(), random()
-                        height = self.map(random(), [0, 1], [-self._base.getAspectRatio(), self._base.getAspectRatio()])
-                        width = self.map(random(), [0, 1], [-self._base.getAspectRatio(), self._base.getAspectRatio()])
-                        x     = self.map(random(), [0, 1], [-1, 1])
-                        y     = self.map(random(), [0, 1], [-1, 1])
-                        
-                        square = OnscreenImage(image=meyendtris.path_join('/media/blank.tga'),
-                                color = (red, green, blue, alpha),
-                                pos = (x, 0, y),
-                                scale = (width, 0, height))
-                        square.setTransparency(1)
-                        noise.append(square)
-                        
-                        if len(noise) > self.maxSquares:
-                            noise[0].destroy()
-                            noise = noise[1:]
-                
-                        self.sleep(int(1 / self.fps))
-                
-                for square in noise:
-                    square.destroy()
+                    # showing visual noise: new squares at every frame, continuing
+                    # the sequence of the seeded generator
+                    self.noise(
+                            count = self.maxSquares,
+                            duration = 1,
+                            seed = noiseGenerator,
+                            rate = self.fps)
                     
         self.write(text = self.textEndExperiment, duration = 'space')
\ No newline at end of file
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+"""
+Single-mesh board graphics for Meyendtris.
+
+All field and overlay blocks are quads in one vertex-coloured GeomNode, so the
+whole board is drawn with a single draw call regardless of its size. Vertex
+positions are written once; colours live in their own vertex array (one RGBA
+byte quadruple per vertex) and are written straight into it through a
+memoryview when a cell changes.
+
+BoardMesh implements the surface interface used by FieldRenderer.
+"""
+
+from panda3d.core import (Geom, GeomNode, GeomTriangles, GeomVertexArrayFormat, GeomVertexData,
+                          GeomVertexFormat, GeomVertexWriter, InternalName, TransparencyAttrib)
+
+
+def _vertex_format():
+    """Vertex format with static positions in array 0 and byte colours in array 1."""
+    fmt = GeomVertexFormat()
+    fmt.addArray(GeomVertexArrayFormat(InternalName.getVertex(), 3, Geom.NTFloat32, Geom.CPoint))
+    fmt.addArray(GeomVertexArrayFormat(InternalName.getColor(), 4, Geom.NTUint8, Geom.CColor))
+    return GeomVertexFormat.registerFormat(fmt)
+
+
+class BoardMesh:
+    """
+    Board of rows x cols field blocks, each with a slightly smaller overlay block
+    on top, built as one GeomNode.
+    """
+
+    def __init__(self,
+                 rows,                          # number of rows of the playing field
+                 cols,                          # number of columns of the playing field
+                 blockSize,                     # size of a block in aspect2d units
+                 parent,                        # Panda3d NodePath to attach the board to (e.g. base.aspect2d)
+                 fieldColour=(.1, .1, .1, 1),   # initial colour of the field blocks
+                 overlayColour=(1, 1, 1, .1),   # initial colour of the overlay blocks
+                 margin=None):                  # inset of the overlay blocks; defaults to a tenth of the block size
+        self.rows = rows
+        self.cols = cols
+        if margin is None:
+            margin = blockSize / 10.0
+        self._packed = {}               # cache of colour tuple -> 16 bytes (four RGBA vertices)
+        self._view = None               # writable view on the colour array, valid until flush()
+
+        cells = rows * cols
+        self._vdata = GeomVertexData('board', _vertex_format(), Geom.UHDynamic)
+        self._vdata.uncleanSetNumRows(8 * cells)
+
+        # field quads come first, then overlay quads, so the overlay is drawn on top
+        farLeft = -(cols * blockSize) / 2.0
+        farTop = (rows * blockSize) / 2.0
+        vertex = GeomVertexWriter(self._vdata, InternalName.getVertex())
+        for inset in (0.0, margin):
+            for row in range(rows):
+                for col in range(cols):
+                    l = farLeft + (blockSize * col) + inset
+                    r = farLeft + (blockSize * (col + 1)) - inset
+                    t = farTop - (blockSize * row) - inset
+                    b = farTop - (blockSize * (row + 1)) + inset
+                    vertex.setData3f(l, 0, b)
+                    vertex.setData3f(r, 0, b)
+                    vertex.setData3f(r, 0, t)
+                    vertex.setData3f(l, 0, t)
+
+        triangles = GeomTriangles(Geom.UHStatic)
+        triangles.reserveNumVertices(12 * cells)
+        for quad in range(2 * cells):
+            first = 4 * quad
+            triangles.addVertices(first, first + 1, first + 2)
+            triangles.addVertices(first, first + 2, first + 3)
+
+        geom = Geom(self._vdata)
+        geom.addPrimitive(triangles)
+        node = GeomNode('board')
+        node.addGeom(geom)
+        self.nodepath = parent.attachNewNode(node)
+        self.nodepath.setTransparency(TransparencyAttrib.MAlpha)
+
+        # initial colours
+        view = self._colour_view()
+        view[:16 * cells] = self._pack(fieldColour) * cells
+        view[16 * cells:] = self._pack(overlayColour) * cells
+        self.flush()
+
+    def _pack(self, colour):
+        """Convert an (r,g,b,a) float colour into the bytes of four vertices."""
+        packed = self._packed.get(colour)
+        if packed is None:
+            packed = bytes(min(255, max(0, int(round(c * 255)))) for c in colour) * 4
+            self._packed[colour] = packed
+        return packed
+
+    def _colour_view(self):
+        if self._view is None:
+            # modifyArray() marks the array as changed, so it is uploaded again at the next render
+            self._view = memoryview(self._vdata.modifyArray(1)).cast('B')
+        return self._view
+
+    # === surface interface (see FieldRenderer) ===
+
+    def set_cell(self, row, col, colour):
+        offset = 16 * (row * self.cols + col)
+        self._colour_view()[offset:offset + 16] = self._pack(colour)
+
+    def set_overlay(self, row, col, colour):
+        offset = 16 * ((self.rows + row) * self.cols + col)
+        self._colour_view()[offset:offset + 16] = self._pack(colour)
+
+    def flush(self):
+        """Release the colour view; the next change will mark the array as modified again."""
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+
+    def destroy(self):
+        self.flush()
+        self.nodepath.removeNode()
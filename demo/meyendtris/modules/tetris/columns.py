@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+"""
+Lookup of the playing field column under a horizontal gaze position.
+
+ColumnLookup precomputes, for every pixel of the screen width, the column it
+belongs to, with -1 for column margins and everything outside the field. A
+gaze x coordinate is then mapped to its column with a single array access,
+and whole NumPy chunks of samples are labelled at once. Pixel p covers the
+coordinates [p, p+1), so the lookup has a resolution of one pixel.
+"""
+
+import numpy as np
+
+
+class ColumnLookup:
+    """Pixel-indexed table mapping screen x coordinates to field columns (-1: margin / no column)."""
+
+    def __init__(self,
+                 columnBoundaries,      # [left, right] pixel boundaries of each column
+                 width,                 # screen width in pixels
+                 margin=0):             # margin in pixels at both sides of each column that belongs to no column
+        self.width = int(width)
+        self.table = np.full(self.width, -1, dtype=np.int16)
+        for col, (left, right) in enumerate(columnBoundaries):
+            first = max(int(np.ceil(left + margin)), 0)
+            last = min(int(np.ceil(right - margin)), self.width)
+            self.table[first:last] = col
+
+    def column(self, x):
+        """Column of a single x coordinate, or -1."""
+        if not 0 <= x < self.width:     # also rejects NaN
+            return -1
+        return int(self.table[int(x)])
+
+    def columns(self, x):
+        """Columns of an array of x coordinates, -1 for margins, positions outside the screen and NaN."""
+        x = np.asarray(x, dtype=float)
+        inside = (x >= 0) & (x < self.width)
+        labels = np.full(x.shape, -1, dtype=np.int16)
+        labels[inside] = self.table[x[inside].astype(np.intp)]
+        return labels
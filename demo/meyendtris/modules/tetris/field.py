@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+"""
+Bitboard-backed playing field for Meyendtris.
+
+Each row of the field is stored as an integer bitmask (bit c set means column c
+is occupied), and each rotation of each tetromino is precomputed as a tuple of
+row masks. Collision tests, landing, full-row detection and row removal thus
+only touch the handful of rows covered by the current tetromino, independent
+of the size of the board. The colours of landed blocks are kept in a parallel,
+flat bytearray of rows*cols entries.
+
+This module does not depend on Panda3D and can be used for headless simulation.
+"""
+
+
+def rotate_shape(shape):
+    """Rotate a tetromino matrix clockwise (same rule as the original game)."""
+    return [list(i) for i in zip(*shape[::-1])]
+
+
+class Tetromino:
+    """
+    A tetromino with all of its rotations precomputed.
+
+    For every rotation r, shapes[r] holds the colour matrix (as used for drawing),
+    masks[r] holds one left-aligned bitmask per row, and widths[r]/heights[r] the
+    size of the bounding box. cells[r] lists the (row, col) offsets of all blocks.
+    """
+    __slots__ = ('index', 'colour', 'shapes', 'masks', 'widths', 'heights', 'cells')
+
+    def __init__(self, index, shape):
+        self.index = index
+        self.colour = max(max(row) for row in shape)
+        self.shapes = []
+        self.masks = []
+        self.widths = []
+        self.heights = []
+        self.cells = []
+
+        # rotating until we are back at the initial orientation
+        current = [list(row) for row in shape]
+        while current not in self.shapes:
+            self.shapes.append(current)
+            self.masks.append(tuple(
+                sum(1 << col for col, value in enumerate(row) if value) for row in current))
+            self.widths.append(len(current[0]))
+            self.heights.append(len(current))
+            self.cells.append(tuple(
+                (row, col) for row in range(len(current)) for col in range(len(current[0])) if current[row][col]))
+            current = rotate_shape(current)
+
+    @property
+    def rotations(self):
+        """Number of distinct rotations of this tetromino."""
+        return len(self.shapes)
+
+
+class BitboardField:
+    """
+    Playing field of rows x cols cells, stored as one integer bitmask per row.
+
+    Landed blocks are stored in self.rows (occupancy) and self.colours (colour
+    index per cell, row-major, 0 = empty). Positions are given as (top, left)
+    of the tetromino's bounding box, as in MeyendtrisGame.currentTetrominoTopLeft.
+    """
+
+    def __init__(self,
+                 rows=17,       # number of rows of the playing field
+                 cols=10,       # number of columns of the playing field
+                 tetrominoes=None): # list of tetromino matrices; different numbers represent different colours
+        self.height = rows
+        self.width = cols
+        self.full = (1 << cols) - 1     # mask of a completely filled row
+        self.rows = [0] * rows          # occupancy bitmask per row
+        self.colours = bytearray(rows * cols) # colour index per cell
+        self.highlight = 0              # colour of highlighted empty cells (see highlight_empty()), 0 if none
+        self._saved_rows = None         # occupancy before highlight_empty() was called
+        self.dirty_rows = set(range(rows)) # rows whose colours changed since the last take_dirty_rows()
+        self.tetrominoes = [Tetromino(i, shape) for i, shape in enumerate(tetrominoes or [])]
+
+    # ===============
+    # === queries ===
+    # ===============
+
+    def collision(self, piece, rotation, top, left):
+        """
+        Check whether the given tetromino rotation at (top, left) would overlap
+        with the field boundaries or any landed blocks.
+        """
+        if top < 0 or left < 0 or left + piece.widths[rotation] > self.width or top + piece.heights[rotation] > self.height:
+            return True
+        rows = self.rows
+        for offset, mask in enumerate(piece.masks[rotation]):
+            if rows[top + offset] & (mask << left):
+                return True
+        return False
+
+    def drop_row(self, piece, rotation, top, left):
+        """Return the lowest row the tetromino can be moved down to from (top, left)."""
+        while not self.collision(piece, rotation, top + 1, left):
+            top += 1
+        return top
+
+    def cell(self, row, col):
+        """Colour index of the given cell (0 = empty)."""
+        colour = self.colours[row * self.width + col]
+        if not colour and self.highlight and self.rows[row] >> col & 1:
+            return self.highlight
+        return colour
+
+    def take_dirty_rows(self):
+        """Return the set of rows that changed since the last call, and reset it."""
+        dirty = self.dirty_rows
+        self.dirty_rows = set()
+        return dirty
+
+    def occupancy(self):
+        """Number of occupied cells."""
+        return sum(bin(row).count('1') for row in self.rows)
+
+    def __getitem__(self, row):
+        """Colours of a single row, for compatibility with the list-of-lists field."""
+        return [self.cell(row, col) for col in range(self.width)]
+
+    def __len__(self):
+        return self.height
+
+    # =================
+    # === mutations ===
+    # =================
+
+    def land(self, piece, rotation, top, left):
+        """
+        Write the tetromino into the field and remove any rows it completed.
+        Returns the list of removed row indices (top to bottom, as they were before removal).
+        """
+        rows = self.rows
+        colours = self.colours
+        colour = piece.colour
+        for offset, mask in enumerate(piece.masks[rotation]):
+            rows[top + offset] |= mask << left
+        for row, col in piece.cells[rotation]:
+            colours[(top + row) * self.width + left + col] = colour
+        self.dirty_rows.update(range(top, top + piece.heights[rotation]))
+        return self.clear_lines(top, top + piece.heights[rotation])
+
+    def clear_lines(self, first=0, last=None):
+        """
+        Remove all full rows between first (inclusive) and last (exclusive), shifting
+        the rows above them down. Returns the list of removed row indices.
+        """
+        if last is None:
+            last = self.height
+        full = [row for row in range(first, last) if self.rows[row] == self.full]
+        width = self.width
+        for row in full:
+            # rows are removed top to bottom, so the indices of later rows stay valid
+            del self.rows[row]
+            self.rows.insert(0, 0)
+            del self.colours[row * width:(row + 1) * width]
+            self.colours[0:0] = bytes(width)
+        if full:
+            # every row above the lowest removed one has shifted
+            self.dirty_rows.update(range(full[-1] + 1))
+        return full
+
+    def highlight_empty(self, colour):
+        """Fill all empty cells with the given colour (they count as occupied until unhighlight())."""
+        if self._saved_rows is None:
+            self._saved_rows = self.rows[:]
+        self.rows = [self.full] * self.height
+        self.highlight = colour
+        self.dirty_rows.update(range(self.height))
+
+    def unhighlight(self):
+        """Revert highlight_empty()."""
+        if self._saved_rows is not None:
+            self.rows = self._saved_rows
+            self._saved_rows = None
+        self.highlight = 0
+        self.dirty_rows.update(range(self.height))
+
+    def reset(self):
+        """Remove all blocks from the field."""
+        self.rows = [0] * self.height
+        self.colours = bytearray(self.height * self.width)
+        self.highlight = 0
+        self._saved_rows = None
+        self.dirty_rows.update(range(self.height))
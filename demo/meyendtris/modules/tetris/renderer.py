@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+"""
+Incremental renderer for the Meyendtris playing field.
+
+Instead of reconfiguring every cell of the board each frame, FieldRenderer
+remembers what it last drew and only pushes colours for cells that may have
+changed since: rows the field reports as dirty (landed, cleared or highlighted
+blocks), the previous and current footprint of the falling tetromino, and the
+overlay cells of the previously and currently selected column.
+
+The actual drawing is delegated to a surface, which needs to implement
+set_cell(row, col, colour), set_overlay(row, col, colour) and flush(), the
+latter being called once per update() after all changes have been made.
+"""
+
+
+class RectangleSurface:
+    """Surface backed by one Panda3D object per cell, as created by BasicStimuli.rectangle()."""
+
+    def __init__(self, fieldGraphics, overlayGraphics):
+        self.fieldGraphics = fieldGraphics      # rows x cols list of field rectangles
+        self.overlayGraphics = overlayGraphics  # rows x cols list of overlay rectangles
+
+    def set_cell(self, row, col, colour):
+        self.fieldGraphics[row][col].configure(color = colour)
+
+    def set_overlay(self, row, col, colour):
+        self.overlayGraphics[row][col].configure(color = colour)
+
+    def flush(self):
+        pass
+
+
+class FieldRenderer:
+    """
+    Draws a BitboardField plus the falling tetromino onto a surface, touching only
+    the cells that changed since the previous update().
+    """
+
+    def __init__(self,
+                 field,                             # the BitboardField to draw
+                 surface,                           # object implementing set_cell(), set_overlay() and flush()
+                 colours,                           # list of (r,g,b,a) colours; colour index i is drawn as colours[i-1]
+                 emptyColour=(.1, .1, .1, 1),       # colour of empty cells
+                 overlayColour=(1, 1, 1, .1),       # colour of the overlay blocks
+                 selectedColour=(1, 1, 1, .25)):    # colour of the overlay blocks in the selected column
+        self.field = field
+        self.surface = surface
+        self.colours = colours
+        self.emptyColour = emptyColour
+        self.overlayColour = overlayColour
+        self.selectedColour = selectedColour
+        self.cellsDrawn = 0                 # number of cells pushed to the surface during the last update()
+
+        self._drawn = [[None] * field.width for _ in range(field.height)] # colour index last drawn per cell
+        self._footprint = ()                # cells covered by the tetromino during the last update()
+        self._selected = -1                 # column highlighted during the last update()
+
+    def invalidate(self):
+        """Force a full redraw at the next update(), e.g. after the surface was rebuilt."""
+        self._drawn = [[None] * self.field.width for _ in range(self.field.height)]
+        self.field.dirty_rows.update(range(self.field.height))
+        self._selected = None
+
+    def update(self, piece, rotation, topLeft, selectedCol):
+        """Draw all changes since the last call; piece may be None if no tetromino is falling."""
+        field = self.field
+        drawn = self._drawn
+        set_cell = self.surface.set_cell
+
+        # cells covered by the falling tetromino
+        if piece is not None:
+            top, left = topLeft
+            footprint = tuple((top + row, left + col) for row, col in piece.cells[rotation])
+            pieceColour = piece.colour
+        else:
+            footprint = ()
+            pieceColour = 0
+
+        # collecting all cells that may have changed
+        candidates = set(self._footprint)
+        candidates.update(footprint)
+        width = field.width
+        for row in field.take_dirty_rows():
+            candidates.update((row, col) for col in range(width))
+        covered = set(footprint)
+
+        count = 0
+        for row, col in candidates:
+            colour = pieceColour if (row, col) in covered else field.cell(row, col)
+            if drawn[row][col] != colour:
+                drawn[row][col] = colour
+                set_cell(row, col, self.emptyColour if colour == 0 else self.colours[colour-1])
+                count += 1
+        self._footprint = footprint
+
+        # moving the column highlight in the overlay
+        if selectedCol != self._selected and selectedCol != -1:
+            set_overlay = self.surface.set_overlay
+            if self._selected is None:
+                for row in range(field.height):
+                    for col in range(width):
+                        set_overlay(row, col, self.overlayColour)
+            elif self._selected != -1:
+                for row in range(field.height):
+                    set_overlay(row, self._selected, self.overlayColour)
+            for row in range(field.height):
+                set_overlay(row, selectedCol, self.selectedColour)
+            count += field.height
+            self._selected = selectedCol
+
+        if count:
+            self.surface.flush()
+        self.cellsDrawn = count
@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+
+"""
+Game rules of Meyendtris, independent of Panda3D, windows and LSL.
+
+MeyendtrisRules holds the game state and implements spawning, moving, rotating,
+dropping, line clearing, the (simulated) error undo, the gaze dwell logic and
+the BCI-driven game speed. MeyendtrisGame combines it with a LatentModule for
+graphics, sound and input; MeyendtrisSimulation (see simulation.py) drives it
+headless from recorded traces.
+
+Gaze coordinates are given in screen pixels, as delivered by the eye tracker.
+All samples received during a frame are passed in through receiveGaze() and
+grouped into fixations by a FixationDetector. Dwell times are the accumulated
+durations, in milliseconds, of the fixations on the rotation area or on a
+column since the gaze last fixated elsewhere, so they do not depend on the
+frame rate.
+"""
+
+import numpy as np
+from random import Random
+from meyendtris.framework.fixations import FixationDetector
+from meyendtris.framework.smoothing import create_smoother
+from meyendtris.modules.tetris.columns import ColumnLookup
+from meyendtris.modules.tetris.field import BitboardField
+
+
+class MeyendtrisRules:
+    def __init__(self):
+        self.fps = 60                           # frames per second
+
+        self.bci = 1.5                          # current (raw) BCI value between 1 and 2, set remotely or by a BCI pipeline
+        self.bciBufferLength = 120              # number of samples to take the mean of (collects 1 sample per frame)
+        self.bciSmoothing = 'mean'              # how BCI values are smoothed: 'mean' or 'median' of the last bciBufferLength samples,
+                                                # 'exponential' (time constant bciWindow), or 'window' (mean of the last bciWindow seconds)
+        self.bciWindow = 2.0                    # time window/constant in seconds for 'window' and 'exponential' smoothing
+
+        self.moveTimeRange = [.4, 1.5]          # game speed range in seconds per step, also scaled by BCI output [fastest, slowest]
+        self.undoProbability = 0.00             # probability that a tetromino drop will be undone (to be replaced by ERP-based undo)
+
+        self.rows = 17                          # playing field configuration
+        self.cols = 10
+
+        self.rotationRows = 4                   # number of upper rows to use as rotation area
+
+        # eyetracking vars
+        self._colOffset = 10                    # horizontal margin in pixels (column border margins will be ignored)
+        self.columnDwellTime = 80               # dwell time in ms for column selections
+        self.dropDwellTime = 5000               # dwell time in ms for tetromino drops
+        self.rotationDwellTime = 1000           # dwell time in ms for tetromino rotations
+
+        self.mapDwellTimes = True               # whether or not to also adjust dwell times based on BCI input
+        self.columnDwellTimeRange = [80, 80]    # [fastest, slowest]
+        self.dropDwellTimeRange = [1700, 5000]
+        self.rotationDwellTimeRange = [500, 2000]
+
+        self.fixationMethod = 'dispersion'      # fixation detection: 'dispersion' (I-DT) or 'velocity' (I-VT)
+        self.fixationDispersion = 50            # maximum dispersion of a fixation in pixels (I-DT)
+        self.fixationVelocity = 1000            # maximum gaze velocity within a fixation in pixels per second (I-VT)
+        self.fixationMinDuration = 50           # minimum fixation duration in ms
+        self.fixationTolerance = 30             # gaze leaving a fixation for less than this many ms is ignored as noise
+
+        self.rng = Random()                     # random number generator for tetromino choice and undo decisions
+
+        self.tetrominoes = [                    # tetromino shapes; different numbers represent different colours
+                        [[0,1,0],
+                         [1,1,1]],
+
+                        [[2,0],
+                         [2,0],
+                         [2,2]],
+
+                        [[0,3],
+                         [0,3],
+                         [3,3]],
+
+                        [[4,4],
+                         [4,4]],
+
+                        [[5,5,0],
+                         [0,5,5]],
+
+                        [[0,6,6],
+                         [6,6,0]],
+
+                        [[7],
+                         [7],
+                         [7],
+                         [7]]
+                ]
+
+
+    def resetState(self):
+        # initial values
+        self.blockSize = 2.0 / self.rows
+        self.bci = 1.5
+        self.bciSmoother = create_smoother(
+                self.bciSmoothing,
+                length = self.bciBufferLength,
+                window = self.bciWindow,
+                timeconstant = self.bciWindow,
+                initial = self.bci)
+        self._bciReceived = False
+        self.currentBCI = self.bci
+        self.undoAnimation = False
+        self.moveTimer = 0.0
+        self._currentSampleCol = -1
+        self._currentSelectedCol = -1
+        self._gazeX = None
+        self._gazeY = None
+        self.gazeSamplesX = np.empty(0)         # all gaze samples received since the last frame (see receiveGaze)
+        self.gazeSamplesY = np.empty(0)
+        self.gazeTimestamps = np.empty(0)
+        self.gazeColumns = np.empty(0, dtype=np.int16) # column of each of these samples (-1: margin / no column)
+        self.fixationDetector = FixationDetector(
+                self.fixationMethod,
+                dispersion = self.fixationDispersion,
+                velocity = self.fixationVelocity,
+                min_duration = self.fixationMinDuration,
+                tolerance = self.fixationTolerance)
+        self._fixationTarget = None             # 'rotation' or column of the current fixation
+        self._fixationCounted = 0.0             # part of the current fixation's duration already added to the dwell times
+        self.columnDwell = 0.0                  # accumulated fixation time in ms on the column self._currentSampleCol
+        self.rotationDwell = 0.0                # accumulated fixation time in ms on the rotation area
+        self.inRotationArea = False
+
+        # statistics
+        self.tetrominoesLanded = 0
+        self.linesCleared = 0
+        self.tetrominoesUndone = 0
+        self.gamesOver = 0
+
+        # generating game field (one integer bitmask per row)
+        self.field = BitboardField(self.rows, self.cols, self.tetrominoes)
+
+
+    def computeScreenAreas(self, screensize, aspectRatio):
+        # getting column boundaries in pixels and the pixel-to-column lookup table;
+        # these only need to be recomputed when the screen or the field layout change
+        key = (tuple(screensize), aspectRatio, self.rows, self.cols, self._colOffset)
+        if getattr(self, '_screenAreasKey', None) == key:
+            return self._screenAreas
+        self.screensize = screensize
+        farLeft = -(self.cols * self.blockSize) / 2.0
+        self.columnBoundaries = [[farLeft + (self.blockSize * col), farLeft + (self.blockSize * (col + 1))] for col in range(self.cols)]
+        for col in range(self.cols):
+            for boundary in range(2):
+                self.columnBoundaries[col][boundary] = int(self.map(
+                        self.columnBoundaries[col][boundary],
+                        [-aspectRatio, aspectRatio],
+                        [0, self.screensize[0]]))
+        self.columnLookup = ColumnLookup(self.columnBoundaries, self.screensize[0], self._colOffset)
+
+        # getting rotation area in pixels
+        rotationPart = (4 * self.blockSize) / 2.0
+        self.rotationArea = self.screensize[1] * rotationPart
+        self._screenAreasKey = key
+        self._screenAreas = farLeft, rotationPart
+        return farLeft, rotationPart
+
+
+    def gameStep(self, dt):
+        # advancing the game logic by one frame of dt seconds,
+        # using the dwell times accumulated by receiveGaze() and the current value of self.bci
+        self.check_RotationArea()
+        self.check_Columns()
+        self.updateDwellTimes()
+        self.updateMoveTimer(dt)
+
+
+    def updateBCI(self, now):
+        # updating current smoothed BCI value; self.bci is sampled once per frame
+        # unless samples were received through receiveBCI() since the last frame
+        if not self._bciReceived:
+            self.bciSmoother.push(self.bci, now)
+        self._bciReceived = False
+        self.currentBCI = self.bciSmoother.value
+
+
+    def receiveBCI(self, values, timestamps = None):
+        # adding one or more classifier outputs (with their sample times, in seconds)
+        self.currentBCI = self.bciSmoother.extend(values, timestamps)
+        self.bci = values[-1]
+        self._bciReceived = True
+
+
+    def receiveGaze(self, x, y, timestamps, now = None):
+        # processing all gaze samples (in pixels, timestamps in seconds) received since the
+        # last frame, dropping invalid (NaN) ones; the most recent valid sample becomes the
+        # current gaze position. if there are none, the last position is taken to still be
+        # valid at time now (e.g. for cursor streams, which only send samples on movement)
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        timestamps = np.asarray(timestamps, dtype=float)
+        valid = np.isfinite(x) & np.isfinite(y)
+        if not valid.all():
+            x, y, timestamps = x[valid], y[valid], timestamps[valid]
+        self.gazeSamplesX = x
+        self.gazeSamplesY = y
+        self.gazeTimestamps = timestamps
+        self.gazeColumns = self.columnLookup.columns(x)
+        if len(x):
+            self._gazeX = float(x[-1])
+            self._gazeY = float(y[-1])
+            self.processFixations(self.fixationDetector.process(x, y, timestamps))
+        elif now is not None and self._gazeX is not None:
+            self.processFixations(self.fixationDetector.process([self._gazeX], [self._gazeY], [now]))
+
+
+    def processFixations(self, events):
+        # adding the time spent in fixations to the dwell time of their target
+        for event in events:
+            if event.kind == 'start':
+                self._fixationTarget = self.fixationTarget(event.x, event.y)
+                self._fixationCounted = 0.0
+            elapsed = event.duration - self._fixationCounted
+            self._fixationCounted = event.duration
+            if self._fixationTarget == 'rotation':
+                self.rotationDwell += elapsed
+            elif self._fixationTarget is not None:
+                self.columnDwell += elapsed
+            if event.kind == 'end':
+                self._fixationTarget = None
+        self.inRotationArea = self._fixationTarget == 'rotation'
+
+
+    def fixationTarget(self, x, y):
+        # finding the target of a new fixation: 'rotation', a column, or None; fixations
+        # on a column margin continue the current column. dwell times of other targets are reset
+        if y < self.rotationArea:
+            self.columnDwell = 0.0
+            return 'rotation'
+        self.rotationDwell = 0.0
+        col = self.columnLookup.column(x)
+        if col != -1 and col != self._currentSampleCol:
+            self._currentSampleCol = col
+            self.columnDwell = 0.0
+        return self._currentSampleCol if self._currentSampleCol != -1 else None
+
+
+    def updateDwellTimes(self):
+        # adjusting dwell times to the current BCI value
+        if self.mapDwellTimes:
+            self.columnDwellTime = self.map(self.currentBCI, [1, 2], self.columnDwellTimeRange)
+            self.dropDwellTime = self.map(self.currentBCI, [1, 2], self.dropDwellTimeRange)
+            self.rotationDwellTime = self.map(self.currentBCI, [1, 2], self.rotationDwellTimeRange)
+
+
+    def updateMoveTimer(self, dt):
+        # handling those actions that happen at game speed intervals
+        self.moveTimer += dt
+        currentMoveTime = self.map(self.currentBCI, [1, 2], self.moveTimeRange)
+        if self.moveTimer > currentMoveTime:
+            if self.undoAnimation:
+                self.undoTetromino()
+            else:
+                self.moveTetromino(1, 0)
+            self.moveTimer = 0.0
+
+
+    def setSelectedColumn(self, col):
+        # changing currently selected column, and corresponding tetromino position
+        self._currentSelectedCol = col
+        self.positionTetronimo(col)
+
+
+    def spawnTetromino(self):
+        # spawning random tetromino at top middle of the field
+        self.currentPiece = self.rng.choice(self.field.tetrominoes)
+        self.currentRotation = 0
+        self.currentTetromino = self.currentPiece.shapes[0]
+        self.currentTetrominoTopLeft = [0, self.cols // 2 - len(self.currentTetromino[0]) // 2]
+
+        # resetting dwell times
+        self.resetGaze()
+
+        # ending game if there's no room for the selected tetromino
+        if self.collision(self.currentTetrominoTopLeft):
+            self.restartGame()
+
+
+    def moveTetromino(self, down, right):
+        # moving tetromino if no collision is detected at the indicated position;
+        # landing tetromino if a downward motion caused a colision
+        newTopLeft = [self.currentTetrominoTopLeft[0] + down, self.currentTetrominoTopLeft[1] + right]
+
+        if down > 0 and self.collision(newTopLeft):
+            self.landTetromino()
+        elif not self.collision(newTopLeft):
+            self.currentTetrominoTopLeft[0] += down
+            self.currentTetrominoTopLeft[1] += right
+
+    def dropTetromino(self):
+        # dropping tetromino by moving it downwards until it collides
+        self.currentTetrominoTopLeft[0] = self.field.drop_row(
+                self.currentPiece, self.currentRotation, *self.currentTetrominoTopLeft)
+
+        self.landTetromino()
+
+
+    def positionTetronimo(self, column):
+        # moving tetromino horizontally towards selected column
+        # (in steps of one, because collision detection must happen at every step)
+        diff = self.currentTetrominoTopLeft[1] - column
+        if diff > 0:
+            for m in range(diff):
+                self.moveTetromino(0, -1)
+        elif diff < 0:
+            for m in range(abs(diff)):
+                self.moveTetromino(0, 1)
+
+
+    def rotateTetromino(self):
+        # rotating tetromino if no collision is caused
+        newRotation = (self.currentRotation + 1) % self.currentPiece.rotations
+        if not self.collision(self.currentTetrominoTopLeft, newRotation):
+            self.currentRotation = newRotation
+            self.currentTetromino = self.currentPiece.shapes[newRotation]
+
+
+    def collision(self, newTopLeft, newRotation = None):
+        # checking if the current tetromino at a newly indicated position, or
+        # in a given rotation at a given position, causes a collision,
+        # i.e. whether or not any blocks overlap with already-landed blocks
+        if newRotation is None: newRotation = self.currentRotation
+        return self.field.collision(self.currentPiece, newRotation, newTopLeft[0], newTopLeft[1])
+
+
+    def landTetromino(self):
+        if self.rng.random() < self.undoProbability:
+            # removing tetromino if error detected
+            self.undoTetromino()
+        else:
+            # adding tetromino to game field, removing any rows it completed
+            cleared = self.field.land(self.currentPiece, self.currentRotation, *self.currentTetrominoTopLeft)
+            self.tetrominoesLanded += 1
+            self.linesCleared += len(cleared)
+            self.spawnTetromino()
+
+
+    def undoTetromino(self):
+        # removing landed tetromino
+        # this method is called twice: once to start the animation (highlighting the field),
+        # once more to end the animation and spawn a new tetromino
+        if not self.undoAnimation:
+            # highlighting all empty field blocks
+            self.field.highlight_empty(8)
+            self.undoAnimation = True
+            self.tetrominoesUndone += 1
+        else:
+            # reverting highlight, spawning new tetromino
+            self.field.unhighlight()
+            self.undoAnimation = False
+            self.spawnTetromino()
+
+
+    def restartGame(self):
+        # resetting game field
+        self.gamesOver += 1
+        self.field.reset()
+        self.spawnTetromino()
+
+
+    def clearLines(self):
+        # removing full horizontal rows
+        return self.field.clear_lines()
+
+
+    def map(self, sourcevalue, sourcerange, targetrange):
+        # mapping a value from one range onto another
+
+        # converting source range into a 0-1 range
+        sourceSpan = sourcerange[1] - sourcerange[0]
+        if sourceSpan == 0 or sourcevalue == float("-inf"):
+            return targetrange[0]
+        elif sourcevalue == float("inf"):
+            return targetrange[1]
+        valueScaled = float(sourcevalue - sourcerange[0]) / sourceSpan
+
+        # converting the 0-1 range into a value in the right range
+        targetSpan = targetrange[1] - targetrange[0]
+        targetValue = targetrange[0] + (valueScaled * targetSpan)
+
+        # fixing it within the target range
+        if targetValue < min(targetrange):
+            targetValue = min(targetrange)
+        elif targetValue > max(targetrange):
+            targetValue = max(targetrange)
+
+        return targetValue
+
+
+    #eye
+    def check_RotationArea(self):
+        # rotating tetromino after each rotationDwellTime ms of fixations on the rotation area
+        if self.rotationDwell > self.rotationDwellTime:
+            self.rotateTetromino()
+            self.rotationDwell = 0.0
+
+
+    def check_Columns(self):
+        # moving tetromino to the fixated column after columnDwellTime ms, dropping it after dropDwellTime ms
+        if self._currentSampleCol != -1 and self.columnDwell > self.columnDwellTime:
+            self.setSelectedColumn(self._currentSampleCol)
+
+        if self.columnDwell > self.dropDwellTime:
+            self.dropTetromino()
+            self.columnDwell = 0.0
+
+
+    def resetGaze(self):
+        # resetting dwell times
+        self.columnDwell = 0.0
+        self.rotationDwell = 0.0
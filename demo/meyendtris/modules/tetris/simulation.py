@@ -0,0 +1,463 @@
+# -*- coding: utf-8 -*-
+
+"""
+Headless Meyendtris simulation, for tuning game parameters offline.
+
+MeyendtrisSimulation runs a single game with the exact rules of MeyendtrisGame
+(see rules.py), one frame per step(), without Panda3D, a window or LSL.
+
+BatchSimulation advances many independent games at once. All boards are kept
+in one NumPy array of row bitmasks (games x rows), and every frame is a handful
+of vectorised operations over all games, so that thousands of parameter
+combinations (game speed, dwell times, undo probability, ...) can be evaluated
+against recorded gaze and BCI traces in a single run. Parameters can be given
+as scalars (shared by all games) or as arrays with one entry per game.
+
+Both take gaze samples in screen pixels and BCI values in the range [1, 2],
+one per frame. NaN gaze samples mean "no new sample this frame", as in the live
+game, where the last received gaze position remains in effect.
+"""
+
+from random import Random
+import math
+import numpy as np
+from meyendtris.modules.tetris.rules import MeyendtrisRules
+
+
+class MeyendtrisSimulation(MeyendtrisRules):
+    """A single headless game, driven frame by frame."""
+
+    def __init__(self,
+                 seed=None,                 # seed for tetromino choice and undo decisions
+                 screensize=(1920, 1080),   # screen size in pixels, as in the recorded gaze data
+                 aspectRatio=16 / 9.,       # aspect ratio of the game window
+                 **parameters):             # any parameter of MeyendtrisRules, e.g. moveTimeRange=[.3, 1.2]
+        MeyendtrisRules.__init__(self)
+        for name, value in parameters.items():
+            if not hasattr(self, name):
+                raise AttributeError("Unknown game parameter: %s" % name)
+            setattr(self, name, value)
+        self.rng = Random(seed)
+        self.screensize = screensize
+        self.aspectRatio = aspectRatio
+        self.reset()
+
+    def reset(self):
+        """Start a new game with a clear field and statistics."""
+        self.resetState()
+        self.computeScreenAreas(self.screensize, self.aspectRatio)
+        self.frames = 0
+        self.spawnTetromino()
+
+    def step(self, gazeX=None, gazeY=None, bci=None):
+        """Advance the game by one frame, optionally with a new gaze sample and BCI value."""
+        if bci is not None:
+            self.bci = bci
+        if gazeX is not None and not math.isnan(gazeX):
+            self._gazeX = gazeX
+        if gazeY is not None and not math.isnan(gazeY):
+            self._gazeY = gazeY
+        now = self.frames / float(self.fps)
+        self.updateBCI(now)
+        if self._gazeX is not None and self._gazeY is not None:
+            self.receiveGaze([self._gazeX], [self._gazeY], [now])
+        self.gameStep(1.0 / self.fps)
+        self.frames += 1
+
+    def run(self, gazeX, gazeY, bci=None):
+        """Play back per-frame traces of gaze positions (and BCI values); returns statistics()."""
+        if bci is None:
+            bci = [None] * len(gazeX)
+        for x, y, b in zip(gazeX, gazeY, bci):
+            self.step(x, y, b)
+        return self.statistics()
+
+    def statistics(self):
+        return {
+            'frames': self.frames,
+            'tetrominoesLanded': self.tetrominoesLanded,
+            'linesCleared': self.linesCleared,
+            'tetrominoesUndone': self.tetrominoesUndone,
+            'gamesOver': self.gamesOver}
+
+
+class BatchSimulation:
+    """
+    Many independent headless games advanced in lockstep with NumPy.
+
+    Follows the rules of MeyendtrisRules, with two simplifications: BCI values
+    are always smoothed with the mean of the last bciBufferLength frames, and
+    while the undo animation of a game is running, gaze selections, rotations
+    and drops are ignored for that game (in the live game these collide with the
+    highlighted field and have no useful effect). Fixations are detected with
+    the same rules as FixationDetector, vectorised over all games.
+    """
+
+    def __init__(self,
+                 games,                     # number of games to simulate in parallel
+                 seed=None,                 # seed for tetromino choice and undo decisions
+                 screensize=(1920, 1080),   # screen size in pixels, as in the recorded gaze data
+                 aspectRatio=16 / 9.,       # aspect ratio of the game window
+                 **parameters):             # parameters of MeyendtrisRules; scalars, pairs, or arrays with one entry (or pair) per game
+        defaults = MeyendtrisRules()
+        for name in parameters:
+            if not hasattr(defaults, name):
+                raise AttributeError("Unknown game parameter: %s" % name)
+        param = lambda name: parameters.get(name, getattr(defaults, name))
+
+        self.games = games
+        self.rows = int(param('rows'))
+        self.cols = int(param('cols'))
+        if self.cols > 62:
+            raise ValueError("BatchSimulation supports at most 62 columns.")
+        self.fps = float(param('fps'))
+        self.bciBufferLength = int(param('bciBufferLength'))
+        self.mapDwellTimes = bool(param('mapDwellTimes'))
+        self.fixationMethod = param('fixationMethod')
+        if self.fixationMethod not in ('dispersion', 'velocity'):
+            raise ValueError("Unknown fixation detection method: %s" % self.fixationMethod)
+
+        # per-game parameters
+        pairs = lambda name: np.array(np.broadcast_to(np.asarray(param(name), dtype=float), (games, 2)))
+        singles = lambda name: np.array(np.broadcast_to(np.asarray(param(name), dtype=float), (games,)))
+        self.moveTimeRange = pairs('moveTimeRange')
+        self.columnDwellTimeRange = pairs('columnDwellTimeRange')
+        self.dropDwellTimeRange = pairs('dropDwellTimeRange')
+        self.rotationDwellTimeRange = pairs('rotationDwellTimeRange')
+        self.undoProbability = singles('undoProbability')
+        self.columnDwellTime = singles('columnDwellTime')
+        self.dropDwellTime = singles('dropDwellTime')
+        self.rotationDwellTime = singles('rotationDwellTime')
+        self.fixationDispersion = singles('fixationDispersion')
+        self.fixationVelocity = singles('fixationVelocity')
+        self.fixationMinDuration = singles('fixationMinDuration')
+        self.fixationTolerance = singles('fixationTolerance')
+
+        # screen areas in pixels, as computed by the game
+        defaults.rows, defaults.cols = self.rows, self.cols
+        defaults._colOffset = param('_colOffset')
+        defaults.tetrominoes = param('tetrominoes')
+        defaults.resetState()
+        defaults.computeScreenAreas(screensize, aspectRatio)
+        self.columnLookup = defaults.columnLookup
+        self.rotationArea = defaults.rotationArea
+
+        # tetromino lookup tables: row masks, sizes and number of rotations
+        pieces = defaults.field.tetrominoes
+        self._rotations = np.array([p.rotations for p in pieces])
+        self._masks = np.zeros((len(pieces), 4, 4), dtype=np.int64)
+        self._widths = np.ones((len(pieces), 4), dtype=np.int64)
+        self._heights = np.ones((len(pieces), 4), dtype=np.int64)
+        for p, piece in enumerate(pieces):
+            for r in range(4):
+                rr = r % piece.rotations
+                self._masks[p, r, :len(piece.masks[rr])] = piece.masks[rr]
+                self._widths[p, r] = piece.widths[rr]
+                self._heights[p, r] = piece.heights[rr]
+        self._full = (1 << self.cols) - 1
+
+        self.rng = np.random.default_rng(seed)
+        self.reset()
+
+    def reset(self):
+        """Start new games with clear fields and statistics."""
+        n = self.games
+        self.boards = np.zeros((n, self.rows), dtype=np.int64)
+        self.piece = np.zeros(n, dtype=np.int64)
+        self.rotation = np.zeros(n, dtype=np.int64)
+        self.top = np.zeros(n, dtype=np.int64)
+        self.left = np.zeros(n, dtype=np.int64)
+        self.undoAnimation = np.zeros(n, dtype=bool)
+        self.moveTimer = np.zeros(n)
+
+        self.bci = np.full(n, 1.5)
+        self._bciBuffer = np.full((n, self.bciBufferLength), 1.5)
+        self._bciSum = self._bciBuffer.sum(axis=1)
+        self._bciIndex = 0
+        self.currentBCI = self.bci.copy()
+
+        self.gazeX = np.full(n, np.nan)
+        self.gazeY = np.full(n, np.nan)
+        self.sampleCol = np.full(n, -1, dtype=np.int64)
+        self.selectedCol = np.full(n, -1, dtype=np.int64)
+        self.columnDwell = np.zeros(n)
+        self.rotationDwell = np.zeros(n)
+        self.inRotationArea = np.zeros(n, dtype=bool)
+
+        # fixation detection state, as in FixationDetector; target -2 is the rotation area, -1 none
+        self.fixStart = np.full(n, np.nan)
+        self.fixLast = np.full(n, np.nan)
+        self.fixLastX = np.zeros(n)
+        self.fixLastY = np.zeros(n)
+        self.fixMinX = np.zeros(n)
+        self.fixMaxX = np.zeros(n)
+        self.fixMinY = np.zeros(n)
+        self.fixMaxY = np.zeros(n)
+        self.fixSumX = np.zeros(n)
+        self.fixSumY = np.zeros(n)
+        self.fixCount = np.zeros(n)
+        self.fixOutlier = np.full(n, np.nan)
+        self.fixConfirmed = np.zeros(n, dtype=bool)
+        self.fixTarget = np.full(n, -1, dtype=np.int64)
+        self.fixCounted = np.zeros(n)
+
+        self.frames = 0
+        self.tetrominoesLanded = np.zeros(n, dtype=np.int64)
+        self.linesCleared = np.zeros(n, dtype=np.int64)
+        self.tetrominoesUndone = np.zeros(n, dtype=np.int64)
+        self.gamesOver = np.zeros(n, dtype=np.int64)
+
+        self._spawn(np.arange(n))
+
+    # ===============
+    # === stepping ===
+    # ===============
+
+    def step(self, gazeX=np.nan, gazeY=np.nan, bci=np.nan):
+        """
+        Advance all games by one frame. Each argument is a scalar (same for all games)
+        or an array with one value per game; NaN means no new value this frame.
+        """
+        n = self.games
+        gazeX = np.broadcast_to(np.asarray(gazeX, dtype=float), (n,))
+        gazeY = np.broadcast_to(np.asarray(gazeY, dtype=float), (n,))
+        bci = np.broadcast_to(np.asarray(bci, dtype=float), (n,))
+        self.gazeX = np.where(np.isnan(gazeX), self.gazeX, gazeX)
+        self.gazeY = np.where(np.isnan(gazeY), self.gazeY, gazeY)
+        self.bci = np.where(np.isnan(bci), self.bci, bci)
+
+        # BCI running mean over the last bciBufferLength frames
+        self._bciSum += self.bci - self._bciBuffer[:, self._bciIndex]
+        self._bciBuffer[:, self._bciIndex] = self.bci
+        self._bciIndex = (self._bciIndex + 1) % self.bciBufferLength
+        self.currentBCI = self._bciSum / self.bciBufferLength
+
+        active = ~self.undoAnimation
+
+        # fixation detection and dwell times of the fixation targets
+        self._fixations(self.frames / self.fps)
+
+        # rotation area
+        rotate = active & (self.rotationDwell > self.rotationDwellTime)
+        if rotate.any():
+            self._rotate(np.flatnonzero(rotate))
+            self.rotationDwell[rotate] = 0.0
+
+        # column selection and drops
+        dwelling = active & (self.sampleCol != -1)
+        select = dwelling & (self.columnDwell > self.columnDwellTime)
+        if select.any():
+            idx = np.flatnonzero(select)
+            self.selectedCol[idx] = self.sampleCol[idx]
+            self._position(idx, self.sampleCol[idx])
+        drop = dwelling & (self.columnDwell > self.dropDwellTime)
+        if drop.any():
+            self._drop(np.flatnonzero(drop))
+            self.columnDwell[drop] = 0.0
+
+        # BCI-dependent dwell times
+        if self.mapDwellTimes:
+            self.columnDwellTime = self._map(self.currentBCI, self.columnDwellTimeRange)
+            self.dropDwellTime = self._map(self.currentBCI, self.dropDwellTimeRange)
+            self.rotationDwellTime = self._map(self.currentBCI, self.rotationDwellTimeRange)
+
+        # actions that happen at game speed intervals
+        self.moveTimer += 1.0 / self.fps
+        due = self.moveTimer > self._map(self.currentBCI, self.moveTimeRange)
+        if due.any():
+            undo = due & self.undoAnimation
+            if undo.any():
+                idx = np.flatnonzero(undo)
+                self.undoAnimation[idx] = False
+                self._spawn(idx)
+            move = due & ~undo
+            if move.any():
+                self._move_down(np.flatnonzero(move))
+            self.moveTimer[due] = 0.0
+
+        self.frames += 1
+
+    def run(self, gazeX, gazeY, bci=None):
+        """
+        Play back traces of T frames; each argument has shape (T,) (same trace for all
+        games) or (T, games). Returns statistics().
+        """
+        gazeX = np.asarray(gazeX, dtype=float)
+        gazeY = np.asarray(gazeY, dtype=float)
+        bci = np.full(len(gazeX), np.nan) if bci is None else np.asarray(bci, dtype=float)
+        for frame in range(len(gazeX)):
+            self.step(gazeX[frame], gazeY[frame], bci[frame])
+        return self.statistics()
+
+    def statistics(self):
+        return {
+            'frames': self.frames,
+            'tetrominoesLanded': self.tetrominoesLanded.copy(),
+            'linesCleared': self.linesCleared.copy(),
+            'tetrominoesUndone': self.tetrominoesUndone.copy(),
+            'gamesOver': self.gamesOver.copy()}
+
+    # ========================
+    # === Internal Helpers ===
+    # ========================
+
+    def _map(self, values, targetranges):
+        """Vectorised MeyendtrisRules.map() from the BCI range [1, 2] onto per-game target ranges."""
+        low, high = targetranges[:, 0], targetranges[:, 1]
+        mapped = low + (values - 1.0) * (high - low)
+        return np.clip(mapped, np.minimum(low, high), np.maximum(low, high))
+
+    def _fixations(self, now):
+        """Feed the current gaze positions (sampled at time now) to the fixation detectors of all games."""
+        x, y = self.gazeX, self.gazeY
+        valid = ~(np.isnan(x) | np.isnan(y))
+        running = valid & ~np.isnan(self.fixStart)
+
+        # does the sample belong to the current fixation?
+        with np.errstate(invalid='ignore'):
+            if self.fixationMethod == 'dispersion':
+                spread = (np.maximum(self.fixMaxX, x) - np.minimum(self.fixMinX, x)) + (np.maximum(self.fixMaxY, y) - np.minimum(self.fixMinY, y))
+                fits = spread <= self.fixationDispersion
+            else:
+                fits = np.hypot(x - self.fixLastX, y - self.fixLastY) <= self.fixationVelocity * (now - self.fixLast)
+        accept = running & fits
+        deviate = running & ~fits
+        self.fixOutlier[accept] = np.nan
+        self.fixOutlier[deviate & np.isnan(self.fixOutlier)] = now
+        with np.errstate(invalid='ignore'):
+            restart = deviate & ((now - self.fixOutlier) * 1000.0 >= self.fixationTolerance)
+        self.fixTarget[restart] = -1
+
+        # (re)starting fixations
+        begin = (valid & np.isnan(self.fixStart)) | restart
+        self.fixStart[begin] = now
+        self.fixConfirmed[begin] = False
+        self.fixOutlier[begin] = np.nan
+        self.fixMinX[begin] = self.fixMaxX[begin] = x[begin]
+        self.fixMinY[begin] = self.fixMaxY[begin] = y[begin]
+        self.fixSumX[begin] = 0.0
+        self.fixSumY[begin] = 0.0
+        self.fixCount[begin] = 0
+
+        # adding the sample
+        add = accept | begin
+        self.fixLast[add] = now
+        self.fixLastX[add], self.fixLastY[add] = x[add], y[add]
+        self.fixMinX[add] = np.minimum(self.fixMinX[add], x[add])
+        self.fixMaxX[add] = np.maximum(self.fixMaxX[add], x[add])
+        self.fixMinY[add] = np.minimum(self.fixMinY[add], y[add])
+        self.fixMaxY[add] = np.maximum(self.fixMaxY[add], y[add])
+        self.fixSumX[add] += x[add]
+        self.fixSumY[add] += y[add]
+        self.fixCount[add] += 1
+        duration = (self.fixLast - self.fixStart) * 1000.0
+
+        # fixations reaching the minimum duration get their target
+        start = np.flatnonzero(add & ~self.fixConfirmed & (duration >= self.fixationMinDuration))
+        if len(start):
+            self.fixConfirmed[start] = True
+            self.fixCounted[start] = 0.0
+            cx = self.fixSumX[start] / self.fixCount[start]
+            cy = self.fixSumY[start] / self.fixCount[start]
+            rotation = cy < self.rotationArea
+            self.columnDwell[start[rotation]] = 0.0
+            self.rotationDwell[start[~rotation]] = 0.0
+            col = self.columnLookup.columns(cx)
+            col = np.where((col != -1) & ~rotation, col, self.sampleCol[start])
+            changed = col != self.sampleCol[start]
+            self.columnDwell[start[changed]] = 0.0
+            self.sampleCol[start] = col
+            self.fixTarget[start] = np.where(rotation, -2, col)
+
+        # adding the fixation time to the dwell time of the target
+        grown = add & self.fixConfirmed
+        elapsed = duration[grown] - self.fixCounted[grown]
+        self.fixCounted[grown] = duration[grown]
+        target = self.fixTarget[grown]
+        self.rotationDwell[grown] += np.where(target == -2, elapsed, 0.0)
+        self.columnDwell[grown] += np.where(target >= 0, elapsed, 0.0)
+        self.inRotationArea = self.fixTarget == -2
+
+    def _collision(self, idx, rotation, top, left):
+        """Collision test of the current tetrominoes of the games idx at the given rotation/position."""
+        piece = self.piece[idx]
+        width = self._widths[piece, rotation]
+        height = self._heights[piece, rotation]
+        outside = (top < 0) | (left < 0) | (left + width > self.cols) | (top + height > self.rows)
+        rows = np.clip(top[:, None] + np.arange(4), 0, self.rows - 1)
+        masks = self._masks[piece, rotation] << np.maximum(left, 0)[:, None]
+        return outside | ((self.boards[idx[:, None], rows] & masks) != 0).any(axis=1)
+
+    def _spawn(self, idx):
+        """Spawn random tetrominoes at the top of the field; restart games that have no room left."""
+        while len(idx):
+            self.piece[idx] = self.rng.integers(0, len(self._rotations), len(idx))
+            self.rotation[idx] = 0
+            self.top[idx] = 0
+            self.left[idx] = self.cols // 2 - self._widths[self.piece[idx], 0] // 2
+            self.columnDwell[idx] = 0
+            self.rotationDwell[idx] = 0
+            over = self._collision(idx, self.rotation[idx], self.top[idx], self.left[idx])
+            idx = idx[over]
+            self.gamesOver[idx] += 1
+            self.boards[idx] = 0
+
+    def _rotate(self, idx):
+        rotation = (self.rotation[idx] + 1) % self._rotations[self.piece[idx]]
+        free = ~self._collision(idx, rotation, self.top[idx], self.left[idx])
+        self.rotation[idx[free]] = rotation[free]
+
+    def _position(self, idx, target):
+        """Move tetrominoes horizontally towards the target columns, one collision-checked step at a time."""
+        while len(idx):
+            step = np.sign(target - self.left[idx])
+            moving = step != 0
+            idx, target, step = idx[moving], target[moving], step[moving]
+            free = ~self._collision(idx, self.rotation[idx], self.top[idx], self.left[idx] + step)
+            idx, target, step = idx[free], target[free], step[free]
+            self.left[idx] += step
+
+    def _move_down(self, idx):
+        blocked = self._collision(idx, self.rotation[idx], self.top[idx] + 1, self.left[idx])
+        self.top[idx[~blocked]] += 1
+        if blocked.any():
+            self._land(idx[blocked])
+
+    def _drop(self, idx):
+        falling = idx
+        while len(falling):
+            free = ~self._collision(falling, self.rotation[falling], self.top[falling] + 1, self.left[falling])
+            falling = falling[free]
+            self.top[falling] += 1
+        self._land(idx)
+
+    def _land(self, idx):
+        # removing tetrominoes if an error is detected
+        undo = self.rng.random(len(idx)) < self.undoProbability[idx]
+        self.undoAnimation[idx[undo]] = True
+        self.tetrominoesUndone[idx[undo]] += 1
+        idx = idx[~undo]
+        if not len(idx):
+            return
+
+        # adding tetrominoes to the fields
+        piece, rotation, top, left = self.piece[idx], self.rotation[idx], self.top[idx], self.left[idx]
+        height = self._heights[piece, rotation]
+        masks = self._masks[piece, rotation] << left[:, None]
+        for offset in range(4):
+            sel = offset < height
+            self.boards[idx[sel], top[sel] + offset] |= masks[sel, offset]
+        self.tetrominoesLanded[idx] += 1
+
+        # removing full rows: full rows are sorted to the top and then emptied
+        boards = self.boards[idx]
+        full = boards == self._full
+        count = full.sum(axis=1)
+        if count.any():
+            order = np.argsort(~full, axis=1, kind='stable')
+            boards = np.take_along_axis(boards, order, axis=1)
+            boards[np.arange(self.rows) < count[:, None]] = 0
+            self.boards[idx] = boards
+            self.linesCleared[idx] += count
+
+        self._spawn(idx)
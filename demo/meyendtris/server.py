@@ -1,78 +1,220 @@
-import zmq
+"""
+The launcher's control plane: one asyncio event loop (in a background thread) serving
+  * ZMQ REQ/REP commands (port 18812),
+  * ZMQ PUB streaming of log records and telemetry (port 18813, see telemetry.py), and
+  * the remote-control TCP port (7897) with the legacy line protocol and the binary
+    protocol of meyendtris.control (see launcher.py).
+All commands and settings go to the Panda3D task loop through one bounded ControlChannel,
+which the launcher applies once per frame.
+"""
+import asyncio
 import logging
-from zmq.log.handlers import PUBHandler
-import time
 import sys
-import inspect
+import threading
+import time
+
+import zmq
+import zmq.asyncio
+
+from meyendtris.control import ControlChannel, FrameDecoder, MAGIC
 
 logger = logging.getLogger("meyendtris")
 logging.basicConfig(level=logging.INFO)
 
-def exit_from_python():
-    sys.exit("Exit command entered")
+
+class PublishHandler(logging.Handler):
+    """Logging handler publishing records on the server's PUB socket (topic 'meyendtris.LEVEL'), from any thread."""
+
+    def __init__(self, server, root_topic="meyendtris"):
+        logging.Handler.__init__(self)
+        self.server = server
+        self.root_topic = root_topic
+
+    def emit(self, record):
+        try:
+            topic = f"{self.root_topic}.{record.levelname}".encode('utf-8')
+            self.server.publish(topic, self.format(record).encode('utf-8'))
+        except Exception:
+            self.handleError(record)
+
 
 class Server:
-    def __init__(self, host="*", port="18812", logger_port="18813", log=False):
+    def __init__(self, host="*", port="18812", logger_port="18813", log=False, line_port=None, control=None):
         self.host = host
         self.port = port
         self.logger_port = logger_port
         self.log = log
-        self._rep = None
-        # {message_from_client_side: action_to_perform_on_server_side}
-        # After the action is performed, return a string that needs to be replied on client side
+        self.line_port = line_port                  # port of the remote-control line/binary protocol, if any
+        self.control = control if control is not None else ControlChannel()
+        # {message_from_client_side: reply string, or None to pass the message on as a command}
         self.invoke_client_command = {
             "0": "command_mode",
             "start": None,
             "restart": None,
-            "exit": exit_from_python}
+            "exit": None}
 
-        self._ctx = zmq.Context()
-        if self.log:
-            self._pub = self._ctx.socket(zmq.PUB)
-            self._pub.bind(f'tcp://{self.host}:{self.logger_port}')
-    
-    def get_connection(self):
-        req = self._ctx.socket(zmq.REP)
-        req.setsockopt(zmq.LINGER, 0)
-        req.bind(f'tcp://{self.host}:{self.port}')
-        return req
-    
-    def send_message(self, message: str):
-        self._rep = self._rep if isinstance(self._rep, zmq.Socket) else self.get_connection()
-        self._rep.send_string(f"Server: {message}")
-    
-    def receive_message(self, message_client="ack"):
-        self._rep = self._rep if isinstance(self._rep, zmq.Socket) else self.get_connection()
-        message = self._rep.recv_string()
+        self.loop = None
+        self._ctx = zmq.asyncio.Context()
+        self._rep = None
+        self._pub = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._stopping = None
+        self._error = None
+        self._log_handler = None
+        self.send_errors = 0                        # number of messages that could not be published
+        self._send_failing = False                  # whether the last message could not be published
 
+    def handle_request(self, message):
+        """Handle a REQ message; returns the reply."""
         if message in self.invoke_client_command:
-            # Check the message received and perform an operation
             logger.info(message)
-            print("------")
-            func = self.invoke_client_command.get(message, "")
-            self.send_message(message=f"Running {func}")
-            if inspect.isfunction(func):
-                func()
-            return f"Finished client's request for {message}"
-        
-        print("-------")
-        self.send_message(message_client)
-        return message
+            reply = self.invoke_client_command[message]
+            if reply is not None:
+                return reply
+            accepted = self.control.put(('command', message, None))
+        else:
+            accepted = self.control.feed_line(message)
+        return f"Running {message}" if accepted else f"Rejected {message}"
+
+    def publish(self, *frames):
+        """Publish a message (one or more bytes frames, the first starting with the topic) on the PUB socket; can be called from any thread."""
+        if self._pub is not None:
+            self.loop.call_soon_threadsafe(self._send, frames)
+
+    def _send(self, frames):
+        # on the event loop: the socket may have been closed since publish()
+        if self._pub is None:
+            return
+        try:
+            future = self._pub.send_multipart(frames, zmq.NOBLOCK)
+        except zmq.ZMQError as e:
+            self._send_failed(e)
+            return
+        future.add_done_callback(self._sent)
+
+    def _sent(self, future):
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            self._send_failed(future.exception())
+        else:
+            self._send_failing = False
+
+    def _send_failed(self, error):
+        # failures are counted; only the first of a series is logged (log records are published, too)
+        self.send_errors += 1
+        if not self._send_failing:
+            self._send_failing = True
+            logger.warning(f"Publishing failed: {error!r}")
+
+    # --- event loop ---
+    def start(self):
+        """Run the event loop in a background thread; returns once all ports are bound."""
+        self._thread = threading.Thread(target=self.run, name="Server", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+        if self.log:
+            self._log_handler = PublishHandler(self)
+            logger.addHandler(self._log_handler)
+
+    def run(self):
+        """Run the event loop in the calling thread until stop() is called."""
+        asyncio.run(self._serve())
+
+    def stop(self):
+        if self._log_handler is not None:
+            logger.removeHandler(self._log_handler)
+            self._log_handler = None
+        if self.loop is not None and self._stopping is not None:
+            self.loop.call_soon_threadsafe(self._stopping.set)
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        line_server = None
+        try:
+            self._rep = self._ctx.socket(zmq.REP)
+            self._rep.setsockopt(zmq.LINGER, 0)
+            self._rep.bind(f'tcp://{self.host}:{self.port}')
+            if self.log:
+                self._pub = self._ctx.socket(zmq.PUB)
+                self._pub.setsockopt(zmq.LINGER, 0)
+                self._pub.bind(f'tcp://{self.host}:{self.logger_port}')
+            if self.line_port is not None:
+                host = None if self.host == "*" else self.host
+                line_server = await asyncio.start_server(self._handle_connection, host, self.line_port)
+        except Exception as e:
+            self._error = e
+            self._ready.set()
+            self._close()
+            return
+        self._ready.set()
+
+        requests = asyncio.ensure_future(self._serve_requests())
+        await self._stopping.wait()
+        requests.cancel()
+        if line_server is not None:
+            line_server.close()
+            await line_server.wait_closed()
+        self._close()
+
+    def _close(self):
+        for socket in (self._rep, self._pub):
+            if socket is not None:
+                socket.close()
+        self._rep = self._pub = None
+
+    async def _serve_requests(self):
+        while True:
+            message = await self._rep.recv_string()
+            await self._rep.send_string(f"Server: {self.handle_request(message)}")
+
+    async def _handle_connection(self, reader, writer):
+        """A remote-control connection; the first byte selects the binary or the text protocol."""
+        print("Client connection opened.")
+        try:
+            data = await reader.read(65536)
+            if data[:1] == bytes([MAGIC]):
+                decoder = FrameDecoder()
+                while data:
+                    self.control.feed(decoder, data)
+                    data = await reader.read(65536)
+            else:
+                buffer = b''
+                while data:
+                    buffer += data
+                    *lines, buffer = buffer.split(b'\n')
+                    for line in lines:
+                        self.control.feed_line(line.decode('utf-8', 'replace'))
+                    data = await reader.read(65536)
+                self.control.feed_line(buffer.decode('utf-8', 'replace'))
+        except (ConnectionError, ValueError) as e:
+            print("Closing connection:", e)
+        finally:
+            writer.close()
+        print("Connection closed by client.")
+
 
 if __name__ == "__main__":
-    server = Server(log=True)
-    if server.log:
-        handler = PUBHandler(server._pub)
-        logger.addHandler(handler)
-        time.sleep(0.1)
-        logger.info("PUBHandler Logger initialised")
-    message = server.receive_message(message_client="command_mode")
-    logger.info(message)
-    # Establish relationship with client, if any
+    # stand-alone control plane, printing the commands it receives
+    control = ControlChannel()
+    server = Server(log=True, line_port=7897, control=control)
+    server.start()
+    logger.info("PUB logger initialised")
     try:
         while True:
-            message = server.receive_message()
-            time.sleep(0.1)
-            logger.info(message)
+            commands = control.apply()
+            for command in commands:
+                logger.info(command)
+            if ('exit', None) in commands:
+                sys.exit("Exit command entered")
+            time.sleep(0.01)
     except KeyboardInterrupt:
-        print("exiting")
\ No newline at end of file
+        print("exiting")
+    server.stop()
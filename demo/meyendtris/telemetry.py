@@ -0,0 +1,145 @@
+"""
+Per-frame telemetry of the running module, published on the control plane's PUB socket
+(port 18813, see server.py) so that sessions can be watched live from another machine.
+
+Each frame is one single-part message: the topic b'telemetry' followed by a packed
+little-endian record (see FRAME and TelemetryFrame) with the frame number and time,
+the duration of the last frame, the smoothed BCI value, the gaze position, the selected
+column, the column and rotation dwell times, the number of occupied field cells and the
+number of event markers waiting to be sent. Values a module does not have are NaN or -1.
+
+TelemetrySubscriber receives the frames either conflated (only the latest frame is
+kept, for live displays) or lossless (all frames are queued; gaps are counted). Usage:
+
+    python -m meyendtris.telemetry tcp://hostname:18813 [--lossless]
+"""
+import argparse
+import math
+import struct
+import time
+from collections import namedtuple
+
+from meyendtris.framework.eventmarkers import eventmarkers
+
+TOPIC = b'telemetry'
+FRAME = struct.Struct('<IdffffhffHI')
+TelemetryFrame = namedtuple('TelemetryFrame', [
+    'frame',            # frame number
+    'time',             # time of the frame in seconds (time.perf_counter())
+    'frame_time',       # duration of the previous frame in ms
+    'bci',              # smoothed BCI value (currentBCI)
+    'gaze_x',           # current gaze position in pixels
+    'gaze_y',
+    'column',           # selected column (-1: none)
+    'column_dwell',     # accumulated column dwell time in ms
+    'rotation_dwell',   # accumulated rotation area dwell time in ms
+    'occupancy',        # number of occupied cells of the field
+    'marker_queue'])    # number of event markers waiting to be sent
+
+_nan = float('nan')
+
+
+def _number(value):
+    return _nan if value is None else value
+
+
+class TelemetryPublisher(object):
+    """Samples the state of a module once per frame and publishes it through a Server."""
+
+    def __init__(self, server):
+        self.server = server
+        self.frame = 0
+        self._last = None
+
+    def sample(self, instance, now=None):
+        """The packed telemetry record of instance for the current frame."""
+        now = time.perf_counter() if now is None else now
+        frame_time = _nan if self._last is None else (now - self._last) * 1000.0
+        self._last = now
+        self.frame += 1
+        field = getattr(instance, 'field', None)
+        column = getattr(instance, '_currentSelectedCol', None)
+        return FRAME.pack(
+            self.frame & 0xFFFFFFFF, now, frame_time,
+            _number(getattr(instance, 'currentBCI', None)),
+            _number(getattr(instance, '_gazeX', None)),
+            _number(getattr(instance, '_gazeY', None)),
+            -1 if column is None else column,
+            getattr(instance, 'columnDwell', _nan),
+            getattr(instance, 'rotationDwell', _nan),
+            min(field.occupancy(), 0xFFFF) if hasattr(field, 'occupancy') else 0,
+            eventmarkers.marker_queue.qsize())
+
+    def publish(self, instance, now=None):
+        """Publish the state of instance for the current frame."""
+        self.server.publish(TOPIC + self.sample(instance, now))
+
+
+def unpack(message):
+    """TelemetryFrame from a published message."""
+    return TelemetryFrame._make(FRAME.unpack_from(message, len(TOPIC)))
+
+
+class TelemetrySubscriber(object):
+    """Receives telemetry frames, either only the latest one (conflate=True) or all of them."""
+
+    def __init__(self, address='tcp://localhost:18813', conflate=True, context=None):
+        import zmq
+        self.socket = (context or zmq.Context.instance()).socket(zmq.SUB)
+        self.socket.setsockopt(zmq.LINGER, 0)
+        if conflate:
+            self.socket.setsockopt(zmq.CONFLATE, 1)
+        else:
+            self.socket.setsockopt(zmq.RCVHWM, 0)
+        self.socket.setsockopt(zmq.SUBSCRIBE, TOPIC)
+        self.socket.connect(address)
+        self.conflate = conflate
+        self.missed = 0             # frames missed in lossless mode (gaps in the frame numbers)
+        self._frame = None
+
+    def receive(self, timeout=None):
+        """The next frame (the latest one if conflating); None if none arrived within timeout seconds."""
+        if not self.socket.poll(None if timeout is None else int(timeout * 1000)):
+            return None
+        frame = unpack(self.socket.recv())
+        if not self.conflate and self._frame is not None and frame.frame > self._frame + 1:
+            self.missed += frame.frame - self._frame - 1
+        self._frame = frame.frame
+        return frame
+
+    def receive_all(self):
+        """All frames that have arrived so far, without waiting."""
+        frames = []
+        while True:
+            frame = self.receive(0)
+            if frame is None:
+                return frames
+            frames.append(frame)
+
+    def close(self):
+        self.socket.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print the telemetry of a running Meyendtris launcher.")
+    parser.add_argument('address', nargs='?', default='tcp://localhost:18813', help="address of the launcher's PUB socket")
+    parser.add_argument('--lossless', action='store_true', help="print every frame instead of the latest one")
+    parser.add_argument('--interval', type=float, default=0.1, help="seconds between printed frames (conflated mode)")
+    args = parser.parse_args(argv)
+
+    subscriber = TelemetrySubscriber(args.address, conflate=not args.lossless)
+    print('  '.join('%12s' % name for name in TelemetryFrame._fields))
+    try:
+        while True:
+            frame = subscriber.receive()
+            print('  '.join('%12s' % (('%.3f' % v) if isinstance(v, float) and not math.isnan(v) else v) for v in frame))
+            if not args.lossless:
+                time.sleep(args.interval)
+    except KeyboardInterrupt:
+        if args.lossless:
+            print("missed %d frames" % subscriber.missed)
+    subscriber.close()
+
+
+if __name__ == '__main__':
+    main()
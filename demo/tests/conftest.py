@@ -0,0 +1,118 @@
+"""
+Shared test setup: a headless Panda3D configuration and the benchmark fixture.
+
+The configuration is loaded before the first test creates the ShowBase (through
+meyendtris.__BASE__), so that the tests run without a window and without audio.
+
+Benchmarks (test_benchmarks.py, marked 'benchmark') are skipped unless asked for
+with --bench. They are timed with the bench fixture and compared against the
+baselines in benchmarks.json: a benchmark fails if its best time (of the
+repeats; the median for latencies) exceeds the baseline by more than the
+threshold, and is skipped if it has no baseline. Baselines are machine-specific;
+they are only written with --bench-update, e.g. after a deliberate change or on
+a new machine:
+
+    python -m pytest tests/test_benchmarks.py --bench-update
+    python -m pytest tests/test_benchmarks.py --bench
+"""
+import gc
+import json
+import os
+import platform
+import statistics
+import time
+
+import pytest
+from panda3d.core import loadPrcFileData
+
+loadPrcFileData('tests', 'window-type none\naudio-library-name null')
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks.json')
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('benchmark')
+    group.addoption('--bench', action='store_true',
+                    help="run the benchmarks and compare them against the baselines in tests/benchmarks.json")
+    group.addoption('--bench-update', action='store_true',
+                    help="record the benchmark results as the new baselines (in tests/benchmarks.json)")
+    group.addoption('--bench-threshold', type=float, default=1.0,
+                    help="allowed slowdown relative to the baseline before a benchmark fails (1.0: twice as slow)")
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', "benchmark: timing benchmark compared against tests/benchmarks.json")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--bench') or config.getoption('--bench-update'):
+        return
+    skip = pytest.mark.skip(reason="benchmark (run with --bench)")
+    for item in items:
+        if 'benchmark' in item.keywords:
+            item.add_marker(skip)
+
+
+class Benchmark(object):
+    """Times functions and checks the results against the stored baselines."""
+
+    def __init__(self, baselines, update=False, threshold=1.0):
+        self.baselines = baselines          # name -> dict(best=..., median=..., p90=..., unit=...)
+        self.update = update
+        self.threshold = threshold
+        self.changed = False
+
+    def __call__(self, name, func, number=100, repeat=15):
+        """Time func (called number times per repeat); checks the best repeat and returns the per-call statistics in us."""
+        samples = []
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                for _ in range(number):
+                    func()
+                samples.append((time.perf_counter() - start) / number * 1e6)
+        finally:
+            if enabled:
+                gc.enable()
+        return self.check(name, samples)
+
+    def check(self, name, samples, unit='us/call', statistic='best', slack=0.0):
+        """
+        Check measured samples against the baseline of name; returns their statistics. Latencies are
+        better compared by their median, with an absolute slack (in unit) for the scheduling noise.
+        """
+        samples = sorted(samples)
+        result = dict(best=round(samples[0], 3), median=round(statistics.median(samples), 3),
+                      p90=round(samples[min(len(samples) - 1, int(0.9 * len(samples)))], 3), unit=unit)
+        baseline = self.baselines.get(name)
+        if self.update:
+            self.baselines[name] = result
+            self.changed = True
+        elif baseline is None:
+            pytest.skip("no baseline for %s (record one with --bench-update)" % name)
+        else:
+            limit = baseline[statistic] * (1 + self.threshold) + slack
+            assert result[statistic] <= limit, (
+                "%s regressed: %s %.3f %s, baseline %.3f (limit %.3f)"
+                % (name, statistic, result[statistic], unit, baseline[statistic], limit))
+        return result
+
+
+@pytest.fixture(scope='session')
+def bench(request):
+    try:
+        with open(BASELINES) as f:
+            baselines = json.load(f)['benchmarks']
+    except FileNotFoundError:
+        baselines = {}
+    benchmark = Benchmark(baselines, request.config.getoption('--bench-update'),
+                          request.config.getoption('--bench-threshold'))
+    yield benchmark
+    if benchmark.changed:
+        with open(BASELINES, 'w') as f:
+            json.dump(dict(machine=dict(platform=platform.platform(), processor=platform.machine(),
+                                        python=platform.python_version()),
+                           benchmarks=dict(sorted(baselines.items()))), f, indent=1)
+            f.write('\n')
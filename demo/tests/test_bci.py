@@ -0,0 +1,114 @@
+import numpy as np
+from meyendtris.bci.model import CSPModel
+from meyendtris.bci.pipeline import OnlinePipeline
+
+
+def _model(srate=250):
+    return CSPModel(srate, [[6, 8, 14, 16]], [0, 1], [np.eye(2)], [1.0, -1.0], 0.0)
+
+
+def _eeg(seconds, srate=250, seed=0):
+    t = np.arange(int(seconds * srate)) / float(srate)
+    noise = np.random.default_rng(seed).normal(0, 0.01, (len(t), 2))
+    return np.column_stack([2 * np.sin(2 * np.pi * 11 * t), np.sin(2 * np.pi * 11 * t + 1)]) + noise
+
+
+class _Target:
+    bci = 1.5
+
+
+def test_online_pipeline_output():
+    target = _Target()
+    pipeline = OnlinePipeline(_model(), target=target)
+    eeg = _eeg(6)
+    assert pipeline.classify() is None
+    rng = np.random.default_rng(1)
+    start = 0
+    while start < len(eeg):
+        stop = start + int(rng.integers(1, 40))
+        pipeline.process(eeg[start:stop])
+        start = stop
+    # log-variance ratio of 4 between the channels: P = 4 / (4 + 1)
+    assert abs(pipeline.classify() - 1.8) < 0.01 and target.bci == pipeline.value
+
+    # chunking does not matter
+    whole = OnlinePipeline(_model())
+    whole.process(eeg)
+    assert abs(whole.classify() - pipeline.value) < 1e-9
+
+
+class _FlakyInlet:
+    # an EEG inlet whose stream is lost for the first pulls
+    channel_count = 2
+    value_type = np.float32
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.eeg = _eeg(2)
+
+    def pull_chunk(self, timeout=0.0, max_samples=1024, dest_obj=None):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("stream lost")
+        chunk, self.eeg = self.eeg[:max_samples], self.eeg[max_samples:]
+        dest_obj[:len(chunk)] = chunk
+        return None, [0.0] * len(chunk)
+
+
+def test_pipeline_thread_survives_errors(capsys):
+    import time
+    target = _Target()
+    pipeline = OnlinePipeline(_model(), _FlakyInlet(3), target=target, update_rate=200)
+    pipeline.start()
+    deadline = time.time() + 5
+    while pipeline.updates == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    pipeline.stop()
+    assert pipeline.errors == 3 and pipeline.error is None and pipeline.updates > 0 and target.bci == pipeline.value
+    assert capsys.readouterr().out.count("Exception in the BCI pipeline") == 1
+    assert pipeline._thread is None
+
+
+def test_model_save_load(tmp_path):
+    model = _model()
+    model.save(str(tmp_path / 'model.npz'))
+    loaded = CSPModel.load(str(tmp_path / 'model.npz'))
+    assert loaded.bands == model.bands and loaded.classes == ['relax', 'chaos']
+    assert np.array_equal(loaded.fir[0], model.fir[0]) and np.array_equal(loaded.weights, model.weights)
+    epochs = [_eeg(1)[np.newaxis]]
+    assert np.allclose(loaded.probability(loaded.features(epochs)), model.probability(model.features(epochs)))
+
+
+def _recording(seconds=200, srate=100, seed=0):
+    # 10 s blocks of "relax" (11 Hz activity on channel 0) and "chaos" (on channel 1), one marker per second
+    rng = np.random.default_rng(seed)
+    t = np.arange(seconds * srate) / float(srate)
+    chaos = (t // 10).astype(int) % 2 == 1
+    source = np.sin(2 * np.pi * 11 * t + rng.uniform(0, 6, len(t)).cumsum() * 0.01)
+    data = rng.normal(0, 1, (len(t), 4))
+    data[:, 0] += np.where(chaos, 0.5, 3) * source
+    data[:, 1] += np.where(chaos, 3, 0.5) * source
+    markers = [(float(s), 'chaos' if (s // 10) % 2 else 'relax') for s in range(seconds - 1)]
+    return dict(data=data, timestamps=t, srate=float(srate), channels=['a', 'b', 'c', 'd'], markers=markers)
+
+
+def test_chronological_folds():
+    from meyendtris.bci.train import chronological_folds
+    folds = list(chronological_folds(20, folds=4, margin=2))
+    assert [list(test) for _, test in folds] == [list(range(k, k + 5)) for k in (0, 5, 10, 15)]
+    assert list(folds[1][0]) == [0, 1, 2] + list(range(12, 20))
+
+
+def test_train_model():
+    from meyendtris.bci.train import train
+    recording = _recording()
+    model, stats = train(recording, folds=4, margin=5, pairs=1, workers=2)
+    assert stats.shape == (4, 3) and stats[:, 2].mean() > 0.9
+    assert model.classes == ['relax', 'chaos'] and model.filters[0].shape == (2, 4)
+
+    pipeline = OnlinePipeline(model)
+    srate = int(recording['srate'])
+    pipeline.process(recording['data'][:9 * srate])
+    relax = pipeline.classify()
+    pipeline.process(recording['data'][9 * srate:19 * srate])
+    assert relax < 1.2 and pipeline.classify() > 1.8
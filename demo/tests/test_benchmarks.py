@@ -0,0 +1,160 @@
+import itertools
+import time
+import numpy as np
+import pytest
+from meyendtris.modules.tetris.simulation import MeyendtrisSimulation
+
+pytestmark = pytest.mark.benchmark
+
+COLOURS = [(i / 8.0, 0, 0, 1) for i in range(1, 9)]
+
+
+def test_bench_collision(bench):
+    game = MeyendtrisSimulation(seed=0)
+    game.run([960] * 600, [540] * 600)
+    positions = itertools.cycle([[row, col] for row in range(game.rows) for col in range(-1, game.cols)])
+    bench('rules.collision', lambda: game.collision(next(positions)), number=2000)
+
+
+def test_bench_clear_lines(bench):
+    game = MeyendtrisSimulation(seed=0)
+    field = game.field
+
+    def clear():
+        field.rows[-4:] = [field.full] * 4
+        game.clearLines()
+
+    bench('rules.clearLines', clear, number=1000)
+
+
+def test_bench_update_field_graphics(bench):
+    from panda3d.core import NodePath
+    from meyendtris.modules.tetris.boardmesh import BoardMesh
+    from meyendtris.modules.tetris.renderer import FieldRenderer
+    game = MeyendtrisSimulation(seed=0)
+    renderer = FieldRenderer(game.field, BoardMesh(game.rows, game.cols, 0.1, NodePath('bench')), COLOURS)
+    # the falling tetromino moves down one row per frame while the selected column changes
+    frames = itertools.cycle([([row, 4], row % game.cols) for row in range(game.rows - 4)])
+
+    def update():
+        topLeft, col = next(frames)
+        renderer.update(game.currentPiece, game.currentRotation, topLeft, col)
+
+    bench('game.updateFieldGraphics', update, number=500)
+
+
+def test_bench_stimuli(bench):
+    from meyendtris.framework.basicstimuli import BasicStimuli
+
+    class Module(BasicStimuli):
+        def run(self):
+            pass
+
+    module = Module()
+    module.start()
+    bench('BasicStimuli.write', lambda: module.write('bench', duration=0).destroy(), number=200)
+    bench('BasicStimuli.rectangle',
+          lambda: module.rectangle(rect=(-0.5, 0.5, -0.2, 0.2), duration=0).destroy(), number=200)
+    module.cancel()
+    module.prune()
+
+
+def test_bench_send_marker(bench):
+    import meyendtris.framework.eventmarkers.eventmarkers as eventmarkers
+
+    class _River:
+        def send_marker(self, code):
+            pass
+
+    eventmarkers.river_backend = _River()
+    try:
+        eventmarkers.start_marker_writer()
+
+        def send():
+            for code in range(100):
+                eventmarkers.send_marker(code)
+            eventmarkers.flush_markers()
+
+        # per 100 markers, including handing them to the backend
+        bench('eventmarkers.send_marker x100', send, number=20)
+        eventmarkers.shutdown_markers()
+    finally:
+        eventmarkers.river_backend = None
+
+
+def test_bench_sleep_jitter(bench):
+    from meyendtris.framework.latentmodule import LatentModule, clock
+    lateness = []
+
+    class Module(LatentModule):
+        implicit_markers = False
+
+        def run(self):
+            for _ in range(40):
+                start = clock()
+                self.sleep(0.005)
+                lateness.append(abs(clock() - start - 0.005) * 1e6)
+
+    module = Module(make_up_for_lost_time=False)
+    module.start()
+    # a main loop running at ~1 kHz
+    deadline = time.perf_counter() + 5
+    while module.is_alive() and time.perf_counter() < deadline:
+        module.tick()
+        time.sleep(0.001)
+    assert len(lateness) == 40
+    # up to one iteration of the loop late due to the OS scheduler
+    bench.check('LatentModule.sleep jitter', lateness, unit='us', statistic='median', slack=1000)
+
+
+class _GazeSource:
+    # stands in for a pylsl inlet delivering a chunk of 32 samples per frame
+    channel_count = 3
+    value_type = np.float32
+
+    def __init__(self):
+        self.chunk = np.column_stack([np.linspace(0, 1920, 32), np.linspace(0, 1080, 32), np.arange(32)])
+        self.pending = True
+
+    def pull_chunk(self, timeout=0.0, max_samples=1024, dest_obj=None):
+        if not self.pending:
+            self.pending = True
+            return None, []
+        self.pending = False
+        dest_obj[:32] = self.chunk
+        return None, self.chunk[:, 2]
+
+
+def test_bench_gaze_ingestion(bench):
+    from meyendtris.framework.gaze import GazeInlet
+    game = MeyendtrisSimulation(seed=0)
+    inlet = GazeInlet(_GazeSource())
+
+    def ingest():
+        inlet.pull()
+        game.receiveGaze(inlet.x, inlet.y, inlet.timestamps, 1.0)
+
+    bench('gaze ingestion (32 samples)', ingest, number=500)
+
+
+def test_bench_remote_control(bench):
+    from meyendtris.control import ControlChannel, FrameDecoder, encode_set_float, encode_command
+
+    class Module:
+        bci = 1.0
+
+    channel = ControlChannel()
+    channel.parameters.register('bci', Module())
+    decoder = FrameDecoder()
+    frames = encode_set_float('bci', 1.5) + encode_command('start')
+
+    def binary():
+        channel.feed(decoder, frames)
+        channel.apply()
+
+    def text():
+        channel.feed_line('setup bci=1.5')
+        channel.apply()
+
+    bench('control binary (set + command)', binary, number=1000)
+    bench('control text setup', text, number=1000)
@@ -1,4 +1,675 @@
+import numpy as np
 from meyendtris.framework.latentmodule import LatentModule
 
 def test_latent_module():
-    pass
\ No newline at end of file
+    pass
+
+
+def test_cooperative_latent_module(monkeypatch):
+    import meyendtris.framework.latentmodule as latentmodule
+    from direct.showbase.MessengerGlobal import messenger
+    now = [0.0]
+    monkeypatch.setattr(latentmodule, 'clock', lambda: now[0])
+
+    class Module(LatentModule):
+        implicit_markers = False
+
+        def marker(self, code):
+            pass
+
+        def run(self):
+            self.log = ['started']
+            yield from self.sleep(0.05)
+            self.log.append('slept')
+            self.log.append((yield from self.waitfor('space', 1.0)))
+            try:
+                yield from self.sleep(10)
+            finally:
+                self.log.append('cleaned up')
+
+    module = Module()
+    module.start()
+    # run() executes on the calling thread up to its first time-consumption function
+    assert module.log == ['started'] and module.is_alive()
+    for frame in range(1, 4):
+        now[0] = frame / 60.0
+        module.tick()
+    # resumed at the frame closest to 50 ms
+    assert module.log == ['started', 'slept']
+    messenger.send('space')
+    now[0] = 4 / 60.0
+    module.tick()
+    assert module.log == ['started', 'slept', 0.0]
+    module.cancel()
+    assert module.log[-1] == 'cleaned up' and not module.is_alive() and module.error is None
+
+    # a crash of run() is kept for the launcher
+    class Failing(Module):
+        def run(self):
+            yield from self.sleep(0.01)
+            raise ValueError("crashed")
+
+    failing = Failing()
+    failing.start()
+    now[0] = 1.0
+    failing.tick()
+    assert not failing.is_alive() and isinstance(failing.error, ValueError)
+    failing.start()
+    assert failing.error is None and failing.is_alive()
+
+def test_ring_buffer_mean():
+    from meyendtris.framework.smoothing import RingBufferMean
+    smoother = RingBufferMean(4, 1.5)
+    assert smoother.push(2.5) == 1.75
+    for value in range(10):
+        smoother.push(value)
+    assert smoother.value == (6 + 7 + 8 + 9) / 4
+    assert smoother.extend([1, 2, 3, 4, 5]) == (2 + 3 + 4 + 5) / 4
+    assert smoother.extend([1, 1]) == (4 + 5 + 1 + 1) / 4
+
+
+def test_median_and_window_smoothers():
+    from meyendtris.framework.smoothing import MedianSmoother, TimeWindowMean, ExponentialSmoother
+    median = MedianSmoother(3)
+    assert median.extend([5, 1, 100]) == 5
+    assert median.push(2) == 2
+
+    # the window is defined in seconds, independent of the number of samples
+    window = TimeWindowMean(1.0)
+    window.extend([1, 1, 1, 1], [0.0, 0.1, 0.2, 0.3])
+    assert window.push(3, 1.25) == 2
+    assert window.push(5, 2.5) == 5
+
+    exponential = ExponentialSmoother(timeconstant=1.0, initial=0.0)
+    exponential.push(1.0, 0.0)
+    slow = exponential.extend([1.0] * 60, [i / 60.0 for i in range(1, 61)])
+    exponential.reset(0.0)
+    exponential.push(1.0, 0.0)
+    fast = exponential.extend([1.0] * 30, [i / 30.0 for i in range(1, 31)])
+    assert abs(slow - fast) < 1e-9
+
+
+class _ChunkInlet:
+    # stands in for a pylsl inlet: hands out queued samples through pull_chunk(dest_obj=...)
+    channel_count = 3
+    value_type = np.float32
+
+    def __init__(self, samples):
+        self.queue = [list(s) for s in samples]
+
+    def pull_chunk(self, timeout=0.0, max_samples=1024, dest_obj=None):
+        chunk, self.queue = self.queue[:max_samples], self.queue[max_samples:]
+        if chunk:
+            dest_obj[:len(chunk)] = chunk
+        return None, [float(s[2]) for s in chunk]
+
+
+def test_gaze_inlet_pulls_backlog():
+    from meyendtris.framework.gaze import GazeInlet
+    inlet = GazeInlet(_ChunkInlet([(i, 2 * i, 100 + i) for i in range(20)]), capacity=8)
+    assert inlet.pull() == 20
+    assert list(inlet.x) == list(range(20))
+    assert list(inlet.y) == [2 * i for i in range(20)]
+    assert list(inlet.timestamps) == [100 + i for i in range(20)]
+    assert inlet.last == (19, 38)
+    assert inlet.pull() == 0 and inlet.last is None and inlet.total == 20
+
+    # the timestamps of remote streams are mapped to the local clock by liblsl
+    import pylsl
+    source = _ChunkInlet([])
+    source.set_postprocessing = lambda flags: setattr(source, 'flags', flags)
+    GazeInlet(source)
+    assert source.flags == pylsl.proc_clocksync
+
+
+def test_fixation_detector():
+    from meyendtris.framework.fixations import FixationDetector
+    t = np.arange(120) / 600.0
+    x = np.where(t < 0.1, 100.0, 400.0)
+    x[30] = 900.0                   # noise spike, ignored
+    y = np.full(120, 500.0)
+    for method in ('dispersion', 'velocity'):
+        detector = FixationDetector(method, min_duration=50, tolerance=12)
+        events = detector.process(x[:40], y[:40], t[:40])
+        assert [e.kind for e in events] == ['start', 'update']
+        assert abs(events[0].duration - 31 / 0.6) < 1e-9 and events[0].x == 100.0
+        assert abs(events[1].duration - 39 / 0.6) < 1e-9
+        events = detector.process(x[40:], y[40:], t[40:])
+        assert [e.kind for e in events] == ['end', 'start', 'update']
+        assert abs(events[0].duration - 59 / 0.6) < 1e-9
+        assert events[1].x == 400.0 and events[1].start == t[68]
+        assert detector.current.x == 400.0
+
+
+def test_markers_are_sent_asynchronously(tmp_path):
+    import threading
+    import meyendtris.framework.eventmarkers.eventmarkers as eventmarkers
+    from meyendtris.framework.eventmarkers.markerlog import open_new_marker_log, read_marker_log
+
+    class _River:
+        def __init__(self):
+            self.markers = []
+        def send_marker(self, code):
+            self.markers.append(code)
+
+    river, log = _River(), open_new_marker_log(str(tmp_path))
+    eventmarkers.river_backend, eventmarkers.marker_log = river, log
+    try:
+        eventmarkers.start_marker_writer()
+        for code in range(100):
+            eventmarkers.send_marker(code)
+        eventmarkers.flush_markers()
+        assert river.markers == list(range(100))
+        assert list(read_marker_log(log.path).markers) == [str(code) for code in range(100)]
+        eventmarkers.send_marker(100)
+        eventmarkers.shutdown_markers()
+        assert river.markers[-1] == 100 and not eventmarkers.marker_writer
+
+        # without the writer thread, concurrent senders send synchronously
+        senders = [threading.Thread(target=lambda: [eventmarkers.send_marker(code) for code in range(200)])
+                   for _ in range(2)]
+        for sender in senders:
+            sender.start()
+        for sender in senders:
+            sender.join(2.0)
+        assert not any(sender.is_alive() for sender in senders) and len(river.markers) == 101 + 400
+    finally:
+        eventmarkers.river_backend = eventmarkers.marker_log = None
+
+
+def test_binary_marker_log(tmp_path):
+    from meyendtris.framework.eventmarkers.markerlog import open_new_marker_log, read_marker_log
+    (tmp_path / 'markerlog-4.log').write_text('')
+    log = open_new_marker_log(str(tmp_path), clock='lsl')
+    assert log.path.endswith('markerlog-5.bin')
+    log.write([(213, 1.5), ('start', 2.0), (213, 3.25)])
+    log.write([('caf\u00e9\n', 4.0)])
+    log.close()
+    with open(log.path, 'ab') as f:
+        f.write(b'\0' * 5)          # partial record, e.g. after a crash
+    markers = read_marker_log(log.path)
+    assert len(markers) == 4 and markers.clock == 'lsl'
+    assert list(markers.markers) == ['213', 'start', '213', 'caf\u00e9\n']
+    assert list(markers.find(213)) == [1.5, 3.25] and len(markers.find(999)) == 0
+    assert open_new_marker_log(str(tmp_path)).path.endswith('markerlog-6.bin')
+
+
+def test_control_channel():
+    from meyendtris.control import (ControlChannel, FrameDecoder, encode_set_float, encode_set_vector,
+                                    encode_command, parse_setup)
+
+    class Module:
+        def __init__(self):
+            self.bci = 1.0
+            self.speedRange = [1, 2]
+            self.name = 'tetris'
+            self._private = 0
+
+    module = Module()
+    channel = ControlChannel()
+    channel.parameters.register_attributes(module)
+    assert 'bci' in channel.parameters and 'speedRange' in channel.parameters and len(channel.parameters) == 2
+
+    stream = b''.join([encode_set_float('bci', 1.2), encode_command('start'), encode_set_float('bci', 1.7),
+                       encode_set_vector('speedRange', [3, 4]), encode_command('load', 'tetris.game'),
+                       encode_set_float('name', 3.0)])
+    decoder = FrameDecoder()
+    # frames may be split anywhere
+    for k in range(0, len(stream), 7):
+        channel.feed(decoder, stream[k:k + 7])
+    assert channel.apply() == [('start', None), ('load', 'tetris.game')]
+    assert module.bci == 1.7 and module.speedRange == [3.0, 4.0] and module.name == 'tetris'
+    counters = channel.counters
+    assert (counters['received'], counters['applied'], counters['coalesced'], counters['rejected']) == (6, 2, 1, 1)
+    assert 0 <= counters['queue_latency'] < 1 and counters['latency'] < 1
+
+    # the legacy text protocol, without exec
+    channel.feed_line("setup self.bci=1.25; speedRange=[5, 6]")
+    channel.feed_line("setup import os")
+    channel.feed_line("stop")
+    assert channel.apply() == [('cancel', None)]
+    assert module.bci == 1.25 and module.speedRange == [5.0, 6.0]
+    assert parse_setup("a=1;b=(2, 3)") == [('a', 1), ('b', (2, 3))]
+
+    # the parameters of the game itself, as registered by the launcher
+    from meyendtris.modules.tetris.rules import MeyendtrisRules
+    game = MeyendtrisRules()
+    game.resetState()
+    channel.parameters.register_attributes(game)
+    channel.feed_line("setup self.bci=1.7")
+    channel.feed_line("setup rows=12; columnDwellTimeRange=[60, 90]")
+    channel.apply()
+    assert game.bci == 1.7 and game.rows == 12 and isinstance(game.rows, int)
+    assert game.columnDwellTimeRange == [60, 90] and all(isinstance(v, int) for v in game.columnDwellTimeRange)
+    # non-integral values for integer parameters are rejected; attributes assigned after registration can be set
+    rejected = channel.rejected
+    game.lateValue = 0.5
+    channel.feed(decoder, encode_set_float('cols', 9.5) + encode_set_float('lateValue', 2.0))
+    channel.apply()
+    assert game.cols == 10 and channel.rejected == rejected + 1 and game.lateValue == 2.0
+
+
+def _free_port():
+    import socket
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def test_control_plane_server():
+    import socket
+    import time
+    import zmq
+    from meyendtris.control import ControlChannel, encode_set_float
+    from meyendtris.server import Server
+
+    class Module:
+        bci = 1.0
+
+    def wait_for(count):
+        deadline = time.time() + 2
+        while control.received < count and time.time() < deadline:
+            time.sleep(0.005)
+
+    module = Module()
+    control = ControlChannel(capacity=2)
+    control.parameters.register('bci', module)
+    ports = [_free_port() for _ in range(3)]
+    server = Server(host='127.0.0.1', port=ports[0], logger_port=ports[1], log=True, line_port=ports[2], control=control)
+    server.start()
+    context = zmq.Context.instance()
+    req = context.socket(zmq.REQ)
+    sub = context.socket(zmq.SUB)
+    try:
+        req.connect(f'tcp://127.0.0.1:{ports[0]}')
+        req.send_string('0')
+        assert req.recv_string() == 'Server: command_mode'
+        req.send_string('start')
+        assert req.recv_string() == 'Server: Running start'
+
+        with socket.create_connection(('127.0.0.1', ports[2])) as text:
+            text.sendall(b'load tetris.game\nsetup bci=1.3\n')
+        wait_for(3)
+        with socket.create_connection(('127.0.0.1', ports[2])) as binary:
+            binary.sendall(encode_set_float('bci', 1.6))
+        wait_for(4)
+        # the command queue is bounded
+        req.send_string('prune')
+        assert req.recv_string() == 'Server: Rejected prune' and control.dropped == 1
+        assert control.apply() == [('start', None), ('load', 'tetris.game')]
+        assert module.bci == 1.6 and control.coalesced == 1
+
+        sub.connect(f'tcp://127.0.0.1:{ports[1]}')
+        sub.setsockopt(zmq.SUBSCRIBE, b'test')
+        for _ in range(200):
+            server.publish(b'test', b'hello')
+            if sub.poll(10):
+                break
+        assert sub.recv_multipart() == [b'test', b'hello']
+    finally:
+        req.close(linger=0)
+        sub.close(linger=0)
+        server.stop()
+
+
+def test_telemetry():
+    import time
+    from meyendtris.server import Server
+    from meyendtris.telemetry import TelemetryPublisher, TelemetrySubscriber, unpack, TOPIC
+    from meyendtris.modules.tetris.field import BitboardField
+
+    class Module:
+        currentBCI = 1.25
+        _gazeX, _gazeY = 100.0, None
+        _currentSelectedCol = 3
+        columnDwell = 40.0
+        field = BitboardField(4, 4, [])
+
+    Module.field.rows[-1] = 0b0111
+    ports = [_free_port() for _ in range(2)]
+    server = Server(host='127.0.0.1', port=ports[0], logger_port=ports[1], log=True)
+    server.start()
+    publisher = TelemetryPublisher(server)
+    frame = unpack(TOPIC + publisher.sample(Module(), now=1.0))
+    assert (frame.frame, frame.time, frame.bci, frame.gaze_x, frame.column, frame.occupancy) == (1, 1.0, 1.25, 100, 3, 3)
+    assert np.isnan(frame.frame_time) and np.isnan(frame.gaze_y) and np.isnan(frame.rotation_dwell)
+    assert unpack(TOPIC + publisher.sample(Module(), now=1.016)).frame_time == np.float32(16.0)
+
+    lossless = TelemetrySubscriber(f'tcp://127.0.0.1:{ports[1]}', conflate=False)
+    latest = TelemetrySubscriber(f'tcp://127.0.0.1:{ports[1]}', conflate=True)
+    try:
+        # wait for the subscriptions to arrive
+        while lossless.receive(0.01) is None or latest.receive(0.01) is None:
+            publisher.publish(Module())
+        time.sleep(0.1)
+        lossless.receive_all()
+        latest.receive_all()
+        for _ in range(50):
+            publisher.publish(Module())
+        time.sleep(0.2)
+        frames = lossless.receive_all()
+        assert len(frames) == 50 and frames[-1].frame == publisher.frame and lossless.missed == 0
+        assert [f.frame for f in latest.receive_all()] == [publisher.frame]
+    finally:
+        lossless.close()
+        latest.close()
+        server.stop()
+
+
+def test_server_publish_errors():
+    import time
+    import zmq
+    from meyendtris.server import Server
+
+    ports = [_free_port() for _ in range(2)]
+    server = Server(host='127.0.0.1', port=ports[0], logger_port=ports[1], log=True)
+    server.start()
+    try:
+        server.publish(b'topic', b'sent')
+        # a failing send is counted instead of vanishing with its future
+        server._pub.close()
+        for _ in range(3):
+            server.publish(b'topic', b'lost')
+        deadline = time.perf_counter() + 2
+        while server.send_errors < 3 and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        assert server.send_errors >= 3 and server._send_failing
+    finally:
+        server.stop()
+
+
+def test_frame_scheduler():
+    from meyendtris.framework.scheduler import FrameScheduler
+    scheduler = FrameScheduler(rate=50, max_steps=3)
+    assert scheduler.begin_frame(now=10.0) == 1
+    # the deadlines stay on the grid although the frame took longer than usual
+    assert abs(scheduler.end_frame(now=10.015) - 10.02) < 1e-9
+    assert scheduler.begin_frame(now=10.021) == 1 and abs(scheduler.alpha - 0.05) < 1e-6
+    assert abs(scheduler.end_frame(now=10.03) - 10.04) < 1e-9
+    # a hiccup: the deadline skips ahead on the grid, and logic steps beyond max_steps are dropped
+    assert scheduler.begin_frame(now=10.19) == 3 and scheduler.dropped_steps == 5
+    assert abs(scheduler.end_frame(now=10.195) - 10.2) < 1e-9 and scheduler.overruns == 1
+    assert scheduler.remaining(now=10.199) > 0 and scheduler.remaining(now=10.3) == 0
+
+    stats = scheduler.stats
+    assert stats.count == 2 and stats.late == 1 and abs(stats.max_jitter - 0.149) < 1e-6
+    assert 'late' in str(stats)
+
+    # after a pause, the next frame starts over without a late interval or catch-up steps
+    scheduler.restart()
+    assert scheduler.begin_frame(now=25.0) == 1 and stats.count == 2
+    assert abs(scheduler.end_frame(now=25.001) - 25.02) < 1e-9
+
+
+def test_asset_cache(tmp_path):
+    import json
+    from meyendtris.framework.assets import AssetCache
+
+    class Loader:
+        # records the loader calls; assets are the file names
+        def __init__(self):
+            self.loaded, self.unloaded = [], []
+
+        def loadTexture(self, path):
+            self.loaded.append(path)
+            return path
+
+        def unloadTexture(self, asset):
+            self.unloaded.append(asset)
+
+        loadSfx, unloadSfx = loadTexture, unloadTexture
+
+    for name, size in [('a.png', 400), ('b.png', 400), ('c.wav', 300)]:
+        (tmp_path / name).write_bytes(b'x' * size)
+    loader = Loader()
+    cache = AssetCache(loader, budget=1000)
+    a, b, c = (str(tmp_path / name) for name in ('a.png', 'b.png', 'c.wav'))
+    assert cache.preload([('texture', a), ('texture', b)]) == 2
+    assert cache.texture(a) == a and cache.stats()['hits'] == 1
+    # over budget: the least recently used asset is evicted
+    cache.sound(c)
+    assert loader.unloaded == [b] and ('texture', a) in cache and ('texture', b) not in cache
+    assert cache.size == 700 and cache.stats()['evictions'] == 1
+
+    (tmp_path / 'manifest.json').write_text(json.dumps({'texture': [a], 'sound': [c]}))
+    assert cache.preload(str(tmp_path / 'manifest.json')) == 0
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (3, 3, 2)
+    cache.prune()
+    assert len(cache) == 0 and cache.size == 0 and sorted(loader.unloaded) == sorted([a, b, c])
+
+
+def test_stimulus_pool():
+    import meyendtris
+    from meyendtris.framework.basicstimuli import BasicStimuli
+    from meyendtris.framework.pool import ObjectRegistry
+
+    registry = ObjectRegistry()
+    objects = [object() for _ in range(3)]
+    for obj in objects + objects[:1]:
+        registry.append(obj)
+    registry.discard(objects[1])
+    assert len(registry) == 2 and objects[1] not in registry
+    assert registry.drain() == [objects[2], objects[0]] and len(registry) == 0
+
+    class Module(BasicStimuli):
+        def run(self):
+            pass
+
+    module = Module()
+    module.image_pool.reserve(2)
+    first = module.rectangle(rect=(-0.5, 0.5, -0.2, 0.2), duration=0, color=(1, 0, 0, 1))
+    assert not first.isHidden() and first.getColor() == (1, 0, 0, 1)
+    first.destroy()
+    assert first.isHidden() and not first.isEmpty()
+    # the released node is handed out again, with the new properties
+    second = module.picture('media/blank.tga', duration=0, pos=(0.3, 0.1))
+    assert second is first and not second.hasColor() and second.getPos() == (0.3, 0, 0.1)
+    text = module.write('hello', duration=0, fg=(0, 1, 0, 1))
+    assert text.textNode.getText() == 'hello'
+    # a delayed destruction does not hide the stimulus a reused node shows by then
+    first_text = module.write('first', duration=0.05, block=False)
+    first_text.destroy()
+    second_text = module.write('second', duration=0, block=False)
+    assert second_text is first_text
+    module._base.taskMgr.doMethodLater(0.1, lambda task: task.done, 'wait')
+    while module._base.taskMgr.hasTaskNamed('wait'):
+        module._base.taskMgr.step()
+    assert not second_text.isHidden() and len(module._destroy_tasks) == 0
+    second_text.destroy()
+    module.write('pending', duration=10, block=False)
+    text = module.write('hello', duration=0, fg=(0, 1, 0, 1))
+    module.cancel()
+    assert len(module._to_destroy) == 0 and second.isHidden() and text.isHidden()
+    assert len(module._destroy_tasks) == 0 and not module._base.taskMgr.hasTaskNamed('ConvenienceFunctions, remove_text')
+    assert module.image_pool.stats() == dict(created=2, reused=2, idle=2, used=0)
+    module.prune()
+    assert first.isEmpty() and len(module.image_pool) == 0 and len(module.text_pool) == 0
+
+
+def test_sound_instances():
+    from meyendtris.framework.basicstimuli import BasicStimuli
+
+    class Module(BasicStimuli):
+        def run(self):
+            pass
+
+    module = Module()
+    module.asset_manifest = [('sound', 'media/ding.wav')]
+    module.start()
+    # repeated sounds of one file play independently, and do not restart the preloaded one
+    first = module.sound('media/ding.wav', volume=0.5)
+    second = module.sound('media/ding.wav')
+    assert first is not second and first is not module.assets.sound('media/ding.wav')
+    module.cancel()
+    module.prune()
+
+
+def test_visual_noise():
+    import meyendtris
+    from panda3d.core import GeomVertexReader
+    from meyendtris.framework.visualnoise import VisualNoise
+
+    def vertices(noise):
+        reader = GeomVertexReader(noise.node.node().getGeom(0).getVertexData(), 'vertex')
+        return [tuple(reader.getData3()) for _ in range(4 * noise.count)]
+
+    first, second = VisualNoise(count=5, seed=7), VisualNoise(count=5, seed=7)
+    assert first.node.node().getGeom(0).getPrimitive(0).getNumPrimitives() == 10
+    # seeded noise is reproducible
+    assert vertices(first) == vertices(second)
+    first.update()
+    assert vertices(first) != vertices(second)
+    second.update()
+    assert vertices(first) == vertices(second)
+    second.destroy()
+
+    # updated once per rendered frame
+    first.start()
+    for _ in range(3):
+        meyendtris.__BASE__.taskMgr.step()
+    assert first.updates == 2 + 3
+    first.destroy()
+    assert first.node.isEmpty()
+    meyendtris.__BASE__.taskMgr.step()
+    assert first.updates == 5
+
+
+def test_schedule(tmp_path):
+    from meyendtris.framework.schedule import ScheduleBuilder, Timeline, TimelinePlayer, load_or_compile
+    from meyendtris.modules.concentration.calibration import Main as Concentration
+    from meyendtris.modules.error.calibration import Main as Error
+
+    builder = ScheduleBuilder(3)
+    builder.add('write', text='go', duration='space')
+    builder.clock(markers=['begin'])
+    builder.add('rectangle', key='rect', rect=tuple(builder.rng.random(4)), duration=0)
+    builder.add('sleep', markers=['shown {elapsed:.0f}'], duration=1.5)
+    builder.add('write', text='x', duration=[1, 'space'])
+    builder.add('waitfor', eventid='enter')
+    builder.destroy('rect', markers=['response {result}'])
+    timeline = builder.build()
+    assert [step.onset for step in timeline] == [0, 0, 0, 0, 1.5, 0, 0]
+
+    class Module:
+        def __init__(self):
+            self.log = []
+
+        def marker(self, code):
+            self.log.append(code)
+
+        def __getattr__(self, name):
+            return lambda **args: self.log.append((name, args)) or (Rect(self.log) if name == 'rectangle' else 0.25)
+
+    class Rect:
+        def __init__(self, log):
+            self.log = log
+
+        def destroy(self):
+            self.log.append('destroyed')
+
+    module = Module()
+    TimelinePlayer(module, flip_markers=False).play(timeline)
+    assert module.log[0].startswith('Experiment Control/Schedule/%s' % timeline.digest())
+    assert module.log[1:] == [('write', dict(text='go', duration='space')), 'begin',
+                              ('rectangle', dict(rect=timeline.steps[2].args['rect'], duration=0)), 'shown 0',
+                              ('sleep', dict(duration=1.5)), ('write', dict(text='x', duration=[1, 'space'])),
+                              ('waitfor', dict(eventid='enter')), 'response 0.25', 'destroyed']
+
+    # compiled calibration sessions are reproducible and survive saving
+    for module in (Concentration(), Error()):
+        first, second = module.schedule(42), module.schedule(42)
+        assert first.digest() == second.digest() != module.schedule(43).digest()
+        filename = str(tmp_path / ('%s.json.gz' % module.__class__.__module__))
+        assert load_or_compile(module.schedule, 42, filename).digest() == first.digest()
+        loaded = load_or_compile(None, None, filename)
+        assert isinstance(loaded, Timeline) and loaded.digest() == first.digest() and loaded.seed == 42
+
+
+def test_flip_onsets(monkeypatch):
+    import meyendtris
+    from meyendtris.framework.basicstimuli import BasicStimuli
+    from meyendtris.framework.eventmarkers import eventmarkers
+    sent = []
+    monkeypatch.setattr(eventmarkers, 'send_marker', lambda code, timestamp=None: sent.append((code, timestamp)))
+    monkeypatch.setattr(eventmarkers, 'local_clock', lambda: 12.5)
+
+    class Module(BasicStimuli):
+        def run(self):
+            pass
+
+    module = Module()
+    module.implicit_markers = True
+    rect = module.rectangle(rect=(-0.1, 0.1, -0.1, 0.1), duration=0)
+    cross = module.crosshair(duration=0, block=False)
+    assert module.last_onset is cross.onset and not rect.onset.resolved and sent == []
+    meyendtris.__BASE__.taskMgr.step()
+    # both stimuli appeared with the flip of the frame they were created in
+    assert rect.onset.time == cross.onset.time == 12.5 and rect.onset.flip_frame == rect.onset.frame
+    assert sent == [(250, 12.5), (252, 12.5)]
+    stamped = []
+    module.onset('custom').add_callback(stamped.append)
+    meyendtris.__BASE__.taskMgr.step()
+    assert stamped[0].time == 12.5 and sent[-1] == ('custom', 12.5)
+    module.cancel()
+    module.prune()
+
+
+def test_profiling(monkeypatch):
+    import meyendtris.framework.latentmodule as latentmodule
+    from meyendtris.framework.profiling import Histogram, Profiler, profiler, unpack, format_report, TOPIC
+
+    histogram = Histogram(bits=5)
+    for us in range(1, 1001):
+        histogram.record(us * 1e-6)
+    histogram.record(120.0)                 # beyond highest: counted in the last bucket
+    assert histogram.count == 1001 and histogram.max == 120.0
+    # percentiles are accurate to the bucket width (2**-(bits-1))
+    for p in (50, 90, 99):
+        assert abs(histogram.percentile(p) - p * 1e-5) <= p * 1e-5 / 16 + 1e-6
+    assert histogram.percentile(100) == 120.0
+    copy = Histogram.from_dict(histogram.to_dict())
+    copy.merge(histogram)
+    assert copy.count == 2002 and copy.percentile(50) == histogram.percentile(50)
+
+    now = [0.0]
+    monkeypatch.setattr(latentmodule, 'clock', lambda: now[0])
+
+    class Module(latentmodule.LatentModule):
+        def run(self):
+            while True:
+                yield from self.sleep(3.0 / 60, cur_tick=lambda delta: now.__setitem__(0, now[0] + 0.002))
+
+    module = Module()
+    monkeypatch.setattr(profiler, 'histograms', {})
+    monkeypatch.setattr(profiler, 'enabled', True)
+    module.start()
+    for frame in range(1, 10):
+        now[0] = frame / 60.0
+        module.tick()
+    module.cancel()
+    assert profiler.histograms['run_step'].count + profiler.histograms['tick_callback'].count == 9
+    assert profiler.histograms['messages'].count == 9
+    assert abs(profiler.histograms['tick_callback'].mean - 0.002) < 1e-4
+    assert 'tick_callback' in format_report(profiler.histograms)
+
+    published = []
+    class Server:
+        def publish(self, message):
+            published.append(message)
+    profiler.publish(Server())
+    assert published[0].startswith(TOPIC) and unpack(published[0])['messages'].count == 9
+    assert Profiler().record('x', 1.0) is None   # disabled by default
+
+
+def test_lazy_base():
+    import subprocess
+    import sys
+    # importing the package and the tools does not create the ShowBase or load zmq
+    code = ("import sys, meyendtris, meyendtris.launcher, meyendtris.telemetry, meyendtris.framework.profiling; "
+            "print(sorted(m for m in ('direct.showbase.ShowBase', 'zmq', 'pylsl') if m in sys.modules))")
+    assert subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                          check=True).stdout.splitlines()[-1] == '[]'
+
+    import meyendtris
+    assert meyendtris.__BASE__ is meyendtris.create_base() is meyendtris.__BASE__
@@ -0,0 +1,231 @@
+import random
+import numpy as np
+from meyendtris.modules.tetris.field import BitboardField, rotate_shape
+from meyendtris.modules.tetris.renderer import FieldRenderer
+from meyendtris.modules.tetris.boardmesh import BoardMesh
+from meyendtris.modules.tetris.simulation import BatchSimulation, MeyendtrisSimulation
+
+TETROMINOES = [
+    [[0,1,0],[1,1,1]],
+    [[2,0],[2,0],[2,2]],
+    [[0,3],[0,3],[3,3]],
+    [[4,4],[4,4]],
+    [[5,5,0],[0,5,5]],
+    [[0,6,6],[6,6,0]],
+    [[7],[7],[7],[7]]]
+
+
+def _reference_collision(field, shape, top, left):
+    for row in range(len(shape)):
+        for col in range(len(shape[0])):
+            if shape[row][col]:
+                if top+row < 0 or top+row >= len(field) or left+col < 0 or left+col >= len(field[0]):
+                    return True
+                if field[top+row][left+col]:
+                    return True
+    return False
+
+
+def test_tetromino_rotations():
+    field = BitboardField(17, 10, TETROMINOES)
+    assert [t.rotations for t in field.tetrominoes] == [4, 4, 4, 1, 2, 2, 2]
+    assert field.tetrominoes[6].masks[0] == (1, 1, 1, 1)
+    assert field.tetrominoes[6].masks[1] == (0b1111,)
+    assert field.tetrominoes[0].shapes[1] == rotate_shape(TETROMINOES[0])
+
+
+def test_bitboard_matches_reference():
+    rng = random.Random(0)
+    field = BitboardField(12, 7, TETROMINOES)
+    reference = [[0] * 7 for _ in range(12)]
+    for _ in range(300):
+        piece = rng.choice(field.tetrominoes)
+        rotation = rng.randrange(piece.rotations)
+        shape = piece.shapes[rotation]
+        left = rng.randrange(-1, 8)
+        if _reference_collision(reference, shape, 0, left):
+            assert field.collision(piece, rotation, 0, left)
+            if left < 0 or left + len(shape[0]) > 7:
+                continue
+            field.reset()
+            reference = [[0] * 7 for _ in range(12)]
+            continue
+        assert not field.collision(piece, rotation, 0, left)
+        top = field.drop_row(piece, rotation, 0, left)
+        assert not _reference_collision(reference, shape, top, left)
+        assert _reference_collision(reference, shape, top + 1, left)
+
+        # landing and clearing lines the way the original game did
+        for row in range(len(shape)):
+            for col in range(len(shape[0])):
+                if shape[row][col]:
+                    reference[top+row][left+col] = shape[row][col]
+        for row in range(len(reference)):
+            if all(reference[row]):
+                for r in range(row, 0, -1):
+                    reference[r] = reference[r-1][:]
+                reference[0] = [0] * 7
+        field.land(piece, rotation, top, left)
+
+        assert [field[row] for row in range(12)] == reference
+
+
+def test_highlight_empty():
+    field = BitboardField(4, 4, TETROMINOES)
+    field.land(field.tetrominoes[3], 0, 2, 0)
+    field.highlight_empty(8)
+    assert field[0] == [8, 8, 8, 8]
+    assert field[3] == [4, 4, 8, 8]
+    assert field.collision(field.tetrominoes[3], 0, 0, 2)
+    field.unhighlight()
+    assert field[3] == [4, 4, 0, 0]
+    assert not field.collision(field.tetrominoes[3], 0, 2, 2)
+
+
+class _RecordingSurface:
+    def __init__(self, rows, cols):
+        self.cells = [[None] * cols for _ in range(rows)]
+        self.overlay = [[None] * cols for _ in range(rows)]
+        self.calls = 0
+
+    def set_cell(self, row, col, colour):
+        self.cells[row][col] = colour
+        self.calls += 1
+
+    def set_overlay(self, row, col, colour):
+        self.overlay[row][col] = colour
+
+    def flush(self):
+        pass
+
+
+def test_renderer_draws_only_changes():
+    field = BitboardField(17, 10, TETROMINOES)
+    colours = [(i, 0, 0, 1) for i in range(1, 9)]
+    surface = _RecordingSurface(17, 10)
+    renderer = FieldRenderer(field, surface, colours)
+    piece = field.tetrominoes[3]
+
+    renderer.update(piece, 0, [0, 4], -1)
+    assert surface.calls == 170
+    assert surface.cells[0][4] == colours[3] and surface.cells[0][3] == renderer.emptyColour
+
+    # moving down one row only redraws the cells the tetromino left and entered
+    surface.calls = 0
+    renderer.update(piece, 0, [1, 4], -1)
+    assert surface.calls == 4
+    assert surface.cells[0][4] == renderer.emptyColour and surface.cells[2][5] == colours[3]
+
+    # selecting columns only moves the overlay highlight
+    renderer.update(piece, 0, [1, 4], 2)
+    renderer.update(piece, 0, [1, 4], 5)
+    assert all(surface.overlay[row][5] == renderer.selectedColour for row in range(17))
+    assert all(surface.overlay[row][2] == renderer.overlayColour for row in range(17))
+
+    # landing with a cleared line matches a full redraw
+    field.land(field.tetrominoes[6], 0, 11, 9)
+    for left in range(0, 10, 2):
+        field.land(piece, 0, 15, left)
+    assert field.rows[15:] == [0b1000000000] * 2
+    renderer.update(field.tetrominoes[0], 0, [0, 3], 5)
+    expected = [[renderer.emptyColour if field.cell(r, c) == 0 else colours[field.cell(r, c)-1]
+                 for c in range(10)] for r in range(17)]
+    for row, col in ((0, 4), (1, 3), (1, 4), (1, 5)):
+        expected[row][col] = colours[0]
+    assert surface.cells == expected
+
+
+def test_board_mesh_colours():
+    from panda3d.core import GeomVertexReader, NodePath
+    board = BoardMesh(3, 4, 0.5, NodePath('test'))
+    board.set_cell(1, 2, (1, 0, 0, 1))
+    board.set_overlay(2, 3, (0, 0, 1, .5))
+    board.flush()
+    vdata = board.nodepath.node().getGeom(0).getVertexData()
+    reader = GeomVertexReader(vdata, 'color')
+    colours = []
+    while not reader.isAtEnd():
+        colours.append(tuple(round(c, 2) for c in reader.getData4()))
+    assert len(colours) == 8 * 12
+    assert colours[4 * 6:4 * 7] == [(1, 0, 0, 1)] * 4
+    assert colours[4 * 12 + 4 * 11:] == [(0, 0, 1, .5)] * 4
+    assert colours[0] == (.1, .1, .1, 1) and colours[4 * 12] == (1, 1, 1, .1)
+    board.destroy()
+
+
+def test_batch_simulation_matches_rules():
+    # with a single tetromino type, both simulations are deterministic and must agree
+    parameters = dict(tetrominoes=[[[7], [7], [7], [7]]], undoProbability=0.0, rows=12, cols=8)
+    rng = random.Random(1)
+    gazeX, gazeY, bci = [], [], []
+    x, y = 960.0, 600.0
+    for frame in range(6000):
+        if rng.random() < 0.02:
+            x = rng.uniform(0, 1920)
+        if rng.random() < 0.01:
+            y = rng.choice([100.0, 600.0])
+        gazeX.append(x if rng.random() > 0.1 else float('nan'))
+        gazeY.append(y)
+        bci.append(1 + (frame // 600) % 2)
+
+    single = MeyendtrisSimulation(seed=0, **parameters)
+    expected = single.run(gazeX, gazeY, bci)
+    assert expected['tetrominoesLanded'] > 10
+
+    batch = BatchSimulation(3, seed=0, **parameters)
+    result = batch.run(gazeX, gazeY, bci)
+    for name in ('tetrominoesLanded', 'linesCleared', 'gamesOver'):
+        assert list(result[name]) == [expected[name]] * 3
+    assert list(batch.boards[0]) == single.field.rows
+
+
+def test_batch_simulation_per_game_parameters():
+    batch = BatchSimulation(2, seed=0, moveTimeRange=[[.1, .1], [1.0, 1.0]], dropDwellTimeRange=[10000, 10000])
+    batch.run(np.full(1200, np.nan), np.full(1200, np.nan), np.full(1200, 1.5))
+    landed = batch.statistics()['tetrominoesLanded']
+    assert landed[0] > landed[1] > 0
+
+
+def test_gaze_fixation_dwell():
+    game = MeyendtrisSimulation(seed=0, mapDwellTimes=False, columnDwellTime=90, dropDwellTime=400)
+    centre = sum(game.columnBoundaries[2]) / 2.0
+    other = sum(game.columnBoundaries[5]) / 2.0
+    # 600 Hz samples on column 2, with invalid samples and a short noise spike
+    t = np.arange(60) / 600.0
+    x = np.full(60, centre)
+    x[10], x[20:23] = np.nan, other
+    game.receiveGaze(x, np.full(60, 800.0), t)
+    assert game._gazeX == centre and len(game.gazeSamplesX) == 59
+    assert game._currentSampleCol == 2
+    assert abs(game.columnDwell - 59 / 0.6) < 1e-9
+    game.gameStep(1.0 / game.fps)
+    assert game._currentSelectedCol == 2
+    # no new samples: the last position is held until the drop
+    game.receiveGaze([], [], [], now=0.51)
+    assert abs(game.columnDwell - 510) < 1e-9
+    landed = game.tetrominoesLanded
+    game.gameStep(1.0 / game.fps)
+    assert game.tetrominoesLanded == landed + 1 and game.columnDwell == 0
+    # fixating another column restarts the dwell
+    game.receiveGaze(np.full(60, other), np.full(60, 800.0), 0.6 + t)
+    # (the new fixation starts once the gaze has been away for fixationTolerance ms)
+    assert game._currentSampleCol == 5 and abs(game.columnDwell - (59 - 18) / 0.6) < 1e-9
+
+
+def test_column_lookup():
+    game = MeyendtrisSimulation(seed=0)
+    lookup = game.columnLookup
+    for col, (left, right) in enumerate(game.columnBoundaries):
+        assert lookup.column(left + game._colOffset) == col
+        assert lookup.column(right - game._colOffset - 0.5) == col
+        assert lookup.column(right - game._colOffset) == -1
+        assert lookup.column(left + game._colOffset - 0.5) == -1
+    assert lookup.column(-1) == lookup.column(1920) == lookup.column(float('nan')) == -1
+    x = np.array([sum(b) / 2.0 for b in game.columnBoundaries] + [0.0, np.nan, 5000.0])
+    assert list(lookup.columns(x)) == list(range(game.cols)) + [-1, -1, -1]
+    # the table is only rebuilt when the screen or the field layout change
+    game.reset()
+    assert game.columnLookup is lookup
+    game.cols = 8
+    game.reset()
+    assert game.columnLookup is not lookup and game.columnLookup.column(x[0]) == -1